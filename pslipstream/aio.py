@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Asyncio API for embedding Slipstream in other applications. The blocking
+disc I/O runs in an executor, and progress and log events are delivered as
+async iterators, so a single event loop can drive many discs at once
+without any of the GUI's callback objects.
+
+    async with AsyncDvd() as dvd:
+        await dvd.open("/dev/sr0")
+        async with dvd.progress() as progress:
+            backup = asyncio.ensure_future(dvd.create_backup())
+            async for percent in progress:
+                ...  # ends once the backup is done
+            await backup  # raises if it failed
+"""
+
+import asyncio
+import builtins as g
+import functools
+import os
+
+from appdirs import user_data_dir
+
+import pslipstream.cfg as cfg
+from pslipstream.catalogue import Catalogue
+from pslipstream.dvd import Dvd
+from pslipstream.events import EventChannel
+from pslipstream.log import Log
+from pslipstream.metrics import Metrics
+from pslipstream.profiler import Profiler
+from pslipstream.progress import Progress
+from pslipstream.sinks import Tee
+from pslipstream.throttle import IoLimits
+
+
+def init_globals():
+    """
+    Set up any of the app-wide globals Slipstream relies on that aren't set yet, with defaults.
+    Set your own (e.g. a quieter g.LOG) before calling this or creating an AsyncDvd to override them.
+    """
+    if not cfg.user_dir:
+        cfg.user_dir = user_data_dir(cfg.title_pkg, cfg.author)
+    defaults = {
+        "DBG": lambda: False,
+        "PROFILER": Profiler,
+        "LOG": Log,
+        "PROGRESS": Progress,
+        "METRICS": Metrics,
+        "EVENTS": EventChannel,
+        "LIMITS": IoLimits,
+        "CATALOGUE": lambda: Catalogue(os.path.join(cfg.user_dir, "catalogue.db")),
+    }
+    for name, factory in defaults.items():
+        if not hasattr(g, name):
+            setattr(g, name, factory())
+
+
+class EventStream:
+    """
+    Async iterator over events pushed from any thread.
+
+    Events are handed over to the event loop thread-safely. If the consumer falls
+    more than `maxsize` events behind, the oldest ones are dropped, a job must never
+    wait on its listeners. Use it as an async context manager so it stops listening
+    once done, or call close() to end the iteration.
+    """
+
+    CLOSED = object()
+
+    def __init__(self, subscribe, unsubscribe, maxsize=1000):
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.unsubscribe = functools.partial(unsubscribe, self.push)
+        subscribe(self.push)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.queue.get()
+        if event is self.CLOSED:
+            raise StopAsyncIteration
+        return event
+
+    def push(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # the event loop is closed
+
+    def close(self):
+        try:
+            self.unsubscribe()
+        except ValueError:
+            pass  # already closed
+        self.loop.call_soon_threadsafe(self._put, self.CLOSED)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()  # drop the oldest
+        self.queue.put_nowait(event)
+
+
+def log_events(maxsize=1000):
+    """Get an async iterator over every log entry written from now on."""
+    init_globals()
+    return EventStream(g.LOG.add_listener, g.LOG.remove_listener, maxsize)
+
+
+class AsyncDvd:
+    """
+    Awaitable wrapper of a Dvd.
+
+    Every call runs in `executor` (the event loop's default one if None), one at a
+    time per disc, as a Dvd can only do one thing at a time. Different AsyncDvd
+    instances run side by side.
+    """
+
+    def __init__(self, executor=None):
+        init_globals()
+        self.dvd = Dvd()
+        self.executor = executor
+        self.lock = asyncio.Lock()
+        self.streams = []  # progress streams to end once the job running or next is done
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    @property
+    def dev(self):
+        return self.dvd.dev
+
+    async def run(self, f, *args, **kwargs):
+        """Run any blocking function with the Dvd as the first argument, in the executor."""
+        async with self.lock:
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, functools.partial(f, self.dvd, *args, **kwargs)
+            )
+
+    async def run_job(self, f, *args, **kwargs):
+        """Run a job like run(), ending the progress() iterators of it once it's done, failed or not."""
+        try:
+            return await self.run(f, *args, **kwargs)
+        finally:
+            streams, self.streams = self.streams, []
+            for stream in streams:
+                stream.close()
+
+    async def open(self, dev):
+        await self.run(Dvd.open.__wrapped__, dev)
+
+    async def close(self):
+        if self.dvd.ready:
+            await self.run(Dvd.dispose)
+
+    async def get_primary_descriptor(self):
+        return await self.run(Dvd.get_primary_descriptor.__wrapped__)
+
+    async def compute_crc_id(self):
+        return await self.run(Dvd.compute_crc_id.__wrapped__)
+
+    async def get_files(self, path="/"):
+        return await self.run(lambda dvd: list(dvd.get_files(path)))
+
+    async def get_previous_backups(self):
+        return await self.run(Dvd.get_previous_backups)
+
+    async def read(self, first_lba, sectors):
+        """Read sectors of the disc as bytes, through the sector cache."""
+        return await self.run(Dvd.read_sectors, first_lba, sectors)
+
+    async def create_backup(self, outputs=None, policy=Tee.BLOCK, queue_size=16, skip_known=False):
+        """See Dvd.create_backup()."""
+        await self.run_job(
+            Dvd.create_backup.__wrapped__, outputs=outputs, policy=policy, queue_size=queue_size, skip_known=skip_known
+        )
+
+    async def extract_file(self, path, outputs=None, policy=Tee.BLOCK, queue_size=16):
+        """See Dvd.extract_file()."""
+        await self.run_job(
+            Dvd.extract_file.__wrapped__, path=path, outputs=outputs, policy=policy, queue_size=queue_size
+        )
+
+    async def extract(self, selections, outputs=None, concat=False, policy=Tee.BLOCK, queue_size=16):
+        """See Dvd.extract()."""
+        await self.run_job(
+            Dvd.extract.__wrapped__,
+            selections=selections, outputs=outputs, concat=concat, policy=policy, queue_size=queue_size
+        )
+
+    async def demux(self, selection, tracks=None, outputs=None):
+        """See Dvd.demux()."""
+        await self.run_job(Dvd.demux.__wrapped__, selection=selection, tracks=tracks, outputs=outputs)
+
+    def progress(self, maxsize=1000):
+        """
+        Get an async iterator over the progress percentage of this disc's job, which ends once
+        the job running or started next is done. The disc must be opened first, progress of
+        other discs is skipped.
+        """
+        dvd = self.dvd
+        stream = None
+
+        def listener(progress, device):
+            if device == dvd.dev:
+                stream.push(progress)
+
+        stream = EventStream(
+            lambda _: g.PROGRESS.add_listener(listener), lambda _: g.PROGRESS.remove_listener(listener), maxsize
+        )
+        self.streams.append(stream)
+        return stream
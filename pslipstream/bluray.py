@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Blu-ray backend for (decrypted) BD image files. The BDMV structure, index,
+movie objects, playlists (MPLS), and clip information (CLPI), is parsed into
+a model, and a playlist can be streamed out as the exact source packets of
+its clips, in playback order.
+"""
+
+import builtins as g
+import struct
+
+from pslipstream.helpers import asynchronous_auto
+from pslipstream.exceptions import SlipstreamReadError, SlipstreamSinkError
+from pslipstream.sinks import FileSink, Tee
+from pslipstream.udf import SECTOR_SIZE, Udf, UdfError
+
+SOURCE_PACKET_SIZE = 192
+ALIGNED_UNIT_SIZE = 32 * SOURCE_PACKET_SIZE  # 6144 bytes, the smallest unit of an m2ts file
+
+
+def u16(data, offset):
+    return struct.unpack_from(">H", data, offset)[0]
+
+
+def u32(data, offset):
+    return struct.unpack_from(">I", data, offset)[0]
+
+
+def check_header(data, magic, name):
+    if data[:4] != magic:
+        raise SlipstreamReadError(f"{name} is not a valid {magic.decode()} file.")
+
+
+class IndexTitle:
+    """A title of index.bdmv, played by an HDMV movie object or a BD-J object."""
+
+    def __init__(self, number, object_type, object_id):
+        self.number = number
+        self.object_type = object_type  # "hdmv" or "bdj"
+        self.object_id = object_id  # movie object number, or BD-J object name
+
+
+class Index:
+    """index.bdmv, the titles of the disc and what plays them."""
+
+    def __init__(self, first_playback, top_menu, titles):
+        self.first_playback = first_playback
+        self.top_menu = top_menu
+        self.titles = titles
+
+    @classmethod
+    def parse(cls, data):
+        check_header(data, b"INDX", "index.bdmv")
+        offset = u32(data, 8) + 4  # skip the length of the indexes
+
+        def parse_object(number, entry):
+            object_type = "hdmv" if entry[0] >> 6 == 1 else "bdj"
+            if object_type == "hdmv":
+                return IndexTitle(number, object_type, u16(entry, 6))
+            return IndexTitle(number, object_type, bytes(entry[6:11]).decode("ascii", "replace"))
+
+        first_playback = parse_object("first_playback", data[offset:offset + 12])
+        top_menu = parse_object("top_menu", data[offset + 12:offset + 24])
+        count = u16(data, offset + 24)
+        titles = [
+            parse_object(i + 1, data[offset + 26 + i * 12:offset + 38 + i * 12])
+            for i in range(count)
+        ]
+        return cls(first_playback, top_menu, titles)
+
+
+class MovieObject:
+    """An HDMV movie object of MovieObject.bdmv, a list of 12 byte navigation commands."""
+
+    def __init__(self, number, commands):
+        self.number = number
+        self.commands = commands
+
+    def get_playlists(self):
+        """Get the playlists played by the PlayPL commands of this object, in order."""
+        playlists = []
+        for command in self.commands:
+            group, sub_group = (command[0] >> 3) & 0x3, command[0] & 0x7
+            branch_option = command[1] & 0xF
+            immediate = command[1] & 0x80
+            # group 0 is branching, sub group 2 playing, options 0-2 PlayPL, PlayPLatPI, and PlayPLatMK
+            if group == 0 and sub_group == 2 and branch_option <= 2 and immediate:
+                playlists.append(u32(command, 4))
+        return playlists
+
+    @classmethod
+    def parse_all(cls, data):
+        check_header(data, b"MOBJ", "MovieObject.bdmv")
+        count = u16(data, 48)
+        objects = []
+        offset = 50
+        for number in range(count):
+            commands_count = u16(data, offset + 2)
+            offset += 4
+            commands = [bytes(data[offset + i * 12:offset + (i + 1) * 12]) for i in range(commands_count)]
+            objects.append(cls(number, commands))
+            offset += commands_count * 12
+        return objects
+
+
+class PlayItem:
+    """A part of a clip played by a playlist, from in_time to out_time (in 45 kHz ticks)."""
+
+    def __init__(self, clip_id, in_time, out_time, angles, connection):
+        self.clip_id = clip_id
+        self.in_time = in_time
+        self.out_time = out_time
+        self.angles = angles  # clip ids of the other angles
+        self.connection = connection  # 1, 5, or 6, the latter two being seamless
+
+    @property
+    def duration(self):
+        return (self.out_time - self.in_time) / 45000
+
+
+class Playlist:
+    """An MPLS playlist, the play items and the chapter marks of a title."""
+
+    def __init__(self, number, items, chapters):
+        self.number = number
+        self.items = items
+        self.chapters = chapters  # (play item index, time) of every chapter mark
+
+    @property
+    def duration(self):
+        return sum(item.duration for item in self.items)
+
+    @classmethod
+    def parse(cls, number, data):
+        check_header(data, b"MPLS", f"Playlist {number:05}")
+        playlist, marks = u32(data, 8), u32(data, 12)
+        items = []
+        offset = playlist + 10
+        for _ in range(u16(data, playlist + 6)):
+            length = u16(data, offset)
+            angles = []
+            if data[offset + 12] & 0x10:
+                angles = [
+                    bytes(data[offset + 36 + i * 10:offset + 41 + i * 10]).decode()
+                    for i in range(data[offset + 34] - 1)
+                ]
+            items.append(PlayItem(
+                clip_id=bytes(data[offset + 2:offset + 7]).decode(),
+                in_time=u32(data, offset + 14),
+                out_time=u32(data, offset + 18),
+                angles=angles,
+                connection=data[offset + 12] & 0x0F
+            ))
+            offset += 2 + length
+        chapters = []
+        for i in range(u16(data, marks + 4)):
+            mark = marks + 6 + i * 14
+            if data[mark + 1] == 1:  # entry mark, a chapter
+                chapters.append((u16(data, mark + 2), u32(data, mark + 4)))
+        return cls(number, items, chapters)
+
+
+class Clip:
+    """CLPI clip information, the size of a clip and its entry point map."""
+
+    def __init__(self, clip_id, source_packets, entry_points):
+        self.clip_id = clip_id
+        self.source_packets = source_packets
+        self.entry_points = entry_points  # sorted (90 kHz pts, source packet number)
+
+    def get_byte_range(self, in_time, out_time):
+        """
+        Get the (start, end) byte range of the m2ts file that plays from in_time to
+        out_time (in 45 kHz ticks), rounded out to whole aligned units. Without an
+        entry point map, it's the whole clip.
+        """
+        size = self.source_packets * SOURCE_PACKET_SIZE
+        if not self.entry_points:
+            return 0, size
+        in_pts, out_pts = in_time * 2, out_time * 2
+        start = 0
+        end = self.source_packets
+        for pts, spn in self.entry_points:
+            if pts <= in_pts:
+                start = spn
+            elif pts >= out_pts:
+                end = spn
+                break
+        start = start * SOURCE_PACKET_SIZE // ALIGNED_UNIT_SIZE * ALIGNED_UNIT_SIZE
+        end = -(-end * SOURCE_PACKET_SIZE // ALIGNED_UNIT_SIZE) * ALIGNED_UNIT_SIZE
+        return start, min(end, size)
+
+    @classmethod
+    def parse(cls, clip_id, data):
+        check_header(data, b"HDMV", f"Clip {clip_id}")
+        source_packets = u32(data, 56)
+        cpi = u32(data, 16)
+        entry_points = []
+        if cpi and u32(data, cpi):
+            ep_map = cpi + 6
+            if data[ep_map + 1]:
+                # only the first stream's map is needed, that of the video
+                fields = int.from_bytes(data[ep_map + 4:ep_map + 10], "big")
+                coarse_count, fine_count = (fields >> 18) & 0xFFFF, fields & 0x3FFFF
+                stream = ep_map + u32(data, ep_map + 10)
+                fine = stream + u32(data, stream)
+                coarse = [struct.unpack_from(">II", data, stream + 4 + i * 8) for i in range(coarse_count)]
+                for i, (ref_pts, coarse_spn) in enumerate(coarse):
+                    fine_id, coarse_pts = ref_pts >> 14, ref_pts & 0x3FFF
+                    next_fine_id = coarse[i + 1][0] >> 14 if i + 1 < coarse_count else fine_count
+                    for j in range(fine_id, next_fine_id):
+                        entry = u32(data, fine + j * 4)
+                        pts = ((coarse_pts & ~0x01) << 19) + (((entry >> 17) & 0x7FF) << 9)
+                        spn = (coarse_spn & ~0x1FFFF) + (entry & 0x1FFFF)
+                        entry_points.append((pts, spn))
+        return cls(clip_id, source_packets, sorted(entry_points))
+
+
+class Bluray:
+    """
+    A Blu-ray image file, read through its UDF file system.
+
+    The parsed index, movie objects, playlists, and clips are cached for as long
+    as the image is open.
+    """
+
+    # sectors read at once, a whole number of aligned units
+    CHUNK_SECTORS = 3 * 1024
+
+    def __init__(self):
+        self.dev = None
+        self.file = None
+        self.udf = None
+        self.playlists = {}
+        self.clips = {}
+        self.index = None
+        self.movie_objects = None
+        self.metrics = None
+        self.job = None
+        self.job_started = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.dispose()
+
+    def open(self, dev):
+        """
+        Open a Blu-ray image file.
+        Raises SlipstreamReadError if it has no UDF file system with a BDMV directory.
+        """
+        self.dispose()
+        self.dev = dev
+        self.metrics = g.METRICS.device(dev)
+        self.file = open(dev, "rb", buffering=0)
+        try:
+            self.udf = Udf(self.read_sectors)
+            bdmv = self.udf.get("/BDMV")
+            if not bdmv or not bdmv.is_dir:
+                raise SlipstreamReadError(f"{dev} has no BDMV directory, it's not a Blu-ray image.")
+        except UdfError as e:
+            self.dispose()
+            raise SlipstreamReadError(f"{dev} is not a Blu-ray image: {e}") from e
+        except BaseException:
+            self.dispose()
+            raise
+        g.LOG.write(f"Opened {dev} as a Blu-ray image labeled \"{self.udf.volume_id}\"...")
+
+    def dispose(self):
+        if self.file:
+            self.file.close()
+        self.__init__()
+
+    def get_volume_label(self):
+        return self.udf.volume_id
+
+    def set_job(self, job):
+        """
+        Record the job the image is used for, None when done, for the UI and in its metrics.
+        While profiling, the trace of the job is saved once it's done, see Profiler.
+        """
+        g.EVENTS.job(self.dev, job)
+        if job:
+            self.job = job
+            self.job_started = g.PROFILER.start()
+            self.metrics.active_jobs += 1
+            self.metrics.progress = 0.0
+        elif self.job:
+            job, self.job = self.job, None
+            self.metrics.active_jobs -= 1
+            self.metrics.tees = []
+            if g.PROFILER.enabled:
+                path = g.PROFILER.finish(f"{job}-{self.get_volume_label()}", self.job_started)
+                g.LOG.write(f"Saved profile to {path}")
+
+    def set_progress(self, progress):
+        """Set the progress of the running job in percent, for the UI and the metrics."""
+        self.metrics.progress = progress
+        g.PROGRESS.set(progress, self.dev)
+
+    def read_sectors(self, lba, sectors):
+        self.file.seek(lba * SECTOR_SIZE)
+        return self.file.read(sectors * SECTOR_SIZE)
+
+    def readinto(self, lba, buffer):
+        """Read sectors into a caller-owned writable buffer, as many as fit. Returns the amount of bytes read."""
+        g.LIMITS.apply()
+        self.file.seek(lba * SECTOR_SIZE)
+        read = self.file.readinto(buffer)
+        g.LIMITS.read.consume(read)
+        self.metrics.sectors_read += -(-read // SECTOR_SIZE)
+        return read
+
+    def read_file(self, path):
+        """Read a whole (small) file of the BDMV structure."""
+        file = self.udf.get(path)
+        if not file or file.is_dir:
+            raise FileNotFoundError(f"The file {path} was not found in the image.")
+        return self.udf.read_data(file)
+
+    def get_index(self):
+        if self.index is None:
+            self.index = Index.parse(self.read_file("/BDMV/index.bdmv"))
+        return self.index
+
+    def get_movie_objects(self):
+        if self.movie_objects is None:
+            self.movie_objects = MovieObject.parse_all(self.read_file("/BDMV/MovieObject.bdmv"))
+        return self.movie_objects
+
+    def get_playlist(self, number):
+        if number not in self.playlists:
+            self.playlists[number] = Playlist.parse(number, self.read_file(f"/BDMV/PLAYLIST/{number:05}.mpls"))
+        return self.playlists[number]
+
+    def get_playlists(self):
+        """Get every playlist of the image, longest first."""
+        numbers = [
+            int(f.path[-10:-5]) for f in self.udf.list("/BDMV/PLAYLIST") if f.path.lower().endswith(".mpls")
+        ]
+        return sorted((self.get_playlist(n) for n in numbers), key=lambda p: -p.duration)
+
+    def get_clip(self, clip_id):
+        if clip_id not in self.clips:
+            self.clips[clip_id] = Clip.parse(clip_id, self.read_file(f"/BDMV/CLIPINF/{clip_id}.clpi"))
+        return self.clips[clip_id]
+
+    def get_playlist_runs(self, number):
+        """
+        Get the (lba, skip bytes, bytes) runs of the image to read, in order, to get the
+        m2ts stream of a playlist. Adjacent runs are merged so reads are as large as possible.
+        """
+        runs = []
+        for item in self.get_playlist(number).items:
+            file = self.udf.get(f"/BDMV/STREAM/{item.clip_id}.m2ts")
+            if not file:
+                raise FileNotFoundError(f"The clip {item.clip_id} of playlist {number:05} is missing.")
+            start, end = self.get_clip(item.clip_id).get_byte_range(item.in_time, item.out_time)
+            end = min(end, file.size)
+            offset = 0  # of the current extent within the file
+            for lba, size in file.extents:
+                first, last = max(start - offset, 0), min(end - offset, size)
+                if first < last:
+                    run_lba, skip = lba + first // SECTOR_SIZE, first % SECTOR_SIZE
+                    if runs and not skip and not runs[-1][1] and \
+                            runs[-1][0] * SECTOR_SIZE + runs[-1][2] == run_lba * SECTOR_SIZE:
+                        runs[-1] = (runs[-1][0], 0, runs[-1][2] + last - first)
+                    else:
+                        runs.append((run_lba, skip, last - first))
+                offset += size
+        return runs
+
+    @asynchronous_auto
+    def extract_playlist(self, js=None, playlist=None, outputs=None, policy=Tee.BLOCK, queue_size=16):
+        """
+        Stream the clips of a playlist, in playback order, to every Sink in `outputs` as
+        a single m2ts stream. Only the parts of the clips the playlist plays are read.
+        Defaults to `<VOLUME_ID>_<PLAYLIST>.m2ts`. See Dvd.create_backup() for `policy`
+        and `queue_size`. Multi-angle playlists are streamed in their first angle.
+
+        Raises SlipstreamReadError on unexpected read errors.
+        Raises SlipstreamSinkError if the outputs failed, see Tee.
+        """
+        runs = self.get_playlist_runs(playlist)
+        total = sum(size for _, _, size in runs)
+        if not outputs:
+            outputs = [FileSink(f"{self.get_volume_label()}_{playlist:05}.m2ts")]
+        g.LOG.write(
+            f"Extracting playlist {playlist:05}, {total:,} bytes in {len(runs)} runs, to "
+            + ", ".join(f'"{sink.name}"' for sink in outputs)
+        )
+        if js:
+            js.Call(True)
+        self.set_job(f"playlist-{playlist:05}")
+        try:
+            tee = Tee(outputs, queue_size, policy)
+            tee.open()
+            self.metrics.tees = [tee]
+            pool = tee.get_pool(self.CHUNK_SECTORS * SECTOR_SIZE)
+            done = 0
+            try:
+                for lba, skip, size in runs:
+                    end = skip + size  # byte offset past the run, from lba
+                    position = 0
+                    while position < end:
+                        sectors = min(self.CHUNK_SECTORS, -(-(end - position) // SECTOR_SIZE))
+                        with pool.acquire() as block:
+                            with g.PROFILER.phase("read"):
+                                read = self.readinto(lba + position // SECTOR_SIZE, block.view[:sectors * SECTOR_SIZE])
+                            if not read:
+                                raise SlipstreamReadError(f"An unexpected read error occurred reading {lba}")
+                            chunk = block.view[max(skip - position, 0):min(end - position, read)]
+                            with g.PROFILER.phase("output"):
+                                tee.write(chunk, block)
+                        position += read
+                        done += len(chunk)
+                        self.set_progress((done / total) * 100)
+            except BaseException:
+                tee.abort()
+                raise
+            failed = tee.close()
+            for sink, error in failed:
+                g.LOG.write(f"Output \"{sink.name}\" is incomplete: {error}")
+            if len(failed) == len(outputs):
+                raise SlipstreamSinkError(f"Every output failed, playlist {playlist:05} was not saved.")
+            if failed and policy == Tee.BLOCK:
+                raise SlipstreamSinkError(
+                    f"{len(failed)} of {len(outputs)} outputs failed, playlist {playlist:05} is incomplete."
+                )
+            g.LOG.write(f"Extracted playlist {playlist:05}, {done:,} bytes.")
+        finally:
+            self.set_job(None)
+            if js:
+                js.Call(False)
+
+    def describe(self):
+        """Describe every playlist, longest first, as lines of text."""
+        lines = []
+        for playlist in self.get_playlists():
+            minutes, seconds = divmod(int(playlist.duration), 60)
+            lines.append(
+                f"{playlist.number:05}.mpls: {minutes // 60}:{minutes % 60:02}:{seconds:02}, "
+                f"{len(playlist.chapters)} chapters, clips " + ", ".join(item.clip_id for item in playlist.items)
+            )
+        return lines
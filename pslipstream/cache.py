@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Sector cache used to make small and random reads of a disc cheap.
+Every seek on an optical drive costs milliseconds, so anything that jumps
+around the disc should go through here.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class SectorCache:
+    """
+    Least-Recently-Used cache of disc sectors with sequential read-ahead.
+
+    Sectors are cached in aligned blocks of `block_sectors`, evicting the least
+    recently used block once `budget` bytes are in use. When a miss directly
+    follows the previously requested block, the access is treated as sequential
+    and the next `read_ahead` blocks are fetched in the same device read.
+
+    `read` is the function used on a miss, called as `read(lba, sectors)` and
+    returning the data as bytes. It may return less data at the end of the disc.
+
+    Every read can be given a `key` to keep differently read copies of the same
+    sectors apart, e.g. raw and decrypted, as a block is only ever served to
+    reads made with the same key.
+    """
+
+    def __init__(self, read, sector_size=2048, budget=32 * 1024 * 1024, block_sectors=16, read_ahead=15):
+        self.read_func = read
+        self.sector_size = sector_size
+        self.block_sectors = block_sectors
+        self.block_size = block_sectors * sector_size
+        self.max_blocks = max(1, budget // self.block_size)
+        self.read_ahead = read_ahead
+        self.blocks = OrderedDict()
+        self.next_block = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def read(self, lba, sectors, key=None):
+        """
+        Read an amount of sectors, from the cache where possible.
+        Returns the data as bytes, which will be short if the end of the disc was reached.
+        """
+        first_block = lba // self.block_sectors
+        last_block = (lba + sectors - 1) // self.block_sectors
+        data = []
+        with self.lock:
+            for block in range(first_block, last_block + 1):
+                block_data = self._get_block(key, block)
+                if not block_data:
+                    break
+                data.append(block_data)
+        data = b"".join(data)
+        offset = (lba - first_block * self.block_sectors) * self.sector_size
+        return data[offset:offset + sectors * self.sector_size]
+
+    def clear(self):
+        """Drop every cached block, e.g. when the disc or its key state changed."""
+        with self.lock:
+            self.blocks.clear()
+            self.next_block = None
+
+    def stats(self):
+        """Get the cache counters as a dictionary."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "blocks": len(self.blocks),
+            "size": len(self.blocks) * self.block_size
+        }
+
+    def _get_block(self, key, block):
+        sequential = (key, block) == self.next_block
+        self.next_block = (key, block + 1)
+        data = self.blocks.get((key, block))
+        if data is not None:
+            self.hits += 1
+            self.blocks.move_to_end((key, block))
+            return data
+        self.misses += 1
+        count = 1
+        if sequential:
+            # read ahead, but stop at the first block we already have
+            while count <= self.read_ahead and (key, block + count) not in self.blocks:
+                count += 1
+        data = self.read_func(block * self.block_sectors, count * self.block_sectors)
+        for i in range(count):
+            chunk = data[i * self.block_size:(i + 1) * self.block_size]
+            if not chunk:
+                break
+            self.blocks[(key, block + i)] = chunk
+        while len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+        return data[:self.block_size]
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+SQLite catalogue of every disc seen and every job run on them, kept in the
+user directory. It's what lets Slipstream tell a disc was already imaged
+before spending the time to read it again.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS discs (
+    id INTEGER PRIMARY KEY,
+    crc64 TEXT NOT NULL,
+    volume_id TEXT NOT NULL,
+    total_sectors INTEGER,
+    pvd TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    UNIQUE (crc64, volume_id)
+);
+CREATE INDEX IF NOT EXISTS discs_crc64 ON discs (crc64);
+CREATE INDEX IF NOT EXISTS discs_volume_id ON discs (volume_id);
+
+CREATE TABLE IF NOT EXISTS files (
+    disc_id INTEGER NOT NULL REFERENCES discs (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    lba INTEGER NOT NULL,
+    sectors INTEGER NOT NULL,
+    PRIMARY KEY (disc_id, path)
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    disc_id INTEGER NOT NULL REFERENCES discs (id) ON DELETE CASCADE,
+    device TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    outputs TEXT,
+    started REAL NOT NULL,
+    finished REAL,
+    bytes INTEGER,
+    read_seconds REAL,
+    key_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_disc ON jobs (disc_id, status);
+CREATE INDEX IF NOT EXISTS jobs_device ON jobs (device, finished);
+
+CREATE TABLE IF NOT EXISTS digests (
+    job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    algorithm TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (job_id, algorithm)
+);
+CREATE INDEX IF NOT EXISTS digests_value ON digests (value);
+"""
+
+
+class Catalogue:
+    """
+    Record of discs, their files, and the jobs run on them, with indexed lookups
+    by CRC64 DVD ID, volume ID, and digest.
+
+    A single connection is shared between threads, guarded by a lock.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA foreign_keys=ON")
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def add_disc(self, crc64, volume_id, total_sectors, pvd=None, files=None):
+        """
+        Record a disc as seen, along with its PVD and (lba, sectors) of every file path.
+        Returns the disc's id, the same one if it was seen before.
+        """
+        now = time.time()
+        volume_id = volume_id or ""  # NULLs would never conflict with each other
+        with self.lock, self.db:
+            # not an upsert, as that needs SQLite 3.24+
+            self.db.execute(
+                "INSERT OR IGNORE INTO discs (crc64, volume_id, total_sectors, pvd, first_seen, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (crc64, volume_id, total_sectors, json.dumps(pvd, default=str) if pvd else None, now, now)
+            )
+            self.db.execute(
+                "UPDATE discs SET last_seen = ? WHERE crc64 = ? AND volume_id = ?", (now, crc64, volume_id)
+            )
+            disc_id = self.db.execute(
+                "SELECT id FROM discs WHERE crc64 = ? AND volume_id = ?", (crc64, volume_id)
+            ).fetchone()["id"]
+            if files:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO files (disc_id, path, lba, sectors) VALUES (?, ?, ?, ?)",
+                    [(disc_id, path, lba, sectors) for path, lba, sectors in files]
+                )
+        return disc_id
+
+    def find_discs(self, crc64=None, volume_id=None):
+        """Find discs by CRC64 DVD ID and/or volume ID."""
+        where, args = [], []
+        if crc64 is not None:
+            where.append("crc64 = ?")
+            args.append(crc64)
+        if volume_id is not None:
+            where.append("volume_id = ?")
+            args.append(volume_id)
+        query = "SELECT * FROM discs" + (" WHERE " + " AND ".join(where) if where else "")
+        with self.lock:
+            return [self._disc(row) for row in self.db.execute(query, args)]
+
+    def get_files(self, disc_id):
+        """Get the (path, lba, sectors) of every file recorded for a disc."""
+        with self.lock:
+            return [
+                (row["path"], row["lba"], row["sectors"])
+                for row in self.db.execute("SELECT * FROM files WHERE disc_id = ? ORDER BY lba", (disc_id,))
+            ]
+
+    def get_backups(self, disc_id):
+        """Get every successful backup job of a disc, newest first."""
+        with self.lock:
+            return [
+                self._job(row) for row in self.db.execute(
+                    "SELECT * FROM jobs WHERE disc_id = ? AND kind = 'backup' AND status = 'done' "
+                    "ORDER BY finished DESC", (disc_id,)
+                )
+            ]
+
+    def find_by_digest(self, value):
+        """Find the jobs that produced an output with this digest (of any algorithm)."""
+        with self.lock:
+            return [
+                self._job(row) for row in self.db.execute(
+                    "SELECT jobs.* FROM digests JOIN jobs ON jobs.id = digests.job_id WHERE digests.value = ?",
+                    (value.lower(),)
+                )
+            ]
+
+    def start_job(self, disc_id, device, kind, outputs):
+        """Record a job as started. Returns the job id."""
+        with self.lock, self.db:
+            return self.db.execute(
+                "INSERT INTO jobs (disc_id, device, kind, status, outputs, started) VALUES (?, ?, ?, 'running', ?, ?)",
+                (disc_id, device, kind, json.dumps(outputs), time.time())
+            ).lastrowid
+
+    def finish_job(self, job_id, status, size=None, read_seconds=None, key_seconds=None, digests=None):
+        """Record a job as finished with a status like `done` or `failed`, along with its timings and digests."""
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, bytes = ?, read_seconds = ?, key_seconds = ? WHERE id = ?",
+                (status, time.time(), size, read_seconds, key_seconds, job_id)
+            )
+            if digests:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO digests (job_id, algorithm, value) VALUES (?, ?, ?)",
+                    [(job_id, algorithm, value.lower()) for algorithm, value in digests.items()]
+                )
+
+    def drive_throughput(self, device=None, limit=50):
+        """
+        Get the read throughput of the latest finished jobs, of one or every device.
+        Returns a list of dictionaries with the device, finish time, bytes, and bytes per second.
+        """
+        query = (
+            "SELECT device, finished, bytes, read_seconds FROM jobs "
+            "WHERE status = 'done' AND read_seconds > 0" + (" AND device = ?" if device else "") +
+            " ORDER BY finished DESC LIMIT ?"
+        )
+        with self.lock:
+            return [
+                {
+                    "device": row["device"],
+                    "finished": row["finished"],
+                    "bytes": row["bytes"],
+                    "rate": row["bytes"] / row["read_seconds"]
+                }
+                for row in self.db.execute(query, ([device] if device else []) + [limit])
+            ]
+
+    @staticmethod
+    def _disc(row):
+        disc = dict(row)
+        disc["pvd"] = json.loads(disc["pvd"]) if disc["pvd"] else None
+        return disc
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job["outputs"] = json.loads(job["outputs"]) if job["outputs"] else []
+        return job
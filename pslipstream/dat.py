@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Logiqx XML DAT files, as used by Redump and No-Intro. Backups can be added
+to a DAT straight from the hashes computed while streaming, and existing
+images can be verified against a DAT in bulk.
+"""
+
+import builtins as g
+import hashlib
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pslipstream.cfg as cfg
+from pslipstream.sinks import HashSink
+
+DAT_ALGORITHMS = ("crc32", "md5", "sha1")
+DAT_DOCTYPE = (
+    '<!DOCTYPE datafile PUBLIC "-//Logiqx//DTD ROM Management Datafile//EN" '
+    '"http://www.logiqx.com/Dats/datafile.dtd">'
+)
+
+
+class Rom:
+    """A single file entry of a DAT, with the name of the game (disc) it belongs to."""
+
+    def __init__(self, game, name, size, crc=None, md5=None, sha1=None):
+        self.game = game
+        self.name = name
+        self.size = size
+        self.crc = crc.lower() if crc else None
+        self.md5 = md5.lower() if md5 else None
+        self.sha1 = sha1.lower() if sha1 else None
+
+    def matches(self, size, digests):
+        """Check if a file's size and digests match, ignoring digests the DAT doesn't have."""
+        return size == self.size and all(
+            getattr(self, attr) in (None, digests.get(name))
+            for attr, name in (("crc", "crc32"), ("md5", "md5"), ("sha1", "sha1"))
+        )
+
+
+class Dat:
+    """A Logiqx XML DAT file, indexed by ROM name and digests."""
+
+    def __init__(self, name=cfg.title, description=None):
+        self.name = name
+        self.description = description or name
+        self.roms = []
+        self.by_name = {}
+        self.by_sha1 = {}
+        self.by_md5 = {}
+        self.by_crc = {}
+
+    @classmethod
+    def load(cls, path):
+        root = ElementTree.parse(path).getroot()
+        dat = cls(root.findtext("header/name") or cls().name, root.findtext("header/description"))
+        # newer DATs (e.g. from MAME) call games machines
+        for game in root.findall("game") + root.findall("machine"):
+            for rom in game.findall("rom"):
+                dat.add(Rom(
+                    game.get("name"), rom.get("name"), int(rom.get("size", -1)),
+                    rom.get("crc"), rom.get("md5"), rom.get("sha1")
+                ))
+        return dat
+
+    def add(self, rom):
+        """Add a ROM, replacing any existing one of the same game and name."""
+        existing = self.by_name.get(rom.name.lower())
+        if existing and existing.game == rom.game:
+            self.roms.remove(existing)
+            for index, value in self.indexes(existing):
+                index[value].remove(existing)
+        self.roms.append(rom)
+        self.by_name[rom.name.lower()] = rom
+        for index, value in self.indexes(rom):
+            index.setdefault(value, []).append(rom)
+
+    def indexes(self, rom):
+        """Get the (index, key) pairs of every digest index a ROM belongs in."""
+        return [
+            (index, value)
+            for index, value in ((self.by_sha1, rom.sha1), (self.by_md5, rom.md5), (self.by_crc, rom.crc))
+            if value
+        ]
+
+    def find(self, size, digests):
+        """Find a ROM matching a file's size and digests, using the strongest digest available."""
+        for index, name in ((self.by_sha1, "sha1"), (self.by_md5, "md5"), (self.by_crc, "crc32")):
+            if digests.get(name):
+                for rom in index.get(digests[name], []):
+                    if rom.matches(size, digests):
+                        return rom
+                return None
+        return None
+
+    def save(self, path):
+        """Save the DAT, replacing the file at once so a reader never sees half of it."""
+        root = ElementTree.Element("datafile")
+        header = ElementTree.SubElement(root, "header")
+        for tag, text in (
+            ("name", self.name),
+            ("description", self.description),
+            ("version", time.strftime("%Y%m%d-%H%M%S")),
+            ("author", f"{cfg.title} v{cfg.version}")
+        ):
+            ElementTree.SubElement(header, tag).text = text
+        games = {}
+        for rom in self.roms:
+            if rom.game not in games:
+                games[rom.game] = ElementTree.SubElement(root, "game", name=rom.game)
+                ElementTree.SubElement(games[rom.game], "description").text = rom.game
+            attributes = {"name": rom.name, "size": str(rom.size)}
+            for attr in ("crc", "md5", "sha1"):
+                if getattr(rom, attr):
+                    attributes[attr] = getattr(rom, attr)
+            ElementTree.SubElement(games[rom.game], "rom", attributes)
+        indent(root)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(b'<?xml version="1.0"?>\n' + DAT_DOCTYPE.encode() + b"\n")
+            f.write(ElementTree.tostring(root, encoding="utf-8"))
+            f.write(b"\n")
+        os.replace(temp_path, path)
+
+
+class DatSink(HashSink):
+    """
+    Compute the DAT digests (CRC32, MD5, SHA-1) of the stream as it passes by and
+    add it to a DAT file as a game named `game` with a single ROM named `rom_name`.
+    If the DAT already exists, the entry is merged into it.
+    """
+
+    def __init__(self, path, game, rom_name):
+        super().__init__(algorithms=DAT_ALGORITHMS, label=rom_name)
+        self.name = path
+        self.path = path
+        self.game = game
+        self.rom_name = rom_name
+
+    def close(self):
+        digests = self.hexdigests()
+        dat = Dat.load(self.path) if os.path.exists(self.path) else Dat()
+        dat.add(Rom(self.game, self.rom_name, self.written, digests["crc32"], digests["md5"], digests["sha1"]))
+        dat.save(self.path)
+        g.LOG.write(f"Added {self.rom_name} to DAT \"{self.path}\"")
+
+
+def hash_file(path, block_size=8 * 1024 * 1024):
+    """
+    Compute the size and DAT digests of a file with large sequential reads into a
+    single reused buffer. hashlib and zlib release the GIL on large buffers, so
+    multiple files can be hashed in parallel with threads.
+
+    Returns a (size, {algorithm: hex digest}) tuple.
+    """
+    crc = 0
+    md5 = hashlib.md5()
+    sha1 = hashlib.sha1()
+    size = 0
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            # tell the kernel to read ahead aggressively
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            data = view[:read]
+            crc = zlib.crc32(data, crc)
+            md5.update(data)
+            sha1.update(data)
+            size += read
+    return size, {"crc32": f"{crc & 0xFFFFFFFF:08x}", "md5": md5.hexdigest(), "sha1": sha1.hexdigest()}
+
+
+def try_hash_file(path):
+    """Compute the size and DAT digests of a file like hash_file(), returning an OSError rather than raising it."""
+    try:
+        return hash_file(path)
+    except OSError as e:
+        return e
+
+
+def find_images(directory, extensions=(".iso",)):
+    """Recursively find every image file in a directory, sorted by path."""
+    images = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in extensions:
+                images.append(os.path.join(root, name))
+    return sorted(images)
+
+
+def verify(paths, dat, workers=4):
+    """
+    Hash every file in paths in parallel and check them against a DAT.
+
+    Each file is a `match` if its size and digests match a ROM, a `mismatch` if
+    its name matches a ROM but its contents don't, `unknown` otherwise, or `unreadable`
+    if it couldn't be read, e.g. it's gone, without failing the rest.
+
+    Returns a report dictionary with a list of (path, status, rom, size, digests)
+    results, the list of ROMs that no file matched as `missing`, and the reason of
+    every unreadable file by path as `errors`.
+    """
+    results = []
+    matched = set()
+    errors = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max(workers, 1)) as pool:
+        for path, hashed in zip(paths, pool.map(try_hash_file, paths)):
+            if isinstance(hashed, OSError):
+                errors[path] = hashed.strerror or str(hashed)
+                g.LOG.write(f"UNREADABLE: {path} ({errors[path]})", echo=g.DBG)
+                results.append((path, "unreadable", None, 0, None))
+                continue
+            size, digests = hashed
+            rom = dat.find(size, digests)
+            if rom:
+                status = "match"
+                matched.add(id(rom))
+            else:
+                rom = dat.by_name.get(os.path.basename(path).lower())
+                status = "mismatch" if rom else "unknown"
+            g.LOG.write(f"{status.upper()}: {path}" + (f" ({rom.game})" if rom else ""), echo=g.DBG)
+            results.append((path, status, rom, size, digests))
+    return {
+        "results": results,
+        "missing": [rom for rom in dat.roms if id(rom) not in matched],
+        "errors": errors,
+        "seconds": time.perf_counter() - start
+    }
+
+
+def format_report(report):
+    """Format a verification report as text, with a line per file followed by a summary."""
+    lines = []
+    counts = {"match": 0, "mismatch": 0, "unknown": 0, "unreadable": 0}
+    for path, status, rom, size, digests in report["results"]:
+        counts[status] += 1
+        line = f"{status.upper():<10} {path}"
+        if status == "match":
+            line += f" = {rom.game}"
+        elif status == "mismatch":
+            expected = ", ".join(
+                f"{attr} {getattr(rom, attr)} != {digests[name]}"
+                for attr, name in (("crc", "crc32"), ("md5", "md5"), ("sha1", "sha1"))
+                if getattr(rom, attr) not in (None, digests[name])
+            )
+            if size != rom.size:
+                expected = ", ".join(filter(None, [f"size {rom.size} != {size}", expected]))
+            line += f" ({rom.game}: {expected})"
+        elif status == "unreadable":
+            line += f" ({report['errors'][path]})"
+        else:
+            line += f" (size {size}, sha1 {digests['sha1']})"
+        lines.append(line)
+    for rom in report["missing"]:
+        lines.append(f"{'MISSING':<10} {rom.name} ({rom.game})")
+    total_size = sum(result[3] for result in report["results"])
+    lines.append(
+        f"{counts['match']} matched, {counts['mismatch']} mismatched, {counts['unknown']} unknown, "
+        + (f"{counts['unreadable']} unreadable, " if counts["unreadable"] else "") +
+        f"{len(report['missing'])} missing. Hashed {total_size / 1024 / 1024:,.0f} MiB in "
+        f"{report['seconds']:.1f}s ({total_size / 1024 / 1024 / max(report['seconds'], 1e-9):.1f} MiB/s)."
+    )
+    return "\n".join(lines)
+
+
+def indent(element, level=0):
+    """Indent an ElementTree element in place for pretty printing (ElementTree.indent is Python 3.9+)."""
+    whitespace = "\n" + level * "  "
+    if len(element):
+        if not element.text or not element.text.strip():
+            element.text = whitespace + "  "
+        for child in element:
+            indent(child, level + 1)
+        if not child.tail or not child.tail.strip():
+            child.tail = whitespace
+    if level and (not element.tail or not element.tail.strip()):
+        element.tail = whitespace
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Streaming demuxer of DVD-Video MPEG-2 Program Streams into elementary streams.
+
+DVD packs are exactly one sector each and PES packets never span packs, so
+the stream is demuxed pack by pack straight from the read buffer. Payloads
+are handed to their Sink as memoryview slices of it, without copying.
+
+Tracks are identified by a single byte, the PES stream id for video (0xE0)
+and MPEG audio (0xC0-0xC7), or the sub-stream id within private stream 1
+for AC3 (0x80-0x87), DTS (0x88-0x8F), LPCM (0xA0-0xA7), and subpictures
+(0x20-0x3F). The ranges don't overlap, so the byte alone is unambiguous.
+"""
+
+import struct
+
+PACK_SIZE = 2048
+PACK_START = b"\x00\x00\x01\xba"
+
+STREAM_PRIVATE_1 = 0xBD
+
+# track id ranges: (first, last, extension, bytes of sub-stream header to skip)
+TRACK_TYPES = [
+    (0xE0, 0xEF, "m2v", 0),
+    (0xC0, 0xDF, "mpa", 0),
+    (0x80, 0x87, "ac3", 4),  # sub-stream id, frame count, first access unit pointer
+    (0x88, 0x8F, "dts", 4),
+    (0xA0, 0xA7, "lpcm", 7),  # ..., emphasis/mute/frame number, quantization/rate/channels, dynamic range
+    (0x20, 0x3F, "sup", 1),
+]
+
+
+def get_track_type(track):
+    """Get the (extension, sub-stream header size) of a track id, or None if it's unsupported."""
+    for first, last, extension, header in TRACK_TYPES:
+        if first <= track <= last:
+            return extension, header
+    return None
+
+
+def parse_track(text):
+    """Parse a hexadecimal track id from text like `0x80` or `e0`."""
+    track = int(text, 16)
+    if get_track_type(track) is None:
+        raise ValueError(f"Unsupported track {text}, expected a video, audio, or subpicture stream id.")
+    return track
+
+
+class Demuxer:
+    """
+    Split a DVD-Video program stream into its tracks, pack by pack.
+
+    `outputs` maps track ids to Sinks. Tracks without an output are passed to
+    `factory`, which may return a Sink for it, or None to discard the track.
+    Discarded tracks are never copied or written. Sinks are opened on the first
+    payload of their track, and closed by close().
+    """
+
+    def __init__(self, outputs=None, factory=None):
+        self.outputs = dict(outputs or {})
+        self.factory = factory
+        self.opened = []
+        self.discarded = set()
+        self.tracks = {}  # payload bytes of every track seen, written or not
+        self.bad_packs = 0
+
+    def feed(self, data):
+        """Demux one or more whole packs."""
+        view = memoryview(data)
+        for offset in range(0, len(view) - PACK_SIZE + 1, PACK_SIZE):
+            self.feed_pack(view[offset:offset + PACK_SIZE])
+
+    def feed_pack(self, pack):
+        """Demux a single pack, a memoryview of PACK_SIZE bytes."""
+        if pack[:4] != PACK_START or pack[4] >> 6 != 1:
+            # not an MPEG-2 pack, DVD-Video never uses MPEG-1 packs
+            self.bad_packs += 1
+            return
+        offset = 14 + (pack[13] & 0x07)  # pack header and stuffing
+        while offset + 6 <= PACK_SIZE:
+            if pack[offset:offset + 3] != PACK_START[:3]:
+                self.bad_packs += 1
+                return
+            stream_id = pack[offset + 3]
+            length = struct.unpack_from(">H", pack, offset + 4)[0]
+            end = offset + 6 + length
+            if end > PACK_SIZE:
+                self.bad_packs += 1
+                return
+            if stream_id == STREAM_PRIVATE_1 or 0xC0 <= stream_id <= 0xEF:
+                payload = offset + 9 + pack[offset + 8]  # skip the PES header
+                track = stream_id
+                if stream_id == STREAM_PRIVATE_1 and payload < end:
+                    track = pack[payload]
+                track_type = get_track_type(track)
+                if track_type and payload + track_type[1] <= end:
+                    self.write(track, pack[payload + track_type[1]:end])
+            # system header, padding, and private stream 2 (navigation) have nothing for us
+            offset = end
+
+    def write(self, track, payload):
+        self.tracks[track] = self.tracks.get(track, 0) + len(payload)
+        sink = self.outputs.get(track)
+        if sink is None:
+            if track in self.discarded:
+                return
+            sink = self.factory(track) if self.factory else None
+            if sink is None:
+                self.discarded.add(track)
+                return
+            self.outputs[track] = sink
+        if sink not in self.opened:
+            sink.open()
+            self.opened.append(sink)
+        sink.write(payload)
+
+    def close(self):
+        """Close every Sink that was written to."""
+        for sink in self.opened:
+            sink.close()
+
+    def abort(self):
+        """Abort every Sink that was written to, e.g. after a read error."""
+        for sink in self.opened:
+            sink.abort()
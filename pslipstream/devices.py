@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Event-driven watcher of optical drives and the discs inserted in them.
+Rather than re-probing every drive each time the list is needed, the
+drives are listed once, and only the drive that changed is looked at again.
+"""
+
+import builtins as g
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+
+import pslipstream.cfg as cfg
+from pslipstream.helpers import get_volume_id, list_devices
+
+if cfg.linux:
+    import fcntl
+if cfg.windows:
+    from win32 import win32api
+
+# linux/cdrom.h
+CDROM_DRIVE_STATUS = 0x5326
+CDSL_CURRENT = 0x7FFFFFFF
+CDS_DISC_OK = 4
+# linux/netlink.h
+NETLINK_KOBJECT_UEVENT = 15
+
+
+def has_disc(device):
+    """
+    Cheaply check if a drive has a disc inserted, without reading from it.
+    Returns None if it can't be told on this platform.
+    """
+    if cfg.linux:
+        try:
+            fd = os.open(device, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            return False
+        try:
+            return fcntl.ioctl(fd, CDROM_DRIVE_STATUS, CDSL_CURRENT) == CDS_DISC_OK
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+    if cfg.windows:
+        try:
+            # \\.\E: -> E:\
+            win32api.GetVolumeInformation(device[4:] + "\\")
+            return True
+        except win32api.error:
+            return False
+    return None
+
+
+class DeviceWatcher:
+    """
+    Keeps a table of optical drives with their cached disc labels, and pushes
+    changes to every subscriber as they happen.
+
+    On Linux, kernel uevents are received over netlink, so a disc change is
+    seen the moment it happens. Elsewhere, or if netlink is unavailable, the
+    drives are polled with a cheap media status check instead. Either way, a
+    disc is only probed for its label when it actually changed. Drives whose
+    media status can't be told cheaply are probed when the drives listed change,
+    and otherwise every POLL_INTERVAL seconds, doubling up to MAX_PROBE_INTERVAL
+    for as long as their disc stays the same, as probing spins them up.
+
+    Subscribers are called with an event dictionary like
+    `{"event": "insert", "device": {"loc": "/dev/sr0", "volid": "LABEL", ...}}`,
+    where event is one of `add`, `remove`, `insert`, `eject`, or `label`.
+    """
+
+    POLL_INTERVAL = 2.0
+    MAX_PROBE_INTERVAL = 300.0
+
+    def __init__(self):
+        self.devices = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """List all drives once, then watch them for changes from a background thread."""
+        if self.running:
+            return
+        self.running = True
+        for device in self._list_devices(probe=True):
+            self.devices[device["loc"]] = device
+        sock = None
+        if cfg.linux:
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+                sock.bind((0, 1))  # multicast group 1, kernel events
+            except OSError as e:
+                g.LOG.write(f"Unable to listen for device events ({e}), polling devices instead.")
+                sock = None
+        if sock:
+            self.thread = threading.Thread(target=self._listen, args=(sock,), name="DeviceWatcher", daemon=True)
+        else:
+            self.thread = threading.Thread(target=self._poll, name="DeviceWatcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def subscribe(self, callback):
+        """Call callback with every device event from now on."""
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscribers.remove(callback)
+
+    def subscribe_js(self, js):
+        """Push every device event to a JavaScript callback."""
+        self.subscribe(js.Call)
+
+    def get_devices(self):
+        """Get the table of drives, discs with a label first."""
+        with self.lock:
+            devices = [dict(device) for device in self.devices.values()]
+        return sorted(devices, key=lambda d: d["volid"] or "", reverse=True)
+
+    def get_device_list(self, js):
+        js.Call(self.get_devices())
+
+    def update(self, loc, present=None):
+        """
+        Look at a single drive again after it may have changed, emitting events for any change.
+        If present is None, the drive is checked for a disc first.
+        """
+        with self.lock:
+            device = self.devices.get(loc)
+        if not device:
+            # new drive, get its details without probing the others
+            device = next((d for d in self._list_devices(probe=False) if d["loc"] == loc), None)
+            if not device:
+                return
+            with self.lock:
+                self.devices[loc] = device
+            self._emit("add", device)
+        if present is None:
+            present = has_disc(loc)
+        volid = get_volume_id(loc) if present is not False else None
+        old_volid = device["volid"]
+        if volid == old_volid:
+            return
+        device["volid"] = volid
+        if old_volid is None:
+            self._emit("insert", device)
+        elif volid is None:
+            self._emit("eject", device)
+        else:
+            self._emit("label", device)
+
+    def remove(self, loc):
+        with self.lock:
+            device = self.devices.pop(loc, None)
+        if device:
+            self._emit("remove", device)
+
+    @staticmethod
+    def _list_devices(probe):
+        try:
+            return list_devices(probe) or []
+        except (OSError, subprocess.CalledProcessError) as e:
+            g.LOG.write(f"Unable to list devices: {e}")
+            return []
+
+    def _emit(self, event, device):
+        event = {"event": event, "device": dict(device)}
+        g.LOG.write(f"Device {device['loc']}: {event['event']} ({device['volid'] or 'no disc'})", echo=g.DBG)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                g.LOG.write(f"Device event subscriber failed: {e}")
+
+    def _listen(self, sock):
+        with sock:
+            while self.running:
+                if not select.select([sock], [], [], 1.0)[0]:
+                    continue
+                message = sock.recv(8192).split(b"\0")
+                event = dict(
+                    line.decode(errors="replace").split("=", 1) for line in message[1:] if b"=" in line
+                )
+                if event.get("SUBSYSTEM") != "block" or not event.get("DEVNAME", "").startswith("sr"):
+                    continue
+                loc = f"/dev/{event['DEVNAME']}"
+                try:
+                    if event.get("ACTION") == "remove":
+                        self.remove(loc)
+                    elif event.get("ACTION") in ("add", "change"):
+                        self.update(loc)
+                except Exception as e:
+                    g.LOG.write(f"Failed to update device {loc}: {e}")
+
+    def _poll(self):
+        media = {loc: has_disc(loc) for loc in list(self.devices)}
+        # (time of the next probe, interval) of drives with no cheap media status, start() just probed them
+        probes = {
+            loc: (time.monotonic() + self.POLL_INTERVAL, self.POLL_INTERVAL)
+            for loc, present in media.items() if present is None
+        }
+        listed = None
+        while self.running:
+            time.sleep(self.POLL_INTERVAL)
+            devices = self._list_devices(probe=False)
+            if listed is not None and devices != listed:
+                probes.clear()  # a drive came, went, or changed, so probe them all now
+            listed = devices
+            locs = {d["loc"] for d in devices}
+            for loc in set(self.devices) - locs:
+                self.remove(loc)
+                media.pop(loc, None)
+                probes.pop(loc, None)
+            for loc in locs:
+                present = has_disc(loc)
+                if present is None and loc in self.devices:
+                    # we can't tell cheaply, fall back to probing the disc, less often while it's the same
+                    due, interval = probes.get(loc, (0, self.POLL_INTERVAL))
+                    if time.monotonic() < due:
+                        continue
+                    volid = self.devices[loc]["volid"]
+                    self._update(loc, present)
+                    if loc in self.devices and self.devices[loc]["volid"] == volid:
+                        interval = min(interval * 2, self.MAX_PROBE_INTERVAL)
+                    else:
+                        interval = self.POLL_INTERVAL
+                    probes[loc] = (time.monotonic() + interval, interval)
+                elif loc not in self.devices or present != media.get(loc):
+                    self._update(loc, present)
+                    if present is None:
+                        probes[loc] = (time.monotonic() + self.POLL_INTERVAL, self.POLL_INTERVAL)
+                media[loc] = present
+
+    def _update(self, loc, present):
+        try:
+            self.update(loc, present)
+        except Exception as e:
+            g.LOG.write(f"Failed to update device {loc}: {e}")
@@ -24,30 +24,67 @@ reading, seeking, backing up, and more.
 """
 
 import builtins as g
+import ctypes
+import multiprocessing
 import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import pycdlib
+from pycdlib.pycdlibexception import PyCdlibException
 import rlapydvdid
 from dateutil.tz import tzoffset
 from pydvdcss.dvdcss import DvdCss
 from tqdm import tqdm
 
 import pslipstream.cfg as cfg
+from pslipstream.cache import SectorCache
+from pslipstream.demux import Demuxer, get_track_type
 from pslipstream.exceptions import SlipstreamSeekError, SlipstreamDiscInUse, SlipstreamNoKeysObtained, \
-    SlipstreamReadError
-from pslipstream.helpers import asynchronous_auto
+    SlipstreamReadError, SlipstreamSinkError
+from pslipstream.helpers import asynchronous_auto, get_dvdcss_read
+from pslipstream.ifo import VtsIfo, merge_extents
+from pslipstream.locks import DeviceLock
+from pslipstream.schedule import Checkpoint, ImageFile, Region, get_layer_break, plan_regions
+from pslipstream.sinks import BufferPool, FileSink, HashSink, Tee
+from pslipstream.split import SplitImage, SplitImageCss, is_split_image
+from pslipstream.udf import Udf, UdfError
+from pslipstream.worker import RemoteDvdCss
 
 
 class Dvd:
+    # memory budget of the sector cache in bytes, 0 to disable it
+    CACHE_SIZE = 32 * 1024 * 1024
+    # max worker processes used to crack title keys of image files in parallel, each a libdvdcss instance
+    KEY_WORKERS = min(os.cpu_count() or 1, 4)
+    # run libdvdcss in a worker process of its own, see RemoteDvdCss
+    WORKER = False
+    # seconds to wait for a device owned by another job to be released, None waits forever
+    LOCK_TIMEOUT = 0
+    # sectors read between checkpoints of a scheduled backup, 64 MiB
+    CHECKPOINT_SECTORS = 32768
+
     def __init__(self):
         self.dev = None
         self.ready = False
+        self.lock = None
+        self.job = None
+        self.job_started = None
         self.cdlib = None
+        self.image = None
+        self.udf = None
         self.dvdcss = None
+        self.cache = None
+        self.metrics = None
+        self.buffer = None
+        self.native_read = None
+        self.total_sectors = 0
         self.reader_position = 0
         self.vob_lba_offsets = []
+        self.keyed_lba = None  # first LBA of the VOB set whose title key libdvdcss has loaded
 
     def __enter__(self):
         return self
@@ -57,24 +94,38 @@ class Dvd:
 
     def dispose(self):
         g.LOG.write(f"Disposing Dvd object...")
+        dev = self.dev
         if self.cdlib:
             self.cdlib.close()
+        if self.image:
+            self.image.close()
         if self.dvdcss:
             self.dvdcss.dispose()
+        if self.lock:
+            self.lock.release()
         self.__init__()  # reset everything
-        g.PROGRESS.c.Call(0)
+        g.PROGRESS.set(0, dev)
 
     @asynchronous_auto
     def open(self, dev, js=None):
         """
         Open the device as a DVD with pycdlib and libdvdcss.
+        The device may also be a DVD image file.
 
-        pycdlib will be used to identify and extract information.
+        pycdlib will be used to identify and extract information, or the UDF
+        file system alone if the disc has no ISO9660 file system.
         libdvdcss will be used for reading, writing, and decrypting.
 
+        The device may also be the descriptor of a split image, see SplitFileSink. It's
+        read through as one image, as is, as backups need no decrypting.
+
         Raises SlipstreamDiscInUse if you try to load the same disc that's
         already opened. You can open a different disc without an exception as
         it will automatically dispose the current disc before opening.
+
+        The device is owned exclusively until disposed, across processes. If another
+        job owns it, it's waited on for up to LOCK_TIMEOUT seconds before raising
+        SlipstreamDiscInUse, see DeviceLock. If opening fails, it's released again.
         """
         if self.dvdcss or self.cdlib:
             if dev != self.dev:
@@ -82,19 +133,91 @@ class Dvd:
                 self.dispose()
             else:
                 raise SlipstreamDiscInUse("The specified DVD device is already open in this instance.")
-        self.dev = dev
-        g.LOG.write(f"Opening {dev} as a DVD...")
-        self.cdlib = pycdlib.PyCdlib()
-        self.cdlib.open("\\\\.\\" + dev if cfg.windows else dev)
-        g.LOG.write(f"Initialised pycdlib instance successfully...")
-        self.dvdcss = DvdCss()
-        self.dvdcss.open(dev)
-        g.LOG.write(f"Initialised pydvdcss instance successfully...")
-        self.ready = True
-        g.LOG.write(f"DVD opened and ready...\n")
+        lock = DeviceLock(dev)
+        lock.acquire(self.LOCK_TIMEOUT)
+        self.lock = lock
+        try:
+            self.dev = dev
+            self.metrics = g.METRICS.device(dev)
+            g.LOG.write(f"Opening {dev} as a DVD...")
+            try:
+                cdlib = pycdlib.PyCdlib()
+                if is_split_image(dev):
+                    self.image = SplitImage(dev)
+                    cdlib.open_fp(self.image)
+                else:
+                    cdlib.open("\\\\.\\" + dev if cfg.windows and not os.path.isfile(dev) else dev)
+                self.cdlib = cdlib
+                g.LOG.write(f"Initialised pycdlib instance successfully...")
+            except PyCdlibException as e:
+                # UDF-only discs have no ISO9660 file system, we can do without it
+                g.LOG.write(f"Unable to read the ISO9660 file system ({e}), using the UDF file system only...")
+                self.cdlib = None
+            if is_split_image(dev):
+                self.dvdcss = SplitImageCss()
+            else:
+                self.dvdcss = RemoteDvdCss() if self.WORKER else DvdCss()
+            self.dvdcss.open(dev)
+            self.native_read = get_dvdcss_read(self.dvdcss)
+            g.LOG.write(f"Initialised pydvdcss instance successfully...")
+            if self.cdlib:
+                self.total_sectors = self.cdlib.pvds[0].space_size
+            else:
+                self.total_sectors = self.get_device_sectors()
+            if isinstance(self.dvdcss, RemoteDvdCss):
+                # it reads ahead from here on, never past the end of the disc
+                self.dvdcss.end = self.total_sectors
+            if self.CACHE_SIZE:
+                self.cache = SectorCache(
+                    lambda lba, sectors: self.read_sectors(lba, sectors, cache=False),
+                    self.dvdcss.SECTOR_SIZE,
+                    self.CACHE_SIZE
+                )
+            self.ready = True
+            g.LOG.write(f"DVD opened and ready...\n")
+        except BaseException:
+            # don't keep the device owned by a disc that never opened
+            self.dispose()
+            raise
         if js:
             js.Call()
 
+    def get_device_sectors(self):
+        """
+        Get the size of the disc in sectors without an ISO9660 file system to tell it.
+        The size of the image file or block device is used where possible, otherwise
+        the end of the UDF partition, which may miss the trailing anchor sectors.
+        """
+        try:
+            if isinstance(self.dvdcss, SplitImageCss):
+                sectors = self.dvdcss.image.size // self.dvdcss.SECTOR_SIZE
+            else:
+                with open(self.dev, "rb") as f:
+                    sectors = f.seek(0, os.SEEK_END) // self.dvdcss.SECTOR_SIZE
+        except OSError:
+            sectors = 0
+        if sectors:
+            return sectors
+        self.total_sectors = 1 << 32  # unknown until the UDF file system says otherwise
+        udf = self.get_udf()
+        if not udf:
+            raise SlipstreamReadError("The disc has neither an ISO9660 nor a UDF file system.")
+        return udf.total_sectors
+
+    def get_udf(self):
+        """
+        Get the UDF file system of the disc, read the first time it's needed.
+        The directory tree is cached as it's read, for as long as the disc is open.
+        Returns None if the disc has no (supported) UDF file system.
+        """
+        if self.udf is None:
+            try:
+                self.udf = Udf(self.read_sectors)
+            except UdfError as e:
+                g.LOG.write(f"Unable to read the UDF file system: {e}")
+                self.udf = False
+        return self.udf or None
+
     def is_ready(self, js):
         """
         Simple function just to be able to check if this Dvd
@@ -105,6 +228,16 @@ class Dvd:
         """
         js.Call(self.ready)
 
+    def get_cache_stats(self, js=None):
+        """
+        Get the sector cache hit/miss counters and memory use.
+        Returns None if the cache is disabled.
+        """
+        stats = self.cache.stats() if self.cache else None
+        if js:
+            js.Call(stats)
+        return stats
+
     @asynchronous_auto
     def compute_crc_id(self, js=None):
         """
@@ -122,7 +255,13 @@ class Dvd:
         """
         Get's and returns the Primary Volume Descriptor of the
         disc in a more accessible and parsed format.
+        Returns None if the disc has no ISO9660 file system.
         """
+        if not self.cdlib:
+            g.LOG.write("The disc has no ISO9660 file system, and therefore no Primary Volume Descriptor.")
+            if js:
+                js.Call(None)
+            return None
         pvd = self.cdlib.pvds[0]
 
         def date_convert(d):
@@ -173,6 +312,62 @@ class Dvd:
             js.Call(pvd)
         return pvd
 
+    def catalogue_disc(self):
+        """
+        Record the disc in the catalogue, identified by its CRC64 DVD ID and volume label,
+        along with its Primary Volume Descriptor and VIDEO_TS file list.
+
+        Returns the disc's id in the catalogue.
+        """
+        # the synchronous versions, we're most likely in a job thread already
+        crc = Dvd.compute_crc_id.__wrapped__(self)
+        pvd = Dvd.get_primary_descriptor.__wrapped__(self)
+        return g.CATALOGUE.add_disc(
+            crc, self.get_volume_label(), self.total_sectors, pvd, list(self.get_files("/VIDEO_TS"))
+        )
+
+    def get_previous_backups(self, js=None):
+        """
+        Check the catalogue for previous successful backups of this disc, newest first.
+        Each backup is a dictionary with the device, outputs, times, bytes, and timings.
+        """
+        backups = g.CATALOGUE.get_backups(self.catalogue_disc())
+        if js:
+            js.Call(backups)
+        return backups
+
+    def set_job(self, job):
+        """
+        Record the job the device is used for, None when idle, in its lock, for the UI, and in
+        its metrics. While profiling, the trace of the job is saved once it's done, see Profiler.
+        """
+        self.lock.set_job(job)
+        g.EVENTS.job(self.dev, job)
+        if job:
+            self.job = job
+            self.job_started = g.PROFILER.start()
+            self.metrics.active_jobs += 1
+            self.metrics.progress = 0.0
+        elif self.job:
+            job, self.job = self.job, None
+            self.metrics.active_jobs -= 1
+            self.metrics.tees = []
+            if g.PROFILER.enabled:
+                path = g.PROFILER.finish(f"{job}-{self.get_volume_label()}", self.job_started)
+                g.LOG.write(f"Saved profile to {path}")
+
+    def set_progress(self, progress):
+        """Set the progress of the running job in percent, for the UI and the metrics."""
+        self.metrics.progress = progress
+        g.PROGRESS.set(progress, self.dev)
+
+    def get_volume_label(self):
+        """Get the Volume Identifier of the disc as a clean string."""
+        if self.cdlib:
+            return self.cdlib.pvds[0].volume_identifier.decode().strip()
+        udf = self.get_udf()
+        return udf.volume_id if udf else ""
+
     def get_files(self, path="/", no_versions=True):
         """
         Read and list file paths directly from the disc device file system
@@ -180,8 +375,22 @@ class Dvd:
 
         Returns a tuple generator of the file path which will be
         absolute-paths relative to the root of the device, the Logical
-        Block Address (LBA), and the Size (in sectors).
+        Block Address (LBA), and the Size (in sectors, rounded up).
+
+        The UDF file system is used if available, as DVD-Video discs are required
+        to have one, with the ISO9660 file system as a fallback. For files split
+        over multiple extents, see get_extents().
         """
+        udf = self.get_udf()
+        if udf:
+            for file in udf.list(path):
+                if file.lba is None:
+                    continue  # embedded in its file entry, it has no sectors of its own
+                if not file.is_contiguous():
+                    g.LOG.write(f"File {file.path} is fragmented on the disc, use get_extents() to read it.")
+                g.LOG.write(f"Found title file: {file.path}, lba: {file.lba}, size: {file.sectors}", echo=g.DBG)
+                yield file.path, file.lba, file.sectors
+            return
         for child in self.cdlib.list_children(iso_path=path):
             file_path = child.file_identifier().decode()
             # skip the `.` and `..` paths
@@ -194,124 +403,684 @@ class Dvd:
             file_path = os.path.join("/", path, file_path)
             # get lba
             lba = child.extent_location()
-            # get size in sectors
-            size = int(child.get_data_length() / self.dvdcss.SECTOR_SIZE)
+            # get size in sectors, the last one may be partly used
+            size = -(-child.get_data_length() // self.dvdcss.SECTOR_SIZE)
             g.LOG.write(f"Found title file: {file_path}, lba: {lba}, size: {size}")
             yield file_path, lba, size
 
-    def get_vob_lbas(self, crack_keys=False):
+    def get_extents(self, path):
+        """
+        Get the (lba, sectors) of every extent of a file, in order.
+        Returns an empty list if the file isn't on the disc.
         """
-        Get the LBA data for all VOB files in disc.
-        Optionally seek with SEEK_KEY flag to obtain keys.
+        udf = self.get_udf()
+        if udf:
+            file = udf.get(path)
+            if not file or file.is_dir:
+                return []
+            return [(lba, -(-size // self.dvdcss.SECTOR_SIZE)) for lba, size in file.extents]
+        extent = next((f for f in self.get_files(os.path.dirname(path)) if f[0] == path), None)
+        return [extent[1:]] if extent else []
 
-        Raises SlipstreamSeekError on seek failures.
+    def get_vob_sets(self):
         """
-        # Create an array for holding the title data
-        lba_data = []
-        # Loop all files in disc:/VIDEO_TS
+        Get all VOB files in disc grouped by the CSS title key they share.
+
+        The menu VOBs (VIDEO_TS.VOB and every VTS_XX_0.VOB) each have a key of
+        their own, while all title VOBs of a VTS (VTS_XX_1.VOB to VTS_XX_9.VOB)
+        are one contiguous title sharing a single key.
+
+        Returns a list of (name, [(vob, lba, size), ...]) tuples in disc order.
+        """
+        vob_sets = {}
         for vob, lba, size in self.get_files("/VIDEO_TS"):
             # we only want vob files
             if os.path.splitext(vob)[-1] != ".VOB":
                 continue
-            # get title key
-            if crack_keys:
-                if lba == self.dvdcss.seek(lba, self.dvdcss.SEEK_KEY):
-                    g.LOG.write(f"Got title key for {vob}")
-                else:
-                    raise SlipstreamSeekError(
-                        f"Failed to seek the disc to {lba} while attempting to "
-                        f"crack the title key for {os.path.basename(vob)}"
-                    )
-            # add data to title offsets
-            lba_data.append((lba, size))
-        # Return lba data
-        return lba_data
+            m = re.match(r"^(VTS_\d\d)_[1-9]\.VOB$", os.path.basename(vob))
+            name = m.group(1) if m else os.path.splitext(os.path.basename(vob))[0]
+            vob_sets.setdefault(name, []).append((vob, lba, size))
+        vob_sets = [(name, sorted(vobs, key=lambda v: v[1])) for name, vobs in vob_sets.items()]
+        return sorted(vob_sets, key=lambda vob_set: vob_set[1][0][1])
+
+    def get_vob_lbas(self, crack_keys=False):
+        """
+        Get the LBA data for all VOB files in disc, in disc order.
+        Optionally crack the title keys of every VOB set, see crack_title_keys().
+
+        Raises SlipstreamSeekError on seek failures.
+        """
+        vob_sets = self.get_vob_sets()
+        if crack_keys:
+            self.crack_title_keys(vob_sets)
+        return [(lba, size) for _, vobs in vob_sets for _, lba, size in vobs]
+
+    def crack_title_keys(self, vob_sets):
+        """
+        Seek with the SEEK_KEY flag to the start of every VOB set to obtain its title key.
+
+        Each set is only cracked once, in disc order to keep seeks short. On image files,
+        where seeks are cheap, the sets are first cracked side by side in worker processes.
+        Their keys end up in libdvdcss's on-disk key cache, turning the seeks here into
+        simple cache lookups. This is skipped if the key cache is disabled (DVDCSS_CACHE=off).
+
+        Raises SlipstreamSeekError on seek failures.
+        """
+        workers = min(self.KEY_WORKERS, len(vob_sets))
+        if workers > 1 and os.path.isfile(self.dev) and os.environ.get("DVDCSS_CACHE") != "off":
+            g.LOG.write(f"Cracking {len(vob_sets)} title keys with {workers} worker processes...")
+            start = time.perf_counter()
+            # spawned rather than forked, forking the threads of the GUI process isn't safe
+            if sys.version_info >= (3, 7):
+                pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                pool = ProcessPoolExecutor(workers)
+            with pool:
+                results = pool.map(crack_title_key, [self.dev] * len(vob_sets), [v[0][1] for _, v in vob_sets])
+                for (name, _), (cracked, elapsed) in zip(vob_sets, results):
+                    g.LOG.write(f"{'Cracked' if cracked else 'Failed to crack'} title key for {name} in {elapsed:.2f}s")
+            self.metrics.key_crack_seconds += time.perf_counter() - start
+            g.LOG.write(f"Cracked title keys in parallel in {time.perf_counter() - start:.2f}s")
+        for name, vobs in vob_sets:
+            lba = vobs[0][1]
+            start = time.perf_counter()
+            with g.PROFILER.phase("crack_title_key", vob_set=name):
+                sought = self.dvdcss.seek(lba, self.dvdcss.SEEK_KEY)
+            if lba != sought:
+                raise SlipstreamSeekError(
+                    f"Failed to seek the disc to {lba} while attempting to crack the title key for {name}"
+                )
+            self.reader_position = self.keyed_lba = lba
+            self.metrics.key_crack_seconds += time.perf_counter() - start
+            g.LOG.write(f"Got title key for {name} ({len(vobs)} VOBs) in {time.perf_counter() - start:.2f}s")
+
+    def crack_keys(self):
+        """
+        Crack all CSS title keys if the disc is scrambled, so that reads
+        within the VOB files get decrypted.
+
+        Raises SlipstreamNoKeysObtained if no CSS keys were obtained when needed.
+        """
+        if self.dvdcss.is_scrambled():
+            g.LOG.write("DVD is scrambled. Checking if all CSS keys can be cracked. This might take a while.")
+            vob_sets = self.get_vob_sets()
+            self.crack_title_keys(vob_sets)
+            # every set is read as a single title, so we only ever seek for keys at the start of a set
+            self.vob_lba_offsets = [(v[0][1], v[-1][1] + v[-1][2] - v[0][1]) for _, v in vob_sets]
+            if not self.vob_lba_offsets:
+                raise SlipstreamNoKeysObtained("No CSS title keys were returned, unable to decrypt.")
+        else:
+            g.LOG.write("DVD isn't scrambled. CSS title key cracking skipped.")
 
     @asynchronous_auto
-    def create_backup(self, js=None):
+    def create_backup(self, js=None, outputs=None, policy=Tee.BLOCK, queue_size=16, skip_known=False):
         """
         Create a full untouched (but decrypted) ISO backup of a DVD with all
         metadata intact.
 
+        The decrypted stream is fanned out to every Sink in `outputs`, so the disc
+        is read exactly once no matter how many outputs there are. Each output gets
+        its own bounded queue of `queue_size` blocks, and `policy` decides what to do
+        when one falls behind, see Tee. Defaults to `<VOLUME_ID>.ISO` in the current
+        working directory.
+
+        The disc and job are recorded in the catalogue. If the disc was successfully
+        backed up before, it's logged, and with `skip_known` the backup is skipped.
+
         Raises SlipstreamNoKeysObtained if no CSS keys were obtained when needed.
         Raises SlipstreamReadError on unexpected read errors.
+        Raises SlipstreamSinkError if the outputs failed, see Tee.
         """
+        job_id = None
+        status = "failed"
+        current_lba = 0
+        read_seconds = key_seconds = 0.0
+        digests = {}
         try:
+            self.set_job("backup")
             # Notify JS-land we're starting
             if js:
                 js.Call(True)
             # Print primary volume descriptor information
             g.LOG.write(f"Starting DVD backup for {self.dev}")
-            pvd = self.cdlib.pvds[0]
-            pvd.volume_identifier = pvd.volume_identifier.decode().strip()
-            fn = f"{pvd.volume_identifier}.ISO"
-            fn_tmp = f"{pvd.volume_identifier}.ISO.tmp"
+            if not outputs:
+                outputs = [FileSink(f"{self.get_volume_label()}.ISO")]
+            # Check if we've been here before, before spending the time to read it all
+            with g.PROFILER.phase("catalogue"):
+                disc_id = self.catalogue_disc()
+                previous = g.CATALOGUE.get_backups(disc_id)
+            if previous:
+                g.LOG.write(
+                    f"This disc was already backed up {len(previous)} time(s), last on "
+                    f"{datetime.fromtimestamp(previous[0]['finished']):%Y-%m-%d %H:%M} to "
+                    + ", ".join(f'"{output}"' for output in previous[0]["outputs"])
+                )
+                if skip_known:
+                    g.LOG.write("Skipping the backup as the disc is already known.")
+                    return
+            job_id = g.CATALOGUE.start_job(disc_id, self.dev, "backup", [sink.name for sink in outputs])
+            tee = Tee(outputs, queue_size, policy)
             first_lba = 0
-            last_lba = pvd.space_size - 1
-            disc_size = pvd.space_size * self.dvdcss.SECTOR_SIZE
+            last_lba = self.total_sectors - 1
+            disc_size = self.total_sectors * self.dvdcss.SECTOR_SIZE
             g.LOG.write(
                 f"Reading sectors {first_lba:,} to {last_lba:,} with sector size {self.dvdcss.SECTOR_SIZE:,} B.\n"
                 f"Length: {last_lba + 1:,} sectors, {disc_size:,} bytes.\n"
-                f'Saving to "{fn}"...'
+                "Saving to " + ", ".join(f'"{sink.name}"' for sink in outputs) + "..."
             )
             # Retrieve CSS keys if disc is scrambled
-            if self.dvdcss.is_scrambled():
-                g.LOG.write("DVD is scrambled. Checking if all CSS keys can be cracked. This might take a while.")
-                self.vob_lba_offsets = self.get_vob_lbas(crack_keys=True)
-                if not self.vob_lba_offsets:
-                    raise SlipstreamNoKeysObtained("No CSS title keys were returned, unable to decrypt.")
-            else:
-                g.LOG.write("DVD isn't scrambled. CSS title key cracking skipped.")
-            # Create a file write handle to temp file
-            f = open(fn_tmp, "wb")
+            start = time.perf_counter()
+            with g.PROFILER.phase("crack_keys"):
+                self.crack_keys()
+            key_seconds = time.perf_counter() - start
+            # Open all the outputs, and read into a fixed set of buffers they release once written
+            tee.open()
+            pool = tee.get_pool(self.dvdcss.BLOCK_BUFFER * self.dvdcss.SECTOR_SIZE)
+            self.metrics.tees = [tee]
             # Create a TQDM progress bar
             t = tqdm(total=last_lba + 1, unit="sectors", file=TqdmHook())
             # Read through all the sectors in a memory efficient manner
             current_lba = first_lba
             g.LOG.write(f"Reading sectors {current_lba}->{last_lba}...")
-            while current_lba <= last_lba:
-                # get the maximum sectors to read at once
-                sectors = min(self.dvdcss.BLOCK_BUFFER, last_lba - current_lba + 1)
-                # read sectors
-                read_sectors = self.read(current_lba, sectors)
-                if read_sectors < 0:
-                    raise SlipstreamReadError(f"An unexpected read error occurred reading {current_lba}->{sectors}")
-                # write the buffer to output file
-                f.write(self.dvdcss.buffer)
-                # increment the current sector and update the tqdm progress bar
-                current_lba += read_sectors
-                # write progress to GUI log
-                g.PROGRESS.c.Call((current_lba / last_lba) * 100)
-                # write progress to CLI log
-                t.update(read_sectors)
-            # Close file and tqdm progress bar
-            f.close()
-            t.close()
-            # Rename temp file to final filename
-            os.rename(fn_tmp, fn)
+            start = time.perf_counter()
+            try:
+                while current_lba <= last_lba:
+                    # get the maximum sectors to read at once
+                    sectors = min(self.dvdcss.BLOCK_BUFFER, last_lba - current_lba + 1)
+                    with pool.acquire() as block:
+                        # read sectors
+                        with g.PROFILER.phase("read"):
+                            read_sectors = self.readinto(current_lba, block.view[:sectors * self.dvdcss.SECTOR_SIZE])
+                        if read_sectors < 0:
+                            raise SlipstreamReadError(
+                                f"An unexpected read error occurred reading {current_lba}->{sectors}"
+                            )
+                        # hand the buffer to every output
+                        with g.PROFILER.phase("output"):
+                            tee.write(block.view[:read_sectors * self.dvdcss.SECTOR_SIZE], block)
+                    # increment the current sector and update the tqdm progress bar
+                    current_lba += read_sectors
+                    # write progress to GUI log
+                    with g.PROFILER.phase("progress"):
+                        self.set_progress((current_lba / (last_lba + 1)) * 100)
+                    # write progress to CLI log
+                    with g.PROFILER.phase("tqdm"):
+                        t.update(read_sectors)
+            except BaseException:
+                tee.abort()
+                raise
+            finally:
+                t.close()
+                read_seconds = time.perf_counter() - start
+            # Wait for the outputs to finish writing
+            with g.PROFILER.phase("output.close"):
+                failed = tee.close()
+            for sink, error in failed:
+                g.LOG.write(f"Output \"{sink.name}\" is incomplete: {error}")
+            if len(failed) == len(outputs):
+                raise SlipstreamSinkError("Every output failed, the backup was not saved.")
+            if failed and policy == Tee.BLOCK:
+                raise SlipstreamSinkError(f"{len(failed)} of {len(outputs)} outputs failed, the backup is incomplete.")
+            failed_sinks = [sink for sink, _ in failed]
+            for sink in outputs:
+                if isinstance(sink, HashSink) and sink not in failed_sinks:
+                    digests.update(sink.hexdigests())
+            status = "done"
             # Tell the user some output information
             g.LOG.write(
                 "Finished DVD Backup!\n"
-                f"Read a total of {current_lba:,} sectors ({os.path.getsize(fn):,}) bytes.\n"
+                f"Read a total of {current_lba:,} sectors ({current_lba * self.dvdcss.SECTOR_SIZE:,}) bytes.\n"
             )
         finally:
+            if job_id is not None:
+                g.CATALOGUE.finish_job(
+                    job_id, status, current_lba * self.dvdcss.SECTOR_SIZE, read_seconds, key_seconds, digests
+                )
+            if self.lock:
+                self.set_job(None)
             # Notify js-land were done
             if js:
                 js.Call(False)
 
-    def read(self, first_lba, sectors):
+    def get_read_regions(self):
+        """
+        Get the regions of the disc in the order to read them, IFOs and menus first, then the
+        main feature, then everything else, split at the layer break if the drive tells it.
+        See plan_regions().
+        """
+        layer_break = get_layer_break(self.dev)
+        if layer_break:
+            g.LOG.write(f"Layer break at sector {layer_break:,}")
+        regions = plan_regions(self.total_sectors, list(self.get_files("/VIDEO_TS")), layer_break)
+        return regions, layer_break
+
+    @asynchronous_auto
+    def create_scheduled_backup(self, js=None, path=None):
+        """
+        Create a full (but decrypted) ISO backup like create_backup(), reading it region by
+        region in priority order instead of start to end, see get_read_regions(). Defaults to
+        `<VOLUME_ID>.ISO` in the current working directory.
+
+        The image is preallocated and written in place, with the progress of each region
+        checkpointed to `<path>.regions.json` every CHECKPOINT_SECTORS. If the checkpoint is
+        of the same disc, each region continues from where it left off. The image is usable
+        for browsing the disc once the structure regions are complete, which is logged.
+
+        Raises SlipstreamNoKeysObtained if no CSS keys were obtained when needed.
+        Raises SlipstreamReadError on unexpected read errors.
+        """
+        job_id = None
+        status = "failed"
+        image = None
+        done = 0
+        read_seconds = key_seconds = 0.0
+        try:
+            self.set_job("scheduled backup")
+            if js:
+                js.Call(True)
+            path = path or f"{self.get_volume_label()}.ISO"
+            g.LOG.write(f"Starting scheduled DVD backup for {self.dev} to \"{path}\"")
+            with g.PROFILER.phase("catalogue"):
+                disc_id = self.catalogue_disc()
+            job_id = g.CATALOGUE.start_job(disc_id, self.dev, "backup", [path])
+            regions, layer_break = self.get_read_regions()
+            checkpoint = Checkpoint(path, self.get_volume_label(), self.total_sectors, layer_break, regions)
+            if checkpoint.load() and os.path.isfile(path):
+                g.LOG.write(f"Resuming from \"{checkpoint.path}\", {sum(r.done for r in regions):,} sectors done")
+            else:
+                for region in regions:
+                    region.done = 0
+            for region in regions:
+                g.LOG.write(
+                    f"Region {region.name}: sectors {region.first_lba:,}+{region.sectors:,}, "
+                    f"priority {region.priority}" + (", done" if region.complete else ""), echo=g.DBG
+                )
+            start = time.perf_counter()
+            with g.PROFILER.phase("crack_keys"):
+                self.crack_keys()
+            key_seconds = time.perf_counter() - start
+            image = ImageFile(path, self.total_sectors * self.dvdcss.SECTOR_SIZE)
+            image.open()
+            buffer = bytearray(self.dvdcss.BLOCK_BUFFER * self.dvdcss.SECTOR_SIZE)
+            view = memoryview(buffer)
+            done = sum(r.done for r in regions)
+            start = time.perf_counter()
+            for i, region in enumerate(regions):
+                unsaved = 0
+                while not region.complete:
+                    lba = region.first_lba + region.done
+                    sectors = min(self.dvdcss.BLOCK_BUFFER, region.sectors - region.done)
+                    with g.PROFILER.phase("read"):
+                        read_sectors = self.readinto(lba, view[:sectors * self.dvdcss.SECTOR_SIZE])
+                    if read_sectors <= 0:
+                        raise SlipstreamReadError(f"An unexpected read error occurred reading {lba}->{sectors}")
+                    with g.PROFILER.phase("throttle"):
+                        g.LIMITS.write.consume(read_sectors * self.dvdcss.SECTOR_SIZE)
+                    with g.PROFILER.phase("output"):
+                        image.write_at(lba * self.dvdcss.SECTOR_SIZE, view[:read_sectors * self.dvdcss.SECTOR_SIZE])
+                    region.done += read_sectors
+                    done += read_sectors
+                    unsaved += read_sectors
+                    if unsaved >= self.CHECKPOINT_SECTORS:
+                        with g.PROFILER.phase("checkpoint"):
+                            image.sync()
+                            checkpoint.save()
+                        unsaved = 0
+                    with g.PROFILER.phase("progress"):
+                        self.set_progress((done / self.total_sectors) * 100)
+                with g.PROFILER.phase("checkpoint"):
+                    image.sync()
+                    checkpoint.save()
+                following = regions[i + 1].priority if i + 1 < len(regions) else None
+                if region.priority == Region.STRUCTURE and following != Region.STRUCTURE:
+                    g.LOG.write("The file system, IFOs, and menus are complete, the image can be browsed.")
+                elif region.priority == Region.MAIN_FEATURE and following != Region.MAIN_FEATURE:
+                    g.LOG.write("The main feature is complete.")
+            read_seconds = time.perf_counter() - start
+            image.close()
+            checkpoint.remove()
+            status = "done"
+            g.LOG.write(
+                "Finished DVD Backup!\n"
+                f"Read a total of {done:,} sectors ({done * self.dvdcss.SECTOR_SIZE:,}) bytes.\n"
+            )
+        finally:
+            if image:
+                image.close()
+            if job_id is not None:
+                g.CATALOGUE.finish_job(job_id, status, done * self.dvdcss.SECTOR_SIZE, read_seconds, key_seconds)
+            if self.lock:
+                self.set_job(None)
+            if js:
+                js.Call(False)
+
+    @asynchronous_auto
+    def extract_file(self, js=None, path=None, outputs=None, policy=Tee.BLOCK, queue_size=16):
+        """
+        Extract a single file of the disc, e.g. `/VIDEO_TS/VTS_01_1.VOB`, decrypted if
+        needed, to every Sink in `outputs`. Defaults to the file's name in the current
+        working directory. See create_backup() for `policy` and `queue_size`.
+
+        Raises FileNotFoundError if the file isn't on the disc.
+        Raises SlipstreamNoKeysObtained if no CSS keys were obtained when needed.
+        Raises SlipstreamSinkError if the outputs failed, see Tee.
+        """
+        extents = self.get_extents(path)
+        if not extents:
+            raise FileNotFoundError(f"The file {path} was not found on the disc.")
+        size = sum(sectors for _, sectors in extents)
+        if not outputs:
+            outputs = [FileSink(os.path.basename(path))]
+        if js:
+            js.Call(True)
+        self.set_job(f"extract {path}")
+        try:
+            if not self.vob_lba_offsets:
+                self.crack_keys()
+            tee = Tee(outputs, queue_size, policy)
+            tee.open()
+            self.metrics.tees = [tee]
+            g.LOG.write(f"Extracting {path} ({size:,} sectors) to " + ", ".join(f'"{s.name}"' for s in outputs))
+            pool = tee.get_pool(self.dvdcss.BLOCK_BUFFER * self.dvdcss.SECTOR_SIZE)
+            try:
+                done = 0
+                for lba, sectors in extents:
+                    end = lba + sectors
+                    while lba < end:
+                        with pool.acquire() as block:
+                            read_sectors = self.readinto(
+                                lba, block.view[:min(self.dvdcss.BLOCK_BUFFER, end - lba) * self.dvdcss.SECTOR_SIZE]
+                            )
+                            if not read_sectors:
+                                raise SlipstreamReadError(f"An unexpected read error occurred reading {lba}")
+                            tee.write(block.view[:read_sectors * self.dvdcss.SECTOR_SIZE], block)
+                        lba += read_sectors
+                        done += read_sectors
+                        self.set_progress((done / size) * 100)
+            except BaseException:
+                tee.abort()
+                raise
+            failed = tee.close()
+            for sink, error in failed:
+                g.LOG.write(f"Output \"{sink.name}\" is incomplete: {error}")
+            if len(failed) == len(outputs):
+                raise SlipstreamSinkError(f"Every output failed, {path} was not saved.")
+            if failed and policy == Tee.BLOCK:
+                raise SlipstreamSinkError(f"{len(failed)} of {len(outputs)} outputs failed, {path} is incomplete.")
+            g.LOG.write(f"Extracted {path}")
+        finally:
+            self.set_job(None)
+            if js:
+                js.Call(False)
+
+    def get_ifo(self, vts):
+        """
+        Get the parsed VTS_XX_0.IFO of a VTS, see VtsIfo.
+        Raises FileNotFoundError if the disc has no such VTS.
+        """
+        path = f"/VIDEO_TS/VTS_{vts:02}_0.IFO"
+        extents = self.get_extents(path)
+        if not extents:
+            raise FileNotFoundError(f"The disc has no VTS {vts}, {path} was not found.")
+        return VtsIfo(vts, b"".join(self.read_sectors(lba, sectors) for lba, sectors in extents), extents[0][0])
+
+    @asynchronous_auto
+    def extract(self, js=None, selections=None, outputs=None, concat=False, policy=Tee.BLOCK, queue_size=16):
+        """
+        Extract cells, chapters, or whole PGCs of the disc, see Selection.
+
+        The selections are merged into the smallest set of contiguous runs of sectors,
+        each read in a single sequential pass, so overlapping selections never read a
+        sector twice. Each selection is written to its own Sink of `outputs`, in the same
+        order, defaulting to `<VOLUME_ID>_<SELECTION>.VOB`. With `concat`, every selected
+        sector is instead written once to every Sink of `outputs`, defaulting to
+        `<VOLUME_ID>_EXTRACT.VOB`. See create_backup() for `policy` and `queue_size`.
+
+        Sectors are written in disc order, which is the playback order for all but the
+        rare PGCs with cells out of order.
+
+        Raises SlipstreamNoKeysObtained if no CSS keys were obtained when needed.
+        Raises SlipstreamReadError on unexpected read errors.
+        Raises SlipstreamSinkError if the outputs failed, see Tee.
+        """
+        label = self.get_volume_label()
+        ifos = {}
+        extents = []
+        for selection in selections:
+            if selection.vts not in ifos:
+                ifos[selection.vts] = self.get_ifo(selection.vts)
+            extents.append(merge_extents(ifos[selection.vts].get_extents(selection)))
+        runs = merge_extents(extent for selection_extents in extents for extent in selection_extents)
+        if concat:
+            targets = [(runs, Tee(outputs or [FileSink(f"{label}_EXTRACT.VOB")], queue_size, policy))]
+        else:
+            outputs = outputs or [FileSink(f"{label}_{selection}.VOB") for selection in selections]
+            if len(outputs) != len(selections):
+                raise ValueError(f"Expected one output per selection ({len(selections)}), got {len(outputs)}.")
+            targets = [(e, Tee([sink], queue_size, policy)) for e, sink in zip(extents, outputs)]
+        total = sum(sectors for _, sectors in runs)
+        g.LOG.write(
+            f"Extracting {len(selections)} selections, {total:,} sectors in {len(runs)} runs, to "
+            + ", ".join(f'"{sink.name}"' for _, tee in targets for sink in (w.sink for w in tee.workers))
+        )
+        if js:
+            js.Call(True)
+        self.set_job("extract")
+        try:
+            if not self.vob_lba_offsets:
+                self.crack_keys()
+            for _, tee in targets:
+                tee.open()
+            self.metrics.tees = [tee for _, tee in targets]
+            # every target holds on to the blocks it was given, so the pool is sized for all of them
+            pool = BufferPool(
+                sum(len(tee.workers) for _, tee in targets) * (queue_size + 1) + 1,
+                self.dvdcss.BLOCK_BUFFER * self.dvdcss.SECTOR_SIZE
+            )
+            done = 0
+            try:
+                for lba, sectors in runs:
+                    end = lba + sectors
+                    while lba < end:
+                        with pool.acquire() as block:
+                            read_sectors = self.readinto(
+                                lba, block.view[:min(self.dvdcss.BLOCK_BUFFER, end - lba) * self.dvdcss.SECTOR_SIZE]
+                            )
+                            # hand every target the part of the block within its extents
+                            for target_extents, tee in targets:
+                                for extent_lba, extent_sectors in target_extents:
+                                    first = max(extent_lba, lba)
+                                    last = min(extent_lba + extent_sectors, lba + read_sectors)
+                                    if first >= last or all(worker.error for worker in tee.workers):
+                                        continue
+                                    try:
+                                        tee.write(block.view[(first - lba) * self.dvdcss.SECTOR_SIZE:
+                                                             (last - lba) * self.dvdcss.SECTOR_SIZE], block)
+                                    except SlipstreamSinkError:
+                                        if policy == Tee.BLOCK:
+                                            raise
+                        lba += read_sectors
+                        done += read_sectors
+                        self.set_progress((done / total) * 100)
+            except BaseException:
+                for _, tee in targets:
+                    tee.abort()
+                raise
+            failed = [failure for _, tee in targets for failure in tee.close()]
+            for sink, error in failed:
+                g.LOG.write(f"Output \"{sink.name}\" is incomplete: {error}")
+            if len(failed) == sum(len(tee.workers) for _, tee in targets):
+                raise SlipstreamSinkError("Every output failed, nothing was extracted.")
+            if failed and policy == Tee.BLOCK:
+                raise SlipstreamSinkError(f"{len(failed)} outputs failed, the extraction is incomplete.")
+            g.LOG.write(f"Extracted {len(selections)} selections, read {done:,} sectors.")
+        finally:
+            self.set_job(None)
+            if js:
+                js.Call(False)
+
+    @asynchronous_auto
+    def demux(self, js=None, selection=None, tracks=None, outputs=None):
+        """
+        Demux the video, audio, and subpicture tracks of a Selection into elementary
+        streams, in a single pass over the disc with no intermediate files.
+
+        Only tracks in `tracks` (a list of track ids, see the demux module) are kept,
+        or every track if None, the rest are discarded without ever being written.
+        `outputs` maps track ids to Sinks, defaulting to `<VOLUME_ID>_<SELECTION>_<TRACK>.<EXT>`.
+
+        Raises SlipstreamNoKeysObtained if no CSS keys were obtained when needed.
+        Raises SlipstreamReadError on unexpected read errors.
+        """
+        label = self.get_volume_label()
+        runs = merge_extents(self.get_ifo(selection.vts).get_extents(selection))
+        total = sum(sectors for _, sectors in runs)
+
+        def factory(track):
+            if tracks is not None and track not in tracks:
+                return None
+            return FileSink(f"{label}_{selection}_{track:02X}.{get_track_type(track)[0]}")
+
+        demuxer = Demuxer(outputs, factory)
+        g.LOG.write(f"Demuxing {selection}, {total:,} sectors in {len(runs)} runs...")
+        if js:
+            js.Call(True)
+        self.set_job(f"demux {selection}")
+        try:
+            if not self.vob_lba_offsets:
+                self.crack_keys()
+            # the demuxer writes synchronously, so a single buffer is reused for every read
+            buffer = memoryview(bytearray(self.dvdcss.BLOCK_BUFFER * self.dvdcss.SECTOR_SIZE))
+            done = 0
+            try:
+                for lba, sectors in runs:
+                    end = lba + sectors
+                    while lba < end:
+                        read_sectors = self.readinto(
+                            lba, buffer[:min(self.dvdcss.BLOCK_BUFFER, end - lba) * self.dvdcss.SECTOR_SIZE]
+                        )
+                        with g.PROFILER.phase("demux"):
+                            demuxer.feed(buffer[:read_sectors * self.dvdcss.SECTOR_SIZE])
+                        lba += read_sectors
+                        done += read_sectors
+                        self.set_progress((done / total) * 100)
+            except BaseException:
+                demuxer.abort()
+                raise
+            demuxer.close()
+            for track, size in sorted(demuxer.tracks.items()):
+                sink = demuxer.outputs.get(track)
+                saved = f'saved to "{sink.name}"' if sink else "discarded"
+                g.LOG.write(f"Track 0x{track:02X}: {size:,} bytes, {saved}")
+            if demuxer.bad_packs:
+                g.LOG.write(f"Skipped {demuxer.bad_packs:,} packs that weren't valid MPEG-2 program stream packs.")
+        finally:
+            self.set_job(None)
+            if js:
+                js.Call(False)
+
+    def read(self, first_lba, sectors, cache=True):
         """
         Efficiently read an amount of sectors from the disc while supporting decryption
-        with libdvdcss (pydvdcss).
+        with libdvdcss (pydvdcss). The data is available in `self.buffer` afterwards.
+
+        Reads are served from the sector cache (if enabled), which reads ahead in large
+        blocks on sequential access. Use cache=False for one-off passes over the whole
+        disc, like a full backup, so they don't evict everything else.
+
+        Decrypted and raw sectors are cached apart, so sectors read before the CSS keys
+        were cracked are never handed out as decrypted data (or vice versa).
 
         Returns the amount of sectors read.
         Raises a SlipstreamSeekError on Seek Failures and SlipstreamReadError on Read Failures.
         """
+        if cache and self.cache:
+            self.buffer = self.cache.read(first_lba, sectors, key="decrypted" if self.vob_lba_offsets else "raw")
+            return len(self.buffer) // self.dvdcss.SECTOR_SIZE
+        return self.read_device(first_lba, sectors)
+
+    def read_sectors(self, first_lba, sectors, cache=True):
+        """
+        Read an exact amount of sectors, only stopping short at the end of the disc.
+        See read() for details on caching.
+
+        Returns the data as bytes.
+        """
+        sectors = min(sectors, self.total_sectors - first_lba)
+        data = []
+        while sectors > 0:
+            # device reads stop early at title boundaries, keep going until done
+            read_sectors = self.read(first_lba, sectors, cache)
+            if not read_sectors:
+                break
+            data.append(self.buffer)
+            first_lba += read_sectors
+            sectors -= read_sectors
+        return b"".join(data)
+
+    def read_device(self, first_lba, sectors):
+        """
+        Read an amount of sectors directly from the device, taking care of seeking and
+        the CSS key state. The read stops early at title boundaries.
+
+        Returns the amount of sectors read.
+        Raises a SlipstreamSeekError on Seek Failures and SlipstreamReadError on Read Failures.
+        """
+        sectors, flags = self.prepare_read(first_lba, sectors)
+        # libdvdcss decrypts within the read, so the phases tell decrypted and plain reads apart
+        with g.PROFILER.phase("dvdcss.read+decrypt" if flags else "dvdcss.read"):
+            ret = self.dvdcss.read(sectors, flags)
+        self.finish_read(first_lba, sectors, ret)
+        self.buffer = self.dvdcss.buffer
+        return ret
+
+    def readinto(self, first_lba, buffer):
+        """
+        Read as many sectors as fit into a caller-owned writable buffer, e.g. a memoryview
+        of a pre-allocated bytearray, directly from the device. Like read_device(), the
+        read stops early at title boundaries. The sector cache is never used.
+
+        When the libdvdcss handle of pydvdcss is reachable, dvdcss_read() reads (and
+        decrypts) straight into the buffer, without any intermediate object. With a
+        worker process, the sectors are copied in from its shared memory. Otherwise
+        pydvdcss's own buffer is copied in.
 
+        Returns the amount of sectors read.
+        Raises a SlipstreamSeekError on Seek Failures and SlipstreamReadError on Read Failures.
+        """
+        view = memoryview(buffer)
+        sectors, flags = self.prepare_read(first_lba, len(view) // self.dvdcss.SECTOR_SIZE)
+        size = sectors * self.dvdcss.SECTOR_SIZE
+        with g.PROFILER.phase("dvdcss.read+decrypt" if flags else "dvdcss.read"):
+            if self.native_read:
+                ret = self.native_read(self.dvdcss.handle, (ctypes.c_char * size).from_buffer(view), sectors, flags)
+            elif hasattr(self.dvdcss, "readinto"):
+                # a RemoteDvdCss copying out of its shared memory, or a SplitImageCss reading the parts
+                ret = self.dvdcss.readinto(view[:size], sectors, flags)
+            else:
+                ret = self.dvdcss.read(sectors, flags)
+                if ret == sectors:
+                    view[:size] = memoryview(self.dvdcss.buffer)[:size]
+        self.finish_read(first_lba, sectors, ret)
+        return ret
+
+    def prepare_read(self, first_lba, sectors):
+        """
+        Seek for a device read if needed, refreshing the CSS key state, and cut the read
+        short at title boundaries, so encrypted and unencrypted data are never read at once.
+
+        libdvdcss decrypts with the title key it loaded last, so a read into another VOB
+        set than the keyed one first seeks to the start of the set with SEEK_KEY, wherever
+        in the set it starts, e.g. a resumed or out of order read.
+
+        Returns the amount of sectors to read and the read flags.
+        Raises a SlipstreamSeekError on Seek Failures.
+        """
         # we need to seek to the first sector. Otherwise we get faulty data.
         needToSeek = first_lba != self.reader_position or first_lba == 0
         inTitle = False
         enteredTitle = False
+        title = None
 
         # Make sure we never read encrypted and unencrypted data at once since libdvdcss
         # only decrypts the whole area of read sectors or nothing at all.
@@ -320,9 +1089,9 @@ class Dvd:
             titleEnd = titleStart + vob_lba_offset[1] - 1
 
             # update key when entering a new title
-            # FIXME: we also need this if we seek into a new title (not only the start of the title)
             if titleStart == first_lba:
                 enteredTitle = needToSeek = inTitle = True
+                title = titleStart
 
             # if first_lba < titleStart and first_lba + sectors > titleStart:
             if first_lba < titleStart < first_lba + sectors:
@@ -339,6 +1108,12 @@ class Dvd:
             # is our read range part of one title
             if first_lba >= titleStart and first_lba + (sectors - 1) <= titleEnd:
                 inTitle = True
+                title = titleStart
+
+        if inTitle and not enteredTitle and title != self.keyed_lba:
+            # we're in the middle of a title keyed with another title's key, load its own first
+            self.seek_device(title, self.dvdcss.SEEK_KEY)
+            needToSeek = True
 
         if needToSeek:
             flags = self.dvdcss.NOFLAGS
@@ -348,20 +1123,61 @@ class Dvd:
                 flags = self.dvdcss.SEEK_MPEG
 
             # refresh the key status for this sector's data
-            self.reader_position = self.dvdcss.seek(first_lba, flags)
-            if self.reader_position != first_lba:
-                raise SlipstreamSeekError(f"Failed to seek the disc to {first_lba} while doing a device read.")
+            self.seek_device(first_lba, flags)
 
         flags = self.dvdcss.NOFLAGS
         if inTitle:
             flags = self.dvdcss.READ_DECRYPT
 
-        ret = self.dvdcss.read(sectors, flags)
+        return sectors, flags
+
+    def seek_device(self, lba, flags):
+        """
+        Seek the device to an LBA, keeping track of the title key loaded with SEEK_KEY.
+        Raises a SlipstreamSeekError on Seek Failures.
+        """
+        with g.PROFILER.phase("dvdcss.seek", flags=flags):
+            self.reader_position = self.dvdcss.seek(lba, flags)
+        g.PROFILER.count("seeks")
+        self.metrics.seeks += 1
+        if self.reader_position != lba:
+            self.metrics.read_errors += 1
+            raise SlipstreamSeekError(f"Failed to seek the disc to {lba} while doing a device read.")
+        if flags == self.dvdcss.SEEK_KEY:
+            self.keyed_lba = lba
+
+    def finish_read(self, first_lba, sectors, ret):
+        """
+        Account for a device read of `sectors` sectors that returned `ret`.
+        Raises SlipstreamReadError if the read fell short.
+        """
+        g.PROFILER.observe("read_sectors", sectors)
+        g.LIMITS.apply()
+        with g.PROFILER.phase("throttle"):
+            g.LIMITS.read.consume(max(ret, 0) * self.dvdcss.SECTOR_SIZE)
         if ret != sectors:
+            self.metrics.read_errors += 1
             raise SlipstreamReadError(f"An unexpected read error occurred reading {first_lba}->{first_lba + sectors}")
         self.reader_position += ret
+        self.metrics.sectors_read += ret
 
-        return ret
+
+def crack_title_key(dev, lba):
+    """
+    Crack the title key at an LBA with a libdvdcss instance of its own.
+    Used by worker processes, the key is shared through libdvdcss's key cache.
+
+    Returns a (cracked, seconds taken) tuple.
+    """
+    start = time.perf_counter()
+    dvdcss = DvdCss()
+    try:
+        dvdcss.open(dev)
+        return dvdcss.seek(lba, dvdcss.SEEK_KEY) == lba, time.perf_counter() - start
+    except Exception:
+        return False, time.perf_counter() - start
+    finally:
+        dvdcss.dispose()
 
 
 class TqdmHook:
@@ -371,10 +1187,10 @@ class TqdmHook:
     def write(text):
         # log the tqdm progress message
         g.LOG.write(text, echo=False)
-        # return it to stdout
-        return sys.stdout.write(text)
+        # return it to the log's stream, stdout may be carrying the backup
+        return g.LOG.stream.write(text)
 
     @staticmethod
     def flush():
-        # return it to stdout, we don't need to flush the log
-        sys.stdout.flush()
+        # return it to the log's stream, we don't need to flush the log
+        g.LOG.stream.flush()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Event channel to the UI. Log entries, progress, device changes, and job state
+are batched into binary frames sent every FLUSH_INTERVAL, as one base64 string
+per js.Call, instead of a call per event with its own conversion.
+
+Frame, little-endian:
+
+    magic    4s   b"SLEV"
+    version  u8   1
+    flags    u8   0, reserved
+    count    u16  number of events
+    sequence u32  frame number, a subscriber's first frame may start anywhere
+    time     u64  microseconds since the Unix epoch of the first event
+    events        `count` times:
+        type  u8   LOG, PROGRESS, DEVICE, or JOB
+        delta u32  microseconds since the frame's time
+        payload    a value, see below
+
+Value, a tag byte and its data:
+
+    0x00 None, 0x01 False, 0x02 True
+    0x03 i64, 0x04 u64 (integers of 2^63 and up), 0x05 f64
+    0x06 str as u32 byte length and UTF-8, 0x07 bytes as u32 length and data
+    0x08 list as u32 count and values, 0x09 map as u32 count and str key, value pairs
+    Anything else (e.g. a datetime) is sent as its str().
+
+Payloads:
+
+    LOG       str, the entry
+    PROGRESS  [f64 percent, str device or None], only the latest of each device per frame
+    DEVICE    {"event": str, "device": map}, see DeviceWatcher
+    JOB       [str device, str job or None when the device went idle]
+"""
+
+import base64
+import builtins as g
+import struct
+import threading
+import time
+
+MAGIC = b"SLEV"
+VERSION = 1
+FRAME = struct.Struct("<4sBBHIQ")
+EVENT = struct.Struct("<BI")
+
+LOG = 1
+PROGRESS = 2
+DEVICE = 3
+JOB = 4
+
+NONE, FALSE, TRUE, INT, UINT, FLOAT, STR, BYTES, LIST, MAP = range(10)
+
+_u32 = struct.Struct("<I")
+_i64 = struct.Struct("<q")
+_u64 = struct.Struct("<Q")
+_f64 = struct.Struct("<d")
+
+
+def pack_value(value, out):
+    """Append the encoding of a value to a bytearray."""
+    if value is None:
+        out.append(NONE)
+    elif value is True or value is False:
+        out.append(TRUE if value else FALSE)
+    elif isinstance(value, int):
+        if value >= 1 << 63:
+            out.append(UINT)
+            out += _u64.pack(value)
+        else:
+            out.append(INT)
+            out += _i64.pack(value)
+    elif isinstance(value, float):
+        out.append(FLOAT)
+        out += _f64.pack(value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(BYTES)
+        out += _u32.pack(len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out.append(LIST)
+        out += _u32.pack(len(value))
+        for item in value:
+            pack_value(item, out)
+    elif isinstance(value, dict):
+        out.append(MAP)
+        out += _u32.pack(len(value))
+        for key, item in value.items():
+            key = str(key).encode("utf-8")
+            out += _u32.pack(len(key))
+            out += key
+            pack_value(item, out)
+    else:
+        data = str(value).encode("utf-8")
+        out.append(STR)
+        out += _u32.pack(len(data))
+        out += data
+
+
+def unpack_value(data, offset=0):
+    """Decode a value at offset, returning it and the offset after it."""
+    tag = data[offset]
+    offset += 1
+    if tag in (NONE, FALSE, TRUE):
+        return (None, False, True)[tag], offset
+    if tag in (INT, UINT, FLOAT):
+        s = (_i64, _u64, _f64)[tag - INT]
+        return s.unpack_from(data, offset)[0], offset + s.size
+    if tag in (STR, BYTES):
+        size = _u32.unpack_from(data, offset)[0]
+        offset += _u32.size
+        value = bytes(data[offset:offset + size])
+        return value.decode("utf-8") if tag == STR else value, offset + size
+    count = _u32.unpack_from(data, offset)[0]
+    offset += _u32.size
+    if tag == LIST:
+        items = []
+        for _ in range(count):
+            item, offset = unpack_value(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == MAP:
+        items = {}
+        for _ in range(count):
+            size = _u32.unpack_from(data, offset)[0]
+            offset += _u32.size
+            key = bytes(data[offset:offset + size]).decode("utf-8")
+            items[key], offset = unpack_value(data, offset + size)
+        return items, offset
+    raise ValueError(f"Unknown value tag {tag:#x} at offset {offset - 1}")
+
+
+def pack_frame(sequence, events):
+    """Encode a frame of `(type, time, payload)` events, time in seconds since the epoch."""
+    start = int(events[0][1] * 1e6) if events else int(time.time() * 1e6)
+    out = bytearray(FRAME.pack(MAGIC, VERSION, 0, len(events), sequence & 0xFFFFFFFF, start))
+    for kind, at, payload in events:
+        out += EVENT.pack(kind, max(0, min(int(at * 1e6) - start, 0xFFFFFFFF)))
+        pack_value(payload, out)
+    return out
+
+
+def unpack_frame(data):
+    """Decode a frame (bytes or its base64 str), returning its sequence and `(type, time, payload)` events."""
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    magic, version, _, count, sequence, start = FRAME.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a v{VERSION} event frame")
+    offset = FRAME.size
+    events = []
+    for _ in range(count):
+        kind, delta = EVENT.unpack_from(data, offset)
+        payload, offset = unpack_value(data, offset + EVENT.size)
+        events.append((kind, (start + delta) / 1e6, payload))
+    return sequence, events
+
+
+class EventChannel:
+    """
+    Batches app events into frames for JavaScript callbacks.
+
+    Events are only collected while there's a subscriber, from whichever thread they
+    happen on, and sent from a flusher thread every FLUSH_INTERVAL seconds, or sooner
+    once MAX_EVENTS are pending. A new subscriber first gets a frame with the current
+    state: the log so far, the last progress, the devices, and the running jobs.
+
+    While there are subscribers, the per-event log and progress callbacks of the UI are
+    skipped, see Log.batched, so every event crosses the bridge once, in a frame.
+    """
+
+    FLUSH_INTERVAL = 0.1
+    MAX_EVENTS = 1000
+
+    def __init__(self):
+        self.subscribers = []
+        self.pending = []
+        self.progress = {}  # latest progress sample per device, coalesced until the next flush
+        self.jobs = {}  # current job per device
+        self.last_progress = None
+        self.sequence = 0
+        self.lock = threading.Condition()
+        self.thread = None
+        self.listening = False
+
+    def subscribe(self, js):
+        """Send every event to a JavaScript callback from now on, as base64 frames."""
+        self._listen()
+        snapshot = [(LOG, time.time(), entry) for entry in getattr(g.LOG, "entries", [])]
+        if getattr(g, "DEVICES", None):
+            snapshot.extend((DEVICE, time.time(), {"event": "add", "device": d}) for d in g.DEVICES.get_devices())
+        with self.lock:
+            if self.last_progress:
+                snapshot.append((PROGRESS, time.time(), list(self.last_progress)))
+            snapshot.extend((JOB, time.time(), [device, job]) for device, job in self.jobs.items())
+            self.flush()  # what's pending was already sent to the others
+            js.Call(base64.b64encode(pack_frame(self.sequence, snapshot)).decode("ascii"))
+            self.sequence += 1
+            self.subscribers.append(js)
+            self._batch()
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, name="EventChannel", daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, js):
+        with self.lock:
+            self.subscribers.remove(js)
+            self._batch()
+
+    def _batch(self):
+        """Skip the per-event log and progress callbacks while there are subscribers. Call with the lock held."""
+        g.LOG.batched = g.PROGRESS.batched = bool(self.subscribers)
+
+    def emit(self, kind, payload):
+        with self.lock:
+            if not self.subscribers:
+                return
+            self.pending.append((kind, time.time(), payload))
+            if len(self.pending) >= self.MAX_EVENTS:
+                self.lock.notify()
+
+    def log(self, entry):
+        self.emit(LOG, entry)
+
+    def set_progress(self, progress, device=None):
+        with self.lock:
+            self.last_progress = (float(progress), device)
+            if self.subscribers:
+                self.progress[device] = (time.time(), [float(progress), device])
+
+    def device(self, event):
+        self.emit(DEVICE, event)
+
+    def job(self, device, job):
+        """Record the job a device is used for, None when it went idle."""
+        with self.lock:
+            if job:
+                self.jobs[device] = job
+            else:
+                self.jobs.pop(device, None)
+        self.emit(JOB, [device, job])
+
+    def flush(self):
+        """Send the pending events to every subscriber as one frame. Call with the lock held."""
+        events = self.pending + [(PROGRESS, at, sample) for at, sample in self.progress.values()]
+        self.pending = []
+        self.progress = {}
+        if not events:
+            return
+        events.sort(key=lambda e: e[1])
+        for i in range(0, len(events), self.MAX_EVENTS):
+            frame = base64.b64encode(pack_frame(self.sequence, events[i:i + self.MAX_EVENTS])).decode("ascii")
+            self.sequence += 1
+            for js in self.subscribers:
+                js.Call(frame)
+
+    def _listen(self):
+        if self.listening:
+            return
+        self.listening = True
+        g.LOG.add_listener(self.log)
+        g.PROGRESS.add_listener(self.set_progress)
+        if getattr(g, "DEVICES", None):
+            g.DEVICES.subscribe(self.device)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                self.lock.wait(self.FLUSH_INTERVAL)
+                try:
+                    self.flush()
+                except Exception as e:
+                    # don't log it, that'd be another event to fail on
+                    print(f"Unable to send events to the UI: {e}", file=g.LOG.stream)
@@ -40,7 +40,7 @@ class SlipstreamUiError(Exception):
 
 
 class SlipstreamDiscInUse(Exception):
-    """A disc is already initialised in this instance."""
+    """A disc is already initialised in this instance, or its device is owned by another job."""
 
 
 class SlipstreamNoKeysObtained(Exception):
@@ -53,3 +53,7 @@ class SlipstreamReadError(Exception):
 
 class SlipstreamSeekError(Exception):
     """An unexpected seek error occurred."""
+
+
+class SlipstreamSinkError(Exception):
+    """An output sink failed or fell too far behind the disc read."""
@@ -18,6 +18,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import os
 import sys
 import tkinter as tk
 
@@ -101,7 +102,7 @@ class Gui(tk.Frame):
                 "external_browser": False,
                 "devtools": False
             },
-            "cache_path": "",  # disable
+            "cache_path": os.path.join(cfg.user_dir, "cef_cache"),  # keep ui assets between runs
             "ignore_certificate_errors": False,
             "downloads_enabled": False,
             "locale": "en-US",
@@ -110,7 +111,9 @@ class Gui(tk.Frame):
             "persist_user_preferences": False,
             "remote_debugging_port": -1,
             "product_version": f"Slipstream/{cfg.version}",  # user agent for the UI
-            "background_color": 0xff202225
+            "background_color": 0xff202225,
+            # CEF schedules its own message pump work, only implemented by cefpython on macOS
+            "external_message_pump": cfg.darwin
         }, switches={
             "no-proxy-server": "",  # avoid using ie set proxy, if they want to system-wide proxy, use vpn
             "allow-file-access-from-files": ""  # so we can use locally stored files for includes on main html file
@@ -18,8 +18,11 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import builtins as g
 import ctypes
+import functools
 import platform
+import time
 import tkinter as tk
 
 from cefpython3 import cefpython as cef
@@ -29,8 +32,35 @@ from pslipstream.gui.keyboard_handler import KeyboardHandler
 from pslipstream.gui.load_handler import LoadHandler
 
 
+# Mouse input goes to CEF's own window, never reaching tk or a CEF handler, so the page
+# tells about it itself, at most every WAKE_THROTTLE ms.
+WAKE_SCRIPT = """
+(function () {
+    if (window.pyWakeListening) return;
+    window.pyWakeListening = true;
+    var last = 0;
+    function wake() {
+        var now = Date.now();
+        if (now - last >= %(throttle)d) {
+            last = now;
+            window.pyWake();
+        }
+    }
+    ["pointermove", "pointerdown", "pointerup", "wheel", "touchstart", "touchmove"].forEach(function (type) {
+        window.addEventListener(type, wake, {capture: true, passive: true});
+    });
+})();
+"""
+
+
 class BrowserFrame(tk.Frame):
 
+    # interval of the CEF message pump in ms, doubling up to the max while the UI is idle
+    PUMP_MIN_INTERVAL = 10
+    PUMP_MAX_INTERVAL = 100
+    # min ms between wakes from pointer and wheel input of the page
+    WAKE_THROTTLE = 50
+
     def __init__(self, master, url, js_bindings, on_load=None, on_hot_key=None):
         self.js_bindings = js_bindings
         self.platform = platform.system()
@@ -39,6 +69,10 @@ class BrowserFrame(tk.Frame):
         self.on_hot_key = on_hot_key
         self.closing = False
         self.browser = None
+        self.active = True
+        self.pump_interval = self.PUMP_MIN_INTERVAL
+        self.pump_wakeups = 0
+        self.pump_started = None
         tk.Frame.__init__(self, master)
         self.bind("<FocusIn>", self.on_focus_in)
         self.bind("<FocusOut>", self.on_focus_out)
@@ -55,8 +89,9 @@ class BrowserFrame(tk.Frame):
             SWP_NO_MOVE = 0x0002  # ignore x, y params (don't move to 0, 0)
             ctypes.windll.user32.SetWindowPos(window_handle, insert_after_handle, 0, 0, 1300, 440, SWP_NO_MOVE)
         # Set Handlers
+        js_bindings_ = cef.JavascriptBindings(bindToFrames=False, bindToPopups=False)
+        js_bindings_.SetFunction("pyWake", self.wake)
         if self.js_bindings:
-            js_bindings_ = cef.JavascriptBindings(bindToFrames=False, bindToPopups=False)
             if "properties" in self.js_bindings:
                 for property_ in self.js_bindings["properties"]:
                     js_bindings_.SetProperty(property_["name"], property_["item"])
@@ -65,10 +100,14 @@ class BrowserFrame(tk.Frame):
                     js_bindings_.SetObject(object_["name"], object_["item"])
             if "functions" in self.js_bindings:
                 for function_ in self.js_bindings["functions"]:
-                    js_bindings_.SetFunction(function_["name"], function_["item"])
-            self.browser.SetJavascriptBindings(js_bindings_)
-        self.browser.SetClientHandler(KeyboardHandler())
-        self.browser.SetClientHandler(LoadHandler())
+                    js_bindings_.SetFunction(function_["name"], self.waking(function_["item"]))
+        self.browser.SetJavascriptBindings(js_bindings_)
+        self.browser.SetClientHandler(KeyboardHandler(on_activity=self.wake))
+        self.browser.SetClientHandler(LoadHandler(on_activity=self.wake, on_ready=self.on_page_ready))
+        # log entries and progress are pushed to the UI, which needs the pump to show them
+        g.LOG.add_listener(self.wake)
+        g.PROGRESS.add_listener(self.wake)
+        self.pump_started = (time.perf_counter(), time.process_time())
         self.message_loop_work()
 
     def get_window_handle(self):
@@ -92,10 +131,55 @@ class BrowserFrame(tk.Frame):
             raise exceptions.WindowHandleError()
 
     def message_loop_work(self):
+        """
+        Let CEF do its work, then schedule the next run. The pump runs every PUMP_MIN_INTERVAL
+        ms while there's UI activity, and backs off to PUMP_MAX_INTERVAL ms once it's idle, so
+        an idle UI doesn't keep waking the process (and taking the GIL from the backup).
+
+        cefpython only implements CEF's external message pump, where CEF schedules its own work,
+        on macOS, where it's enabled, see Gui. Everywhere, activity is noticed through wake(): tk
+        events, keyboard and load handlers, JS binding calls, pushed log entries and progress, and
+        the page's own pointer and wheel input, see WAKE_SCRIPT.
+        """
         cef.MessageLoopWork()
-        self.after(10, self.message_loop_work)
+        self.pump_wakeups += 1
+        if self.active:
+            self.active = False
+            self.pump_interval = self.PUMP_MIN_INTERVAL
+        else:
+            self.pump_interval = min(self.pump_interval * 2, self.PUMP_MAX_INTERVAL)
+        self.after(self.pump_interval, self.message_loop_work)
+
+    def wake(self, *_):
+        """Note UI activity, so the message pump runs at full speed again. Safe to call from any thread."""
+        self.active = True
+
+    def on_page_ready(self, browser):
+        """Have the page wake the message pump on pointer and wheel input, see WAKE_SCRIPT."""
+        browser.ExecuteJavascript(WAKE_SCRIPT % {"throttle": self.WAKE_THROTTLE})
+
+    def waking(self, f):
+        """Wrap a JS binding function so calling it counts as UI activity."""
+        @functools.wraps(f)
+        def wrapped_f(*args, **kwargs):
+            self.wake()
+            return f(*args, **kwargs)
+        return wrapped_f
+
+    def get_pump_stats(self):
+        """Get the wakeups of the message pump and the CPU time of the process since the browser was embedded."""
+        if not self.pump_started:
+            return None
+        seconds = time.perf_counter() - self.pump_started[0]
+        return {
+            "wakeups": self.pump_wakeups,
+            "seconds": seconds,
+            "wakeups_per_second": self.pump_wakeups / seconds if seconds else 0.0,
+            "cpu_seconds": time.process_time() - self.pump_started[1],
+        }
 
     def on_configure(self, _):
+        self.wake()
         if not self.browser:
             self.embed_browser()
 
@@ -113,6 +197,7 @@ class BrowserFrame(tk.Frame):
             self.browser.NotifyMoveOrResizeStarted()
 
     def on_focus_in(self, _):
+        self.wake()
         if self.browser:
             self.browser.SetFocus(True)
 
@@ -121,6 +206,15 @@ class BrowserFrame(tk.Frame):
             self.browser.SetFocus(False)
 
     def on_root_close(self):
+        if self.pump_started:
+            g.LOG.remove_listener(self.wake)
+            g.PROGRESS.remove_listener(self.wake)
+            if g.DBG:
+                stats = self.get_pump_stats()
+                g.LOG.write(
+                    f"Message pump: {stats['wakeups']:,} wakeups in {stats['seconds']:.0f}s "
+                    f"({stats['wakeups_per_second']:.1f}/s), process CPU time {stats['cpu_seconds']:.1f}s"
+                )
         if self.browser:
             self.browser.CloseBrowser(True)
             self.clear_browser_references()
@@ -23,8 +23,13 @@ class KeyboardHandler:
 
     # Important: Functions cannot be static!
 
+    def __init__(self, on_activity=None):
+        self.on_activity = on_activity
+
     def OnKeyEvent(self, browser, event, **_):
         """Called after the renderer and javascript in the page has had a chance to handle the event."""
+        if self.on_activity:
+            self.on_activity()
         if event["type"] == 3:
             # CTRL+SHIFT+I - Open Dev Tools
             if event["modifiers"] == 6 and event["native_key_code"] == 31:
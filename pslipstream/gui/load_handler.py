@@ -28,14 +28,20 @@ class LoadHandler:
 
     # Important: Functions cannot be static!
 
+    def __init__(self, on_activity=None, on_ready=None):
+        self.on_activity = on_activity
+        self.on_ready = on_ready
+
     def OnLoadingStateChange(self, browser, is_loading, **_):
         """Called when the loading state has changed."""
+        if self.on_activity:
+            self.on_activity()
         if browser.GetIdentifier() != 1:
             return  # this is a href hook, lets just pass
         if not is_loading:
             # browser dom ready
-            # ...
-            pass
+            if self.on_ready:
+                self.on_ready(browser)
 
     def OnLoadStart(self, browser, frame):
         """Called when loading starts."""
@@ -23,30 +23,37 @@ Various small simple helper functions to do a quick task while not
 being specific enough to be in a class.
 """
 import builtins as g
+import ctypes
+import functools
 import queue
 import subprocess
 import threading
 
 import pslipstream.cfg as cfg
 from pycdlib import PyCdlib
+from pycdlib.pycdlibexception import PyCdlibException
+
+from pslipstream.udf import SECTOR_SIZE, Udf, UdfError
 
 if cfg.windows:
     from win32 import win32api, win32file
 
 
-def list_devices():
+def list_devices(probe=True):
     """
     Lists all devices provided by lsscsi
+
+    Each device is probed for the label of the disc inserted, unless probe is False,
+    in which case the label is None.
     """
     if cfg.windows:
         drives = [
             rf"\\.\{d[:-1]}" for d in win32api.GetLogicalDriveStrings().split('\x00')[:-1]
             if win32file.GetDriveType(d) == win32file.DRIVE_CDROM
         ]
-        print(drives)
         drives = [{
             "loc": d,
-            "volid": get_volume_id(d)
+            "volid": get_volume_id(d) if probe else None
         } for d in drives]
         return drives
     if cfg.linux:
@@ -60,7 +67,7 @@ def list_devices():
             "model": " ".join([scsi[2]] if len(scsi) == 5 else scsi[2:(len(scsi) - 2)]),
             "fwver": scsi[-2],
             "loc": scsi[-1],
-            "volid": get_volume_id(scsi[-1])
+            "volid": get_volume_id(scsi[-1]) if probe else None
         } for scsi in lsscsi if scsi[0] not in ["disk"]]
         return lsscsi
 
@@ -86,11 +93,46 @@ def get_volume_id(device):
             g.LOG.write(f"Device {device} had an I/O error.")
             return "! Error occurred reading disc..."
         raise
+    except PyCdlibException:
+        # no ISO9660 file system, the disc may be UDF only
+        try:
+            volume_id = get_udf_volume_id(device)
+        except (OSError, UdfError) as e:
+            g.LOG.write(f"Device {device} has no readable file system: {e}")
+            return "! Error occurred reading disc..."
+        g.LOG.write(f"Device {device} has UDF disc labeled \"{volume_id}\".")
+        return volume_id
     volume_id = cdlib.pvds[0].volume_identifier.decode().strip()
+    cdlib.close()
     g.LOG.write(f"Device {device} has disc labeled \"{volume_id}\".")
     return volume_id
 
 
+def get_udf_volume_id(device):
+    """Get the Volume Identifier of a disc's UDF file system, reading the device directly."""
+    with open(device, "rb") as f:
+        def read(lba, sectors):
+            f.seek(lba * SECTOR_SIZE)
+            return f.read(sectors * SECTOR_SIZE)
+
+        return Udf(read).volume_id
+
+
+def get_dvdcss_read(dvdcss):
+    """
+    Get libdvdcss's dvdcss_read() to read into our own buffers with the handle a pydvdcss
+    DvdCss opened, or None if this pydvdcss version doesn't expose its library and handle.
+    """
+    library = getattr(dvdcss, "dvdcss", None)
+    if not getattr(dvdcss, "handle", None) or not hasattr(library, "dvdcss_read"):
+        return None
+    # a function object of our own, so pydvdcss's argtypes are left alone
+    read = ctypes.CDLL(library._name).dvdcss_read
+    read.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+    read.restype = ctypes.c_int
+    return read
+
+
 def get_device_list(js):
     js.Call(sorted(list_devices(), key=lambda d: d["volid"] or "", reverse=True))
 
@@ -120,7 +162,8 @@ def asynchronous(f, daemon=True, auto_start=False):
         t.result_queue = q
         return t
 
-    return wrap
+    # keep the name and docstring, and the plain function as `__wrapped__` for synchronous use
+    return functools.wraps(f)(wrap)
 
 
 def asynchronous_auto(f):
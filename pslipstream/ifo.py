@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Parser of the parts of VTS IFO files needed to locate content on the disc,
+the Program Chains (PGCs) with their programs (chapters) and cells, and the
+chapters (PTTs) of each title. Everything is big-endian, offsets are as in
+the DVD-Video specification.
+"""
+
+import struct
+
+SECTOR_SIZE = 2048
+
+
+class Cell:
+    """A cell of a PGC, the smallest playable unit, with its sectors relative to the title VOBs."""
+
+    def __init__(self, number, vob_id, cell_id, first_sector, last_sector, block_type):
+        self.number = number
+        self.vob_id = vob_id
+        self.cell_id = cell_id
+        self.first_sector = first_sector
+        self.last_sector = last_sector
+        self.block_type = block_type  # 0 = normal, 1 = angle block
+
+    @property
+    def sectors(self):
+        return self.last_sector - self.first_sector + 1
+
+    def __repr__(self):
+        return f"Cell({self.number}, vob_id={self.vob_id}, cell_id={self.cell_id}, " \
+               f"sectors={self.first_sector}-{self.last_sector})"
+
+
+class Pgc:
+    """A Program Chain, a list of cells grouped into programs (chapters)."""
+
+    def __init__(self, number, programs, cells):
+        self.number = number
+        self.programs = programs  # entry cell number of every program
+        self.cells = cells
+
+    def get_program_cells(self, program):
+        """Get the cells of a program (1-based), from its entry cell up to the next program's."""
+        if not 1 <= program <= len(self.programs):
+            raise ValueError(f"PGC {self.number} has no program {program}, it has {len(self.programs)}.")
+        first = self.programs[program - 1]
+        last = self.programs[program] - 1 if program < len(self.programs) else len(self.cells)
+        return self.cells[first - 1:last]
+
+
+class VtsIfo:
+    """
+    A parsed VTS_XX_0.IFO file.
+
+    `lba` is the location of the IFO file on the disc, which the locations of
+    the title VOBs, and in turn every cell, are relative to.
+    """
+
+    def __init__(self, vts, data, lba):
+        if data[:12] != b"DVDVIDEO-VTS":
+            raise ValueError(f"VTS {vts} IFO is not a valid VTS IFO file.")
+        self.vts = vts
+        self.lba = lba
+        self.data = data
+        self.title_vobs_lba = lba + self.u32(0xC4)
+        self.pgcs = self._parse_pgcs(self.u32(0xCC) * SECTOR_SIZE)
+        self.chapters = self._parse_chapters(self.u32(0xC8) * SECTOR_SIZE)
+
+    def u8(self, offset):
+        return self.data[offset]
+
+    def u16(self, offset):
+        return struct.unpack_from(">H", self.data, offset)[0]
+
+    def u32(self, offset):
+        return struct.unpack_from(">I", self.data, offset)[0]
+
+    def get_pgc(self, pgc):
+        if not 1 <= pgc <= len(self.pgcs):
+            raise ValueError(f"VTS {self.vts} has no PGC {pgc}, it has {len(self.pgcs)}.")
+        return self.pgcs[pgc - 1]
+
+    def get_extents(self, selection):
+        """Get the (lba, sectors) extents of a Selection on the disc, in playback order."""
+        pgc = self.get_pgc(selection.pgc)
+        if selection.cell is not None:
+            if not 1 <= selection.cell <= len(pgc.cells):
+                raise ValueError(f"PGC {pgc.number} has no cell {selection.cell}, it has {len(pgc.cells)}.")
+            cells = [pgc.cells[selection.cell - 1]]
+        elif selection.chapter is not None:
+            cells = pgc.get_program_cells(selection.chapter)
+        else:
+            cells = pgc.cells
+        return [(self.title_vobs_lba + cell.first_sector, cell.sectors) for cell in cells]
+
+    def _parse_pgcs(self, table):
+        pgcs = []
+        for i in range(self.u16(table)):
+            pgc = table + self.u32(table + 8 + i * 8 + 4)
+            program_count = self.u8(pgc + 2)
+            cell_count = self.u8(pgc + 3)
+            program_map = pgc + self.u16(pgc + 0xE6)
+            playback = pgc + self.u16(pgc + 0xE8)
+            position = pgc + self.u16(pgc + 0xEA)
+            cells = []
+            for c in range(cell_count if self.u16(pgc + 0xE8) else 0):
+                entry = playback + c * 24
+                cells.append(Cell(
+                    number=c + 1,
+                    vob_id=self.u16(position + c * 4),
+                    cell_id=self.u8(position + c * 4 + 3),
+                    first_sector=self.u32(entry + 0x08),
+                    last_sector=self.u32(entry + 0x14),
+                    block_type=(self.u8(entry) >> 4) & 0x3
+                ))
+            programs = [self.u8(program_map + p) for p in range(program_count)]
+            pgcs.append(Pgc(i + 1, programs, cells))
+        return pgcs
+
+    def _parse_chapters(self, table):
+        """Get the (pgc, program) of every chapter of every title of the VTS."""
+        titles = self.u16(table)
+        end = table + self.u32(table + 4) + 1
+        offsets = [table + self.u32(table + 8 + i * 4) for i in range(titles)] + [end]
+        return [
+            [(self.u16(ptt), self.u16(ptt + 2)) for ptt in range(offsets[i], offsets[i + 1], 4)]
+            for i in range(titles)
+        ]
+
+
+class Selection:
+    """
+    A selection of content of a VTS to extract, a single cell, a single chapter
+    (program), or if neither is set, a whole PGC. Numbers are 1-based as on the disc.
+    """
+
+    def __init__(self, vts, pgc, cell=None, chapter=None):
+        if cell is not None and chapter is not None:
+            raise ValueError("A selection is either of a cell or of a chapter, not both.")
+        self.vts = vts
+        self.pgc = pgc
+        self.cell = cell
+        self.chapter = chapter
+
+    @classmethod
+    def parse(cls, text):
+        """Parse `VTS:PGC`, `VTS:PGC:CELL`, or `VTS:PGC:chCHAPTER`, e.g. `1:1:3` or `1:1:ch2`."""
+        parts = text.lower().split(":")
+        if len(parts) not in (2, 3) or not all(parts):
+            raise ValueError(f"Invalid selection {text}, expected VTS:PGC, VTS:PGC:CELL, or VTS:PGC:chCHAPTER.")
+        selection = cls(int(parts[0]), int(parts[1]))
+        if len(parts) == 3:
+            if parts[2].startswith("ch"):
+                selection.chapter = int(parts[2][2:])
+            else:
+                selection.cell = int(parts[2])
+        return selection
+
+    def __str__(self):
+        name = f"VTS_{self.vts:02}_PGC_{self.pgc:02}"
+        if self.cell is not None:
+            name += f"_CELL_{self.cell:02}"
+        if self.chapter is not None:
+            name += f"_CH_{self.chapter:02}"
+        return name
+
+
+def merge_extents(extents):
+    """Merge (lba, sectors) extents into the smallest sorted list of contiguous, non-overlapping runs."""
+    runs = []
+    for lba, sectors in sorted(extents):
+        if sectors <= 0:
+            continue
+        if runs and lba <= runs[-1][0] + runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], lba + sectors - runs[-1][0])
+        else:
+            runs.append([lba, sectors])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Registry of which process and job own each drive, across every Slipstream
+process of the user. Ownership is an advisory lock on a file per device in
+the user directory, holding the owner's details. The OS drops the lock when
+its process dies, so a crashed job never leaves a drive locked.
+"""
+
+import builtins as g
+import hashlib
+import json
+import os
+import re
+import socket
+import time
+
+from appdirs import user_data_dir
+
+import pslipstream.cfg as cfg
+from pslipstream.exceptions import SlipstreamDiscInUse
+
+if cfg.windows:
+    import msvcrt
+else:
+    import fcntl
+
+# msvcrt locks a byte range, lock one far past the owner details so they stay readable
+LOCK_OFFSET = 1 << 30
+
+
+def get_lock_directory():
+    return os.path.join(cfg.user_dir or user_data_dir(cfg.title_pkg, cfg.author), "locks")
+
+
+def get_lock_path(device, directory=None):
+    """Get the lock file of a device. Symlinks like /dev/cdrom share the lock of their target."""
+    if not cfg.windows:
+        device = os.path.realpath(device)
+    slug = re.sub(r"[^\w.-]+", "_", device).strip("_")[-60:]
+    digest = hashlib.sha1(device.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(directory or get_lock_directory(), f"{slug}-{digest}.lock")
+
+
+def try_lock(f):
+    try:
+        if cfg.windows:
+            f.seek(LOCK_OFFSET)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def unlock(f):
+    if cfg.windows:
+        f.seek(LOCK_OFFSET)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_owner(path):
+    """Read the owner details of a lock file, or None if there are none (yet)."""
+    try:
+        with open(path, "rt", encoding="utf-8") as f:
+            return json.loads(f.read(4096) or "null")
+    except (OSError, ValueError):
+        return None
+
+
+def describe_owner(owner):
+    if not owner:
+        return "another process"
+    job = f", {owner['job']}" if owner.get("job") else ""
+    since = time.strftime("%H:%M:%S", time.localtime(owner["since"]))
+    return f"pid {owner['pid']} on {owner['host']}{job}, since {since}"
+
+
+def get_owners(directory=None):
+    """Get the owner details of every drive currently owned, by device."""
+    directory = directory or get_lock_directory()
+    owners = {}
+    if not os.path.isdir(directory):
+        return owners
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(".lock"):
+            continue
+        with open(path, "a+b") as f:
+            if try_lock(f):
+                unlock(f)
+                continue
+        owner = read_owner(path)
+        if owner:
+            owners[owner["device"]] = owner
+    return owners
+
+
+class DeviceLock:
+    """
+    Ownership of a drive (or image file), exclusive across processes and DeviceLock instances.
+
+    The owner details, pid, host, device, job, and since, are written to the lock
+    file for others to see who they're waiting on. Use it as a context manager to
+    acquire it without waiting, or call acquire() with a timeout.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, device, job=None, directory=None):
+        self.device = device
+        self.job = job
+        self.path = get_lock_path(device, directory)
+        self.since = None
+        self.f = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+    @property
+    def owned(self):
+        return self.f is not None
+
+    def acquire(self, timeout=0):
+        """
+        Take ownership of the device, waiting up to `timeout` seconds (None waits forever)
+        for its current owner to release it.
+
+        Raises SlipstreamDiscInUse if it's still owned by someone else after the timeout.
+        """
+        if self.f:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, "a+b")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting = False
+        while not try_lock(f):
+            owner = describe_owner(read_owner(self.path))
+            if deadline is not None and time.monotonic() >= deadline:
+                f.close()
+                raise SlipstreamDiscInUse(f"{self.device} is in use by {owner}.")
+            if not waiting:
+                g.LOG.write(f"{self.device} is in use by {owner}, waiting for it...")
+                waiting = True
+            time.sleep(self.POLL_INTERVAL)
+        self.f = f
+        self.since = time.time()
+        self.write_owner()
+        if waiting:
+            g.LOG.write(f"{self.device} is free, continuing...")
+
+    def release(self):
+        if not self.f:
+            return
+        try:
+            self.f.seek(0)
+            self.f.truncate()
+            self.f.flush()
+            unlock(self.f)
+        finally:
+            self.f.close()
+            self.f = None
+
+    def set_job(self, job):
+        """Update the job the device is used for, None when idle."""
+        self.job = job
+        if self.f:
+            self.write_owner()
+
+    def write_owner(self):
+        owner = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "device": self.device,
+            "job": self.job,
+            "since": self.since,
+        }
+        self.f.seek(0)
+        self.f.truncate()
+        self.f.write(json.dumps(owner).encode("utf-8"))
+        self.f.flush()
@@ -1,8 +1,16 @@
+import builtins as g
+import sys
+
+
 class Log:
-    def __init__(self):
+    def __init__(self, stream=None):
         self.entries = []
         self.js = None
+        self.listeners = []
         self.max_entries = 100
+        self.batched = False  # the UI gets entries from the EventChannel instead of the callback
+        # where entries are echoed to, use sys.stderr when stdout carries data
+        self.stream = stream or sys.stdout
 
     def set_js(self, js):
         """
@@ -14,15 +22,25 @@ class Log:
         self.js = js
         self.read_all()
 
+    def add_listener(self, callback):
+        """Call callback with every entry written from now on, from whichever thread wrote it."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
     def write(self, entry, echo=True):
         self.entries.append(entry)
         while len(self.entries) > self.max_entries:
             self.entries.pop(0)
         if echo:
-            print(entry.strip())
-        if self.js:
+            print(entry.strip(), file=self.stream)
+        for listener in self.listeners:
+            listener(entry)
+        if self.js and not self.batched:
             # update js log
-            self.read_all()
+            with g.PROFILER.phase("log.js"):
+                self.read_all()
 
     def read_all(self):
         entries = "\n".join(self.entries).strip()
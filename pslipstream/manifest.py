@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Hash manifests of images, with a digest per fixed-size block and per VOB file
+besides the whole image, so a difference can be narrowed down to where it is.
+Two images of a disc are compared by their manifests alone, and an image is
+verified by reading only the blocks in question.
+
+The digest of the whole image is the digest of its block digests, so the image
+is only hashed once. Manifests of version 1 had a separate digest of the image
+bytes, theirs is worked out from the blocks on load.
+
+Manifest file, little-endian:
+
+    magic        4s   b"SLMF"
+    version      u8   2
+    digest_size  u8   bytes per digest, BLAKE2b
+    reserved     u16  0
+    block_size   u32  bytes per block, the last block may be shorter
+    size         u64  bytes in the image
+    block_count  u32
+    file_count   u32
+    volume_id    u16 byte length and UTF-8
+    digest            of the whole image
+    blocks            `block_count` digests
+    files             `file_count` times: u32 first_lba, u32 sectors, u16 name length, UTF-8 name, digest
+"""
+
+import builtins as g
+import hashlib
+import struct
+
+from pslipstream.sinks import Sink
+
+MAGIC = b"SLMF"
+VERSION = 2
+HEADER = struct.Struct("<4sBBHIQII")
+FILE = struct.Struct("<IIH")
+SECTOR_SIZE = 2048
+
+
+def new_hash(digest_size):
+    return hashlib.blake2b(digest_size=digest_size)
+
+
+def hash_blocks(blocks, digest_size):
+    """Get the digest of a whole image from the digests of its blocks."""
+    h = new_hash(digest_size)
+    for block in blocks:
+        h.update(block)
+    return h.digest()
+
+
+class ManifestFile:
+    """A file of the image, its sectors, and its digest."""
+
+    def __init__(self, name, first_lba, sectors, digest=None):
+        self.name = name
+        self.first_lba = first_lba
+        self.sectors = sectors
+        self.digest = digest
+
+    def __repr__(self):
+        return f"ManifestFile({self.name!r}, {self.first_lba}, {self.sectors})"
+
+
+class Manifest:
+    """
+    Digests of an image, whole, per block of block_size bytes, and per file.
+    Created while streaming with a ManifestSink, or from an image with from_image().
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+    DIGEST_SIZE = 16
+
+    def __init__(self, volume_id=None, size=0, block_size=BLOCK_SIZE, digest_size=DIGEST_SIZE):
+        self.volume_id = volume_id
+        self.size = size
+        self.block_size = block_size
+        self.digest_size = digest_size
+        self.digest = None
+        self.blocks = []
+        self.files = []
+
+    def get_block_range(self, index):
+        """Get the (offset, length) in bytes of a block."""
+        offset = index * self.block_size
+        return offset, min(self.block_size, self.size - offset)
+
+    def get_file_blocks(self, file):
+        """Get the indexes of the blocks a file is in."""
+        first = file.first_lba * SECTOR_SIZE // self.block_size
+        last = max((file.first_lba + file.sectors) * SECTOR_SIZE - 1, 0) // self.block_size
+        return range(first, min(last + 1, len(self.blocks)))
+
+    def save(self, path):
+        volume_id = (self.volume_id or "").encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(
+                MAGIC, VERSION, self.digest_size, 0, self.block_size, self.size, len(self.blocks), len(self.files)
+            ))
+            f.write(struct.pack("<H", len(volume_id)) + volume_id)
+            f.write(self.digest)
+            f.write(b"".join(self.blocks))
+            for file in self.files:
+                name = file.name.encode("utf-8")
+                f.write(FILE.pack(file.first_lba, file.sectors, len(name)) + name + file.digest)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, digest_size, _, block_size, size, block_count, file_count = HEADER.unpack_from(data)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a v1 or v{VERSION} Slipstream manifest")
+        manifest = cls(None, size, block_size, digest_size)
+        offset = HEADER.size
+        length = struct.unpack_from("<H", data, offset)[0]
+        manifest.volume_id = data[offset + 2:offset + 2 + length].decode("utf-8") or None
+        offset += 2 + length
+        manifest.digest = data[offset:offset + digest_size]
+        offset += digest_size
+        end = offset + block_count * digest_size
+        manifest.blocks = [data[i:i + digest_size] for i in range(offset, end, digest_size)]
+        if version == 1:
+            manifest.digest = hash_blocks(manifest.blocks, digest_size)
+        offset = end
+        for _ in range(file_count):
+            first_lba, sectors, length = FILE.unpack_from(data, offset)
+            offset += FILE.size
+            name = data[offset:offset + length].decode("utf-8")
+            offset += length
+            manifest.files.append(ManifestFile(name, first_lba, sectors, data[offset:offset + digest_size]))
+            offset += digest_size
+        return manifest
+
+    @classmethod
+    def from_image(cls, path, files=(), volume_id=None, block_size=BLOCK_SIZE, digest_size=DIGEST_SIZE,
+                   read_size=8 * 1024 * 1024):
+        """Create the manifest of an existing image file, with files as `(name, first_lba, sectors)`."""
+        sink = ManifestSink(None, files, volume_id, block_size, digest_size)
+        buffer = bytearray(read_size)
+        view = memoryview(buffer)
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                sink.write(view[:read])
+        sink.close()
+        return sink.manifest
+
+
+class ManifestSink(Sink):
+    """
+    Create a Manifest of the stream as it passes by, saved to path on close.
+
+    Files are `(name, first_lba, sectors)`, e.g. the VOBs from Dvd.get_vob_sets(),
+    and may not overlap.
+    """
+
+    CPU = True
+
+    def __init__(self, path, files=(), volume_id=None, block_size=Manifest.BLOCK_SIZE,
+                 digest_size=Manifest.DIGEST_SIZE):
+        super().__init__(path or "manifest")
+        self.path = path
+        self.manifest = Manifest(volume_id, 0, block_size, digest_size)
+        self.manifest.files = sorted(
+            (ManifestFile(name, lba, sectors) for name, lba, sectors in files), key=lambda file: file.first_lba
+        )
+        self.block = new_hash(digest_size)
+        self.block_left = block_size
+        self.file_index = 0
+        self.file_hash = None
+
+    def write(self, data):
+        view = memoryview(data)
+        self._hash_blocks(view)
+        self._hash_files(view)
+        self.written += len(view)
+
+    def _hash_blocks(self, view):
+        manifest = self.manifest
+        while view:
+            part = view[:self.block_left]
+            self.block.update(part)
+            self.block_left -= len(part)
+            view = view[len(part):]
+            if not self.block_left:
+                manifest.blocks.append(self.block.digest())
+                self.block = new_hash(manifest.digest_size)
+                self.block_left = manifest.block_size
+
+    def _hash_files(self, view):
+        files = self.manifest.files
+        start = self.written
+        end = start + len(view)
+        while self.file_index < len(files):
+            file = files[self.file_index]
+            file_start = file.first_lba * SECTOR_SIZE
+            file_end = file_start + file.sectors * SECTOR_SIZE
+            if file_start >= end:
+                break
+            if file_end > start:
+                if self.file_hash is None:
+                    self.file_hash = new_hash(self.manifest.digest_size)
+                self.file_hash.update(view[max(file_start, start) - start:min(file_end, end) - start])
+            if file_end > end:
+                break
+            if self.file_hash is not None:
+                file.digest = self.file_hash.digest()
+                self.file_hash = None
+            self.file_index += 1
+
+    def close(self):
+        manifest = self.manifest
+        if self.block_left != manifest.block_size:
+            manifest.blocks.append(self.block.digest())
+        manifest.size = self.written
+        manifest.digest = hash_blocks(manifest.blocks, manifest.digest_size)
+        # files cut short by the end of the stream get the digest of what there was
+        if self.file_hash is not None:
+            manifest.files[self.file_index].digest = self.file_hash.digest()
+        for file in manifest.files:
+            if file.digest is None:
+                file.digest = new_hash(manifest.digest_size).digest()
+        if self.path:
+            manifest.save(self.path)
+            g.LOG.write(f"Saved manifest of {len(manifest.blocks):,} blocks and {len(manifest.files)} files "
+                        f"to \"{self.path}\"")
+
+
+def merge_block_ranges(manifest, indexes):
+    """Merge block indexes into (offset, length) byte ranges."""
+    ranges = []
+    for index in sorted(indexes):
+        offset, length = manifest.get_block_range(index)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+def compare(a, b):
+    """
+    Compare two manifests of images of the same disc, without reading the images.
+
+    Returns a dictionary of whether they're `identical`, the differing `blocks` indexes,
+    the `files` of both whose digests differ, the files `missing` from either one, and the
+    byte `ranges` of the differing blocks. A size difference counts the blocks past the end
+    of the smaller one as differing.
+
+    Raises ValueError if the manifests have different block or digest sizes.
+    """
+    if (a.block_size, a.digest_size) != (b.block_size, b.digest_size):
+        raise ValueError("The manifests have different block or digest sizes and can't be compared")
+    count = max(len(a.blocks), len(b.blocks))
+    blocks = [
+        i for i in range(count)
+        if i >= len(a.blocks) or i >= len(b.blocks) or a.blocks[i] != b.blocks[i]
+    ]
+    a_files = {(file.name, file.first_lba, file.sectors): file.digest for file in a.files}
+    b_files = {(file.name, file.first_lba, file.sectors): file.digest for file in b.files}
+    # only files of both can be told apart, e.g. a manifest of a raw image has none
+    files = [key[0] for key, digest in a_files.items() if key in b_files and b_files[key] != digest]
+    missing = [key[0] for key in a_files if key not in b_files] + [key[0] for key in b_files if key not in a_files]
+    larger = a if a.size >= b.size else b
+    return {
+        "identical": a.size == b.size and a.digest == b.digest,
+        "blocks": blocks,
+        "files": files,
+        "missing": missing,
+        "ranges": merge_block_ranges(larger, blocks),
+    }
+
+
+def verify(manifest, path, blocks=None):
+    """
+    Check blocks of an image file against its manifest, reading only those blocks,
+    or every block if none are given. Use Manifest.get_file_blocks() to check files.
+
+    Returns the indexes of the blocks that don't match.
+    """
+    bad = []
+    buffer = bytearray(manifest.block_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        for index in (range(len(manifest.blocks)) if blocks is None else blocks):
+            offset, length = manifest.get_block_range(index)
+            f.seek(offset)
+            read = f.readinto(view[:length])
+            h = new_hash(manifest.digest_size)
+            h.update(view[:read])
+            if read != length or h.digest() != manifest.blocks[index]:
+                bad.append(index)
+    return bad
+
+
+def format_comparison(comparison, manifest):
+    """Format a comparison as text, with a line per differing range and file."""
+    if comparison["identical"]:
+        return "The images are identical."
+    lines = [
+        f"{len(comparison['blocks']):,} of {len(manifest.blocks):,} blocks ({manifest.block_size:,} B each) differ:"
+    ]
+    for offset, length in comparison["ranges"]:
+        lines.append(f"  bytes {offset:,}+{length:,} (sectors {offset // SECTOR_SIZE:,}+{length // SECTOR_SIZE:,})")
+    if comparison["files"]:
+        lines.append("Differing files: " + ", ".join(comparison["files"]))
+    if comparison["missing"]:
+        lines.append("Not in the other manifest: " + ", ".join(comparison["missing"]))
+    return "\n".join(lines)
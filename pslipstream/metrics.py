@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Prometheus-style metrics of every device, exported over HTTP or as a file
+for node_exporter's textfile collector. The read loop only ever bumps plain
+counters, everything else (rates, queue depths) is worked out when scraped.
+"""
+
+import builtins as g
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from pslipstream.server import ThreadingHTTPServer
+
+
+class DeviceMetrics:
+    """Counters and gauges of a single device."""
+
+    def __init__(self, device):
+        self.device = device
+        self.sectors_read = 0
+        self.seeks = 0
+        self.read_errors = 0
+        self.key_crack_seconds = 0.0
+        self.active_jobs = 0
+        self.progress = 0.0
+        self.tees = []  # outputs of the running job, to get the queue depth from
+        self.sampled = (time.perf_counter(), 0)
+        self.rate = 0.0
+
+    def queue_depth(self):
+        return sum(worker.queue.qsize() for tee in self.tees for worker in tee.workers)
+
+    def read_rate(self, sector_size):
+        """Get the current read speed in bytes per second, averaged over at least a second."""
+        now, sectors = time.perf_counter(), self.sectors_read
+        last_time, last_sectors = self.sampled
+        if now - last_time >= 1:
+            self.rate = (sectors - last_sectors) * sector_size / (now - last_time)
+            self.sampled = (now, sectors)
+        return self.rate
+
+
+class Metrics:
+    """Registry of DeviceMetrics, rendering them in the Prometheus text exposition format."""
+
+    SECTOR_SIZE = 2048
+
+    def __init__(self):
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    def device(self, device):
+        """Get the metrics of a device, creating them on first use."""
+        with self.lock:
+            if device not in self.devices:
+                self.devices[device] = DeviceMetrics(device)
+            return self.devices[device]
+
+    def render(self):
+        """Render every metric of every device as Prometheus text."""
+        with self.lock:
+            devices = list(self.devices.values())
+        metrics = [
+            ("read_bytes_total", "counter", "Bytes read from the device.",
+             lambda m: m.sectors_read * self.SECTOR_SIZE),
+            ("read_sectors_total", "counter", "Sectors read from the device.", lambda m: m.sectors_read),
+            ("read_bytes_per_second", "gauge", "Current read speed.", lambda m: m.read_rate(self.SECTOR_SIZE)),
+            ("seeks_total", "counter", "Seeks done on the device.", lambda m: m.seeks),
+            ("read_errors_total", "counter", "Failed seeks and reads.", lambda m: m.read_errors),
+            ("key_crack_seconds_total", "counter", "Time spent cracking CSS title keys.",
+             lambda m: m.key_crack_seconds),
+            ("active_jobs", "gauge", "Jobs currently using the device.", lambda m: m.active_jobs),
+            ("queue_depth", "gauge", "Blocks waiting in the output queues of the running job.",
+             lambda m: m.queue_depth()),
+            ("progress_percent", "gauge", "Progress of the running job.", lambda m: m.progress),
+        ]
+        lines = []
+        for name, kind, description, get in metrics:
+            lines.append(f"# HELP slipstream_{name} {description}")
+            lines.append(f"# TYPE slipstream_{name} {kind}")
+            for m in devices:
+                lines.append(f'slipstream_{name}{{device="{escape_label(m.device)}"}} {get(m)}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host="127.0.0.1", port=9842):
+        """Serve the metrics at http://host:port/metrics from a background thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    return self.send_error(404)
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass  # scrapes every few seconds would flood the log
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.httpd.serve_forever, name="Metrics", daemon=True).start()
+
+    def write_textfile(self, path, interval=5):
+        """
+        Write the metrics to a textfile collector file every interval seconds from a background thread.
+        Failed writes, e.g. on a full disk, are logged once and retried on the next interval.
+        """
+        def loop():
+            failing = False
+            while True:
+                tmp_path = f"{path}.tmp"
+                try:
+                    with open(tmp_path, "wt", encoding="utf-8") as f:
+                        f.write(self.render())
+                    # the collector must never see a half-written file
+                    os.replace(tmp_path, path)
+                    if failing:
+                        g.LOG.write(f"Writing metrics to \"{path}\" works again")
+                    failing = False
+                except OSError as e:
+                    if not failing:
+                        g.LOG.write(f"Unable to write metrics to \"{path}\", retrying every {interval}s: {e}")
+                    failing = True
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="MetricsFile", daemon=True).start()
+
+
+def escape_label(value):
+    """Escape a label value as required by the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Instrumentation of the hot paths, used to find out where the time of a
+slow job goes. Profiles are saved in the Chrome trace-event format, so they
+can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+# time.thread_time is only available on Python 3.7+
+thread_time = getattr(time, "thread_time", time.process_time)
+
+
+class NullPhase:
+    """Phase used while profiling is disabled, does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase:
+    """Times a single run of a phase, both wall and CPU time of the current thread."""
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.wall = 0
+        self.cpu = 0
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = thread_time()
+        return self
+
+    def __exit__(self, *_):
+        self.profiler.record(self.name, self.wall, time.perf_counter() - self.wall, thread_time() - self.cpu, self.args)
+        return False
+
+
+class Profiler:
+    """
+    Records per-phase wall and CPU time, counters, and histograms of a job.
+
+    Every method returns immediately while disabled, so hot paths can stay
+    instrumented at all times at next to no cost. Call start() when a job
+    starts, and finish() once it's done to save its trace. Jobs may overlap,
+    e.g. on two drives, the recording only starts over once none is running.
+    The trace of each then has only the events from while it ran, but its
+    summary totals also count those of the jobs running alongside it.
+    """
+
+    def __init__(self, enabled=False, path="{job}.trace.json", max_events=250000):
+        self.enabled = enabled
+        self.path = path
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.started = 0
+        self.events = []
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+        self.jobs = 0  # jobs started and not yet finished
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def start(self):
+        """
+        Record the start of a job, starting over if no other job is running.
+        Returns the time it started to pass to finish(), or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            if not self.jobs:
+                self._clear()
+            self.jobs += 1
+            return time.perf_counter()
+
+    def phase(self, name, **args):
+        """Get a context manager timing the code within it as a run of the named phase."""
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name, args)
+
+    def record(self, name, start, wall, cpu, args=None):
+        """Record a run of a phase that started at `start` (perf_counter) and took `wall` seconds."""
+        if not self.enabled:
+            return
+        with self.lock:
+            phase = self.phases.setdefault(name, [0, 0.0, 0.0])
+            phase[0] += 1
+            phase[1] += wall
+            phase[2] += cpu
+            if len(self.events) < self.max_events:
+                self.events.append({
+                    "name": name,
+                    "cat": "slipstream",
+                    "ph": "X",
+                    "ts": (start - self.started) * 1e6,
+                    "dur": wall * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": dict(args or {}, cpu_ms=cpu * 1e3)
+                })
+
+    def count(self, name, value=1):
+        """Add to a counter, e.g. the amount of seeks."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Add a value to a histogram with power-of-two buckets, e.g. read sizes."""
+        if not self.enabled:
+            return
+        bucket = 1 << max(int(value) - 1, 0).bit_length()
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    def summary(self):
+        """Get the totals of everything recorded as a dictionary."""
+        with self.lock:
+            return {
+                "elapsed": time.perf_counter() - self.started,
+                "phases": {
+                    name: {"count": count, "wall": wall, "cpu": cpu}
+                    for name, (count, wall, cpu) in sorted(self.phases.items(), key=lambda p: -p[1][1])
+                },
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: {f"<={bucket}": count for bucket, count in sorted(histogram.items())}
+                    for name, histogram in self.histograms.items()
+                },
+                "dropped_events": max(sum(p[0] for p in self.phases.values()) - len(self.events), 0)
+            }
+
+    def save(self, path, since=None):
+        """
+        Save everything recorded, or only the events from `since` (perf_counter) on, as a
+        Chrome trace-event JSON file, with the summary as metadata.
+        """
+        summary = self.summary()
+        with self.lock:
+            first = ((since or self.started) - self.started) * 1e6
+            events = [event for event in self.events if event["ts"] >= first]
+        with open(path, "wt", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": summary}, f)
+
+    def finish(self, job, since=None):
+        """
+        Save the trace of a finished job to `path`, formatted with the job name, made safe
+        for file names, and the time. `since` is what start() returned for the job. Starts
+        over for the next job unless other jobs are still running.
+        Returns the path saved to, or None if disabled.
+        """
+        if not self.enabled:
+            return None
+        job = re.sub(r"[^\w.-]+", "_", job).strip("_")
+        path = self.path.format(job=job, time=datetime.now().strftime("%Y%m%d-%H%M%S"))
+        try:
+            self.save(path, since)
+        finally:
+            with self.lock:
+                self.jobs = max(self.jobs - 1, 0)
+                if not self.jobs:
+                    self._clear()
+        return path
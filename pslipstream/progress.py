@@ -2,7 +2,27 @@ class Progress:
     def __init__(self):
         self.progress = 0
         self.c = None
+        self.listeners = []
+        self.batched = False  # the UI gets progress from the EventChannel instead of the callback
 
     def set_c(self, js):
         # todo ; rename function to set_js_callback to be more descriptive
         self.c = js
+
+    def add_listener(self, callback):
+        """Call callback with every (progress, device) update from now on, from whichever thread set it."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def set(self, progress, device=None):
+        """
+        Update the progress percentage, forwarding it to the GUI if a callback is set,
+        unless it's batched. The device it's the progress of is only passed on to listeners.
+        """
+        self.progress = progress
+        if self.c and not self.batched:
+            self.c.Call(progress)
+        for listener in self.listeners:
+            listener(progress, device)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Read scheduling by disc region. A disc is split into regions by its file
+system, IFOs, menus, and title sets, and at the layer break of dual-layer
+discs, each read in full before the next, most important first. The image is
+written in place to a preallocated file with a checkpoint of every region's
+progress next to it, so an interrupted backup resumes where each region left
+off, and the image is usable once its file system, IFOs, and menus are done.
+"""
+
+import ctypes
+import json
+import os
+import re
+
+import pslipstream.cfg as cfg
+
+if cfg.linux:
+    import fcntl
+
+# scsi/sg.h
+SG_IO = 0x2285
+SG_DXFER_FROM_DEV = -3
+# MMC READ DVD STRUCTURE, format 0: physical format information
+READ_DVD_STRUCTURE = 0xAD
+
+
+class SgIoHdr(ctypes.Structure):
+    _fields_ = [
+        ("interface_id", ctypes.c_int),
+        ("dxfer_direction", ctypes.c_int),
+        ("cmd_len", ctypes.c_ubyte),
+        ("mx_sb_len", ctypes.c_ubyte),
+        ("iovec_count", ctypes.c_ushort),
+        ("dxfer_len", ctypes.c_uint),
+        ("dxferp", ctypes.c_void_p),
+        ("cmdp", ctypes.c_void_p),
+        ("sbp", ctypes.c_void_p),
+        ("timeout", ctypes.c_uint),
+        ("flags", ctypes.c_uint),
+        ("pack_id", ctypes.c_int),
+        ("usr_ptr", ctypes.c_void_p),
+        ("status", ctypes.c_ubyte),
+        ("masked_status", ctypes.c_ubyte),
+        ("msg_status", ctypes.c_ubyte),
+        ("sb_len_wr", ctypes.c_ubyte),
+        ("host_status", ctypes.c_ushort),
+        ("driver_status", ctypes.c_ushort),
+        ("resid", ctypes.c_int),
+        ("duration", ctypes.c_uint),
+        ("info", ctypes.c_uint),
+    ]
+
+
+def parse_physical_format(data):
+    """
+    Get the first LBA of layer 1 from a DVD physical format information structure,
+    or None if the disc has a single layer.
+    """
+    layers = ((data[2] >> 5) & 0x3) + 1
+    if layers == 1:
+        return None
+    opposite_track_path = (data[2] >> 4) & 1
+    start = int.from_bytes(data[4:8], "big") & 0xFFFFFF
+    end = int.from_bytes(data[8:12], "big") & 0xFFFFFF
+    end_layer0 = int.from_bytes(data[12:16], "big") & 0xFFFFFF
+    return (end_layer0 if opposite_track_path else end) - start + 1
+
+
+def get_layer_break(dev):
+    """
+    Ask the drive for the first LBA of the disc's second layer with SCSI READ DVD STRUCTURE.
+    Returns None for single-layer discs, and wherever the drive can't be asked, like
+    image files or anything but Linux.
+    """
+    if not cfg.linux or os.path.isfile(dev):
+        return None
+    response = ctypes.create_string_buffer(4 + 2048)
+    sense = ctypes.create_string_buffer(32)
+    cdb = (ctypes.c_ubyte * 12)(READ_DVD_STRUCTURE, 0, 0, 0, 0, 0, 0, 0, len(response) >> 8, len(response) & 0xFF)
+    hdr = SgIoHdr(
+        interface_id=ord("S"), dxfer_direction=SG_DXFER_FROM_DEV, cmd_len=len(cdb), mx_sb_len=len(sense),
+        dxfer_len=len(response), dxferp=ctypes.addressof(response), cmdp=ctypes.addressof(cdb),
+        sbp=ctypes.addressof(sense), timeout=10000
+    )
+    try:
+        fd = os.open(dev, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, SG_IO, hdr)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if hdr.status or hdr.host_status or hdr.driver_status:
+        return None
+    return parse_physical_format(response.raw[4:])
+
+
+class Region:
+    """A run of sectors read as one, lower priorities first."""
+
+    # the file system, IFOs, and menus, what's needed to browse the disc
+    STRUCTURE = 0
+    # the title set with the most sectors
+    MAIN_FEATURE = 1
+    # everything else
+    REST = 2
+
+    def __init__(self, name, first_lba, sectors, priority, done=0):
+        self.name = name
+        self.first_lba = first_lba
+        self.sectors = sectors
+        self.priority = priority
+        self.done = done  # sectors read so far, from the first
+
+    def __repr__(self):
+        return f"Region({self.name!r}, {self.first_lba}, {self.sectors}, {self.priority}, done={self.done})"
+
+    @property
+    def complete(self):
+        return self.done >= self.sectors
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "first_lba": self.first_lba,
+            "sectors": self.sectors,
+            "priority": self.priority,
+            "done": self.done,
+        }
+
+
+def plan_regions(total_sectors, files, layer_break=None):
+    """
+    Split a disc of total_sectors into regions by its VIDEO_TS files, `(path, lba, sectors)`,
+    and at the layer break. Every sector is in exactly one region.
+
+    IFOs, BUPs, menu VOBs, and the sectors before the first file are STRUCTURE. The title
+    VOBs of a VTS are a single region, the one with the most sectors MAIN_FEATURE, and the
+    title VOBs of the others and any gaps REST.
+
+    Returns the regions in the order to read them, by priority and then disc order.
+    """
+    spans = []
+    title_sets = {}
+    for path, lba, sectors in files:
+        name = os.path.basename(path).upper()
+        m = re.match(r"^(VTS_\d\d)_[1-9]\.VOB$", name)
+        if m:
+            first, last = title_sets.get(m.group(1), (lba, lba + sectors))
+            title_sets[m.group(1)] = (min(first, lba), max(last, lba + sectors))
+        elif name.endswith((".IFO", ".BUP", ".VOB")):
+            spans.append([name, lba, lba + sectors, Region.STRUCTURE])
+    main = max(title_sets, key=lambda k: title_sets[k][1] - title_sets[k][0], default=None)
+    for name, (first, last) in title_sets.items():
+        spans.append([name, first, last, Region.MAIN_FEATURE if name == main else Region.REST])
+    spans = [s for s in spans if s[1] < total_sectors]
+    spans.sort(key=lambda s: s[1])
+    # fill the gaps, and trim overlaps, so each sector is read once
+    regions = []
+    position = 0
+    for name, first, last, priority in spans:
+        first = max(first, position)
+        last = min(last, total_sectors)
+        if first >= last:
+            continue
+        if first > position:
+            regions.append(Region("filesystem" if not position else "gap", position, first - position,
+                                  Region.STRUCTURE if not position else Region.REST))
+        regions.append(Region(name, first, last - first, priority))
+        position = last
+    if position < total_sectors:
+        regions.append(Region(
+            "filesystem" if not position else "gap", position, total_sectors - position,
+            Region.STRUCTURE if not position else Region.REST
+        ))
+    # never cross the layer break within a region
+    if layer_break and 0 < layer_break < total_sectors:
+        split = []
+        for region in regions:
+            end = region.first_lba + region.sectors
+            if region.first_lba < layer_break < end:
+                split.append(Region(f"{region.name} (L0)", region.first_lba, layer_break - region.first_lba,
+                                    region.priority))
+                split.append(Region(f"{region.name} (L1)", layer_break, end - layer_break, region.priority))
+            else:
+                split.append(region)
+        regions = split
+    return sorted(regions, key=lambda r: (r.priority, r.first_lba))
+
+
+class Checkpoint:
+    """
+    Progress of every region of an image being written, saved as JSON next to it.
+
+    Saves replace the file atomically, and only after the image data was flushed to
+    disk, so the checkpoint never claims more than what the image really has.
+    """
+
+    # 2: reads resumed in the middle of a VOB set load its title key, see Dvd.prepare_read(),
+    # earlier checkpoints may count sectors decrypted with another set's key as done
+    VERSION = 2
+
+    def __init__(self, image_path, volume_id, total_sectors, layer_break, regions):
+        self.path = f"{image_path}.regions.json"
+        self.volume_id = volume_id
+        self.total_sectors = total_sectors
+        self.layer_break = layer_break
+        self.regions = regions
+
+    def load(self):
+        """
+        Take the progress of each region from a previous checkpoint of the same disc and plan.
+        Returns True if there was one to resume.
+        """
+        try:
+            with open(self.path, "rt", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        layout = [(r.first_lba, r.sectors) for r in self.regions]
+        if (
+            saved.get("version") != self.VERSION or
+            saved.get("volume_id") != self.volume_id or
+            saved.get("total_sectors") != self.total_sectors or
+            [(r["first_lba"], r["sectors"]) for r in saved.get("regions", [])] != layout
+        ):
+            return False
+        for region, data in zip(self.regions, saved["regions"]):
+            region.done = min(max(data["done"], 0), region.sectors)
+        return True
+
+    def save(self):
+        data = {
+            "version": self.VERSION,
+            "volume_id": self.volume_id,
+            "total_sectors": self.total_sectors,
+            "layer_break": self.layer_break,
+            "regions": [r.to_json() for r in self.regions],
+        }
+        temp = f"{self.path}.tmp"
+        with open(temp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ImageFile:
+    """An image file of a fixed size, preallocated, written at any offset."""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.f = None
+
+    def open(self):
+        self.f = open(self.path, "r+b" if os.path.exists(self.path) else "w+b")
+        if os.fstat(self.f.fileno()).st_size != self.size:
+            self.f.truncate(self.size)
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(self.f.fileno(), 0, self.size)
+                except OSError:
+                    pass  # not supported by the file system, it's sparse then
+
+    def write_at(self, offset, data):
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self.f.fileno(), view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            self.f.seek(offset)
+            self.f.write(data)
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
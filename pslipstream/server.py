@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Local HTTP server exposing an open Dvd (drive or image) without imaging it
+first. The whole disc is served as a virtual ISO, and every file and VTS
+title set as its own stream, all with HTTP Range support so media players
+and ingestion tools can seek around freely.
+
+Routes:
+    /                    JSON index of everything available.
+    /disc.iso            The whole (decrypted) disc.
+    /files/<path>        A single file, e.g. /files/VIDEO_TS/VTS_01_1.VOB.
+    /titles/<vts>.vob    Every title VOB of a VTS back-to-back, e.g. /titles/1.vob.
+"""
+
+import builtins as g
+import json
+import os
+import re
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import unquote
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTPServer handling every request in its own thread."""
+    daemon_threads = True
+
+
+class DiscServer:
+    """
+    Serve an open Dvd over HTTP on the local machine.
+
+    All reads go through the Dvd's sector cache so the small, scattered range
+    requests media players make don't turn into a seek each.
+    """
+
+    CHUNK_SECTORS = 256  # sectors sent to the client per write
+
+    def __init__(self, dvd, host="127.0.0.1", port=0):
+        self.dvd = dvd
+        self.sector_size = dvd.dvdcss.SECTOR_SIZE
+        self.total_sectors = dvd.total_sectors
+        self.lock = threading.Lock()  # a Dvd can only do one read at a time
+        self.resources = self._get_resources()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        g.LOG.write(f"Serving {self.dvd.dev} at {self.url}/disc.iso, press Ctrl+C to stop...")
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+            g.LOG.write(f"Stopped serving {self.dvd.dev}, cache stats: {self.dvd.get_cache_stats()}")
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def read(self, lba, sectors):
+        """Read sectors of the disc as bytes, safe to call from any request thread."""
+        with self.lock:
+            return self.dvd.read_sectors(lba, sectors)
+
+    def _get_resources(self):
+        """Map every route to its list of (lba, sectors) extents, in order, as files may be fragmented."""
+        resources = {"/disc.iso": [(0, self.total_sectors)]}
+        titles = {}
+        for path, _, _ in self.dvd.get_files("/VIDEO_TS"):
+            extents = self.dvd.get_extents(path)
+            resources[f"/files{path}"] = extents
+            m = re.match(r"^VTS_(\d\d)_([1-9])\.VOB$", os.path.basename(path))
+            if m:
+                titles.setdefault(int(m.group(1)), []).append((int(m.group(2)), extents))
+        for vts, vobs in titles.items():
+            resources[f"/titles/{vts}.vob"] = [extent for _, extents in sorted(vobs) for extent in extents]
+        return resources
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.handle_request(send_body=False)
+
+            def do_GET(self):
+                self.handle_request(send_body=True)
+
+            def handle_request(self, send_body):
+                path = unquote(self.path.split("?", 1)[0])
+                if path == "/":
+                    return self.send_index(send_body)
+                extents = server.resources.get(path)
+                if extents is None:
+                    return self.send_error(404)
+                length = sum(size for _, size in extents) * server.sector_size
+                start, end = 0, length - 1
+                status = 200
+                requested = self.parse_range(self.headers.get("Range"), length)
+                if requested == "unsatisfiable":
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{length}")
+                    self.end_headers()
+                    return
+                if requested:
+                    start, end = requested
+                    status = 206
+                self.send_response(status)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{length}")
+                self.end_headers()
+                if send_body:
+                    try:
+                        self.send_range(extents, start, end)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass  # the client seeked elsewhere or went away
+
+            def send_index(self, send_body):
+                body = json.dumps({
+                    "device": server.dvd.dev,
+                    "volume_id": server.dvd.get_volume_label(),
+                    "sector_size": server.sector_size,
+                    "resources": {
+                        path: sum(size for _, size in extents) * server.sector_size
+                        for path, extents in server.resources.items()
+                    },
+                    "cache": server.dvd.get_cache_stats()
+                }, indent=2).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            @staticmethod
+            def parse_range(header, length):
+                """
+                Parse a single `bytes=` Range header into an inclusive (start, end) tuple.
+                Returns None to serve the whole resource, e.g. with no, multiple, or invalid ranges,
+                which are ignored (RFC 7233 section 3.1), and "unsatisfiable" if it's past the end.
+                """
+                if not header:
+                    return None
+                m = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+                if not m or m.group(1) == m.group(2) == "":
+                    return None
+                if m.group(1) == "":
+                    # suffix range, the last n bytes
+                    suffix = int(m.group(2))
+                    if suffix == 0:
+                        return "unsatisfiable"
+                    return max(0, length - suffix), length - 1
+                start = int(m.group(1))
+                if m.group(2) and int(m.group(2)) < start:
+                    return None  # invalid, not unsatisfiable (RFC 7233 section 2.1)
+                if start >= length:
+                    return "unsatisfiable"
+                end = int(m.group(2)) if m.group(2) else length - 1
+                return start, min(end, length - 1)
+
+            def send_range(self, extents, start, end):
+                offset = 0  # byte offset of the current extent within the resource
+                for lba, size in extents:
+                    extent_length = size * server.sector_size
+                    if offset + extent_length > start and offset <= end:
+                        # byte range to send from within this extent
+                        first = max(start - offset, 0)
+                        last = min(end - offset, extent_length - 1)
+                        sector = first // server.sector_size
+                        skip = first % server.sector_size
+                        remaining = last - first + 1
+                        while remaining > 0:
+                            sectors = min(server.CHUNK_SECTORS, size - sector)
+                            data = server.read(lba + sector, sectors)[skip:skip + remaining]
+                            if not data:
+                                return
+                            self.wfile.write(data)
+                            remaining -= len(data)
+                            sector += sectors
+                            skip = 0
+                    offset += extent_length
+
+            def log_message(self, format_, *args):
+                g.LOG.write(f"{self.address_string()} - {format_ % args}", echo=g.DBG)
+
+        return Handler
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Output sinks for the decrypted sector stream of a backup. A Tee fans one
+stream out to any amount of sinks (files, pipes, hashers, compressors) so
+the disc only ever has to be read once.
+"""
+
+import builtins as g
+import bz2
+import gzip
+import hashlib
+import lzma
+import os
+import queue
+import sys
+import threading
+import zlib
+
+import pslipstream.cfg as cfg
+from pslipstream.exceptions import SlipstreamSinkError
+from pslipstream.profiler import NULL_PHASE
+
+
+class Sink:
+    """
+    Base class of an output sink.
+
+    Sinks receive the stream in order, one block at a time, from a single
+    thread. They are opened right before the first block and either closed
+    or aborted once the stream ends. A block may be a memoryview of a reused
+    buffer, only valid until write() returns, so sinks copy what they keep.
+
+    Sinks writing to local storage set DISK, to be held to the write rate limit,
+    and CPU heavy ones CPU, to run at the nice level of the I/O limits.
+    """
+
+    DISK = False
+    CPU = False
+
+    def __init__(self, name):
+        self.name = name
+        self.written = 0
+
+    def open(self):
+        """Prepare the sink for writing."""
+
+    def write(self, data):
+        """
+        Take the next block of the stream, counting it in `written`. Sinks override this to
+        write it somewhere, the base sink only discards it.
+        """
+        self.written += len(data)
+
+    def close(self):
+        """Finalise the output after the whole stream was written."""
+
+    def abort(self):
+        """Stop writing after the stream (or this sink) failed part way."""
+
+
+class FileSink(Sink):
+    """
+    Write the stream to a file on disk.
+
+    The data is written to `<path>.tmp` and only renamed to the final path
+    once the whole stream was written, so a partial file is never mistaken
+    for a finished one.
+    """
+
+    DISK = True
+
+    def __init__(self, path, temp=True):
+        super().__init__(path)
+        self.path = path
+        self.temp_path = f"{path}.tmp" if temp else path
+        self.f = None
+
+    def open(self):
+        self.f = open(self.temp_path, "wb")
+
+    def write(self, data):
+        self.f.write(data)
+        self.written += len(data)
+
+    def close(self):
+        self.f.close()
+        if self.temp_path != self.path:
+            os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        if self.f:
+            self.f.close()
+
+
+class PipeSink(Sink):
+    """
+    Stream to a pipe, file descriptor, or already opened binary file object, without any temp file.
+    Defaults to stdout. The target is never closed, only flushed, as it's owned by the caller.
+
+    File descriptors (including stdout) are wrapped with a `buffer_size` write buffer so
+    the many small blocks of a disc read reach the pipe as few large writes.
+    """
+
+    def __init__(self, target=None, buffer_size=4 * 1024 * 1024):
+        if target is None:
+            target = sys.stdout.fileno()
+        super().__init__(f"fd:{target}" if isinstance(target, int) else getattr(target, "name", "pipe"))
+        self.target = target
+        self.buffer_size = buffer_size
+        self.f = None
+
+    def open(self):
+        if isinstance(self.target, int):
+            if cfg.windows:
+                # don't let the C runtime mangle line endings in the stream
+                import msvcrt
+                msvcrt.setmode(self.target, os.O_BINARY)
+            self.f = open(self.target, "wb", buffering=self.buffer_size, closefd=False)
+        else:
+            self.f = self.target
+
+    def write(self, data):
+        self.f.write(data)
+        self.written += len(data)
+
+    def close(self):
+        self.f.flush()
+
+    def abort(self):
+        if self.f:
+            try:
+                self.f.flush()
+            except OSError:
+                pass  # the reading end is most likely gone
+
+
+class HashSink(Sink):
+    """
+    Compute digests of the stream as it passes by.
+
+    Supports `crc32` and any algorithm provided by hashlib. If a path is given,
+    the digests are saved there in BSD-style tagged format on close, e.g.
+    `SHA1 (VOLUME.ISO) = ...`.
+    """
+
+    CPU = True
+
+    def __init__(self, path=None, algorithms=("crc32", "md5", "sha1"), label=None):
+        super().__init__(path or "hashes")
+        self.path = path
+        self.label = label or (os.path.splitext(os.path.basename(path))[0] if path else "-")
+        self.algorithms = algorithms
+        self.crc32 = 0
+        self.hashes = {name: hashlib.new(name) for name in algorithms if name != "crc32"}
+
+    def write(self, data):
+        if "crc32" in self.algorithms:
+            self.crc32 = zlib.crc32(data, self.crc32)
+        for h in self.hashes.values():
+            h.update(data)
+        self.written += len(data)
+
+    def hexdigests(self):
+        """Get the current digests as a dictionary of algorithm name to hex string."""
+        digests = {}
+        for name in self.algorithms:
+            if name == "crc32":
+                digests[name] = f"{self.crc32 & 0xFFFFFFFF:08x}"
+            else:
+                digests[name] = self.hashes[name].hexdigest()
+        return digests
+
+    def close(self):
+        digests = self.hexdigests()
+        g.LOG.write("\n".join(f"{name.upper()}: {digest}" for name, digest in digests.items()))
+        if self.path:
+            with open(self.path, "wt", encoding="utf-8") as f:
+                for name, digest in digests.items():
+                    f.write(f"{name.upper()} ({self.label}) = {digest}\n")
+
+
+class CompressSink(Sink):
+    """Compress the stream to a file with one of the standard library codecs."""
+
+    DISK = True
+    CPU = True
+
+    METHODS = {
+        "xz": lambda f, level: lzma.LZMAFile(f, "wb", preset=level),
+        "gz": lambda f, level: gzip.GzipFile(fileobj=f, mode="wb", compresslevel=9 if level is None else level),
+        "bz2": lambda f, level: bz2.BZ2File(f, "wb", compresslevel=9 if level is None else level)
+    }
+
+    def __init__(self, path, method="xz", level=None):
+        if method not in self.METHODS:
+            raise ValueError(f"Unsupported compression method {method}, expected one of {list(self.METHODS)}")
+        super().__init__(path)
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.method = method
+        self.level = level
+        self.f = None
+        self.c = None
+
+    def open(self):
+        self.f = open(self.temp_path, "wb")
+        self.c = self.METHODS[self.method](self.f, self.level)
+
+    def write(self, data):
+        self.c.write(data)
+        self.written += len(data)
+
+    def close(self):
+        self.c.close()
+        self.f.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        if self.c:
+            self.c.close()
+        if self.f:
+            self.f.close()
+
+
+class Block:
+    """
+    A reusable buffer of a BufferPool, to read a block of the stream into without
+    allocating anything per read.
+
+    Whoever holds a reference releases it once done, the buffer goes back to the pool
+    on the last release. Use it as a context manager to release the reader's reference.
+    """
+
+    def __init__(self, pool, size):
+        self.pool = pool
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.refs = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+    def retain(self):
+        with self.lock:
+            self.refs += 1
+
+    def release(self):
+        with self.lock:
+            self.refs -= 1
+            free = self.refs == 0
+        if free:
+            self.pool.free.put(self)
+
+
+class BufferPool:
+    """
+    Fixed set of pre-allocated Blocks of `size` bytes, shared by a reader and the sinks
+    of a Tee. The reader waits for a Block to be released when they're all in use.
+    """
+
+    def __init__(self, count, size):
+        self.size = size
+        self.free = queue.Queue()
+        for _ in range(count):
+            self.free.put(Block(self, size))
+
+    def acquire(self):
+        """Get a free Block, holding one reference to it."""
+        block = self.free.get()
+        block.refs = 1
+        return block
+
+
+class SinkWorker(threading.Thread):
+    """Feeds a single sink from its own bounded queue."""
+
+    def __init__(self, sink, queue_size):
+        super().__init__(name=f"Sink({sink.name})", daemon=True)
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.handled = 0  # blocks taken off the queue, to tell a slow sink from a hung one
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            data, block = item
+            try:
+                if self.error:
+                    # keep draining so the producer never blocks on a failed sink
+                    continue
+                g.LIMITS.apply(cpu=self.sink.CPU)
+                if self.sink.DISK:
+                    with g.PROFILER.phase("throttle", sink=self.sink.name):
+                        g.LIMITS.write.consume(len(data))
+                with g.PROFILER.phase("sink.write", sink=self.sink.name):
+                    self.sink.write(data)
+            except Exception as e:
+                self.error = e
+            finally:
+                if block:
+                    block.release()
+                self.handled += 1
+        try:
+            if self.error:
+                self.sink.abort()
+            else:
+                self.sink.close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def end(self, timeout):
+        """
+        Queue the end of the stream, waiting for room as long as the sink keeps taking blocks.
+        Returns False if it took none for `timeout` seconds.
+        """
+        while True:
+            handled = self.handled
+            try:
+                self.queue.put(None, timeout=timeout)
+                return True
+            except queue.Full:
+                if self.handled == handled:
+                    return False
+
+    def finish(self, timeout):
+        """
+        Wait for the sink to write what's left and be finalised, as long as it keeps taking blocks.
+        Returns False if it took none for `timeout` seconds.
+        """
+        while self.is_alive():
+            handled = self.handled
+            self.join(timeout)
+            if self.is_alive() and self.handled == handled:
+                return False
+        return True
+
+
+class Tee:
+    """
+    Fan a single stream out to multiple sinks.
+
+    Every sink is fed from its own thread through a bounded queue, so a sink
+    that is slow for a moment doesn't stall the others. The policy decides what
+    happens once a sink's queue is full:
+
+    - `block`: wait for the sink to catch up, slowing the whole stream down to
+      the slowest sink. Any sink failure fails the stream.
+    - `drop`: wait up to `timeout` seconds for the sink, then detach it with a
+      SlipstreamSinkError and carry on with the rest. The stream only fails
+      once every sink was dropped.
+
+    Closing waits on every sink as long as it makes progress. One that stops for
+    HANG_TIMEOUT seconds (`timeout` for one that already failed or was dropped, or
+    under the `drop` policy) is abandoned as failed, its thread left behind.
+    """
+
+    BLOCK = "block"
+    DROP = "drop"
+    HANG_TIMEOUT = 60.0
+
+    def __init__(self, sinks, queue_size=16, policy=BLOCK, timeout=2.0):
+        if policy not in (self.BLOCK, self.DROP):
+            raise ValueError(f"Unsupported sink policy {policy}, expected {self.BLOCK} or {self.DROP}")
+        if not sinks:
+            raise ValueError("At least one sink is required.")
+        self.workers = [SinkWorker(sink, queue_size) for sink in sinks]
+        self.queue_size = queue_size
+        self.policy = policy
+        self.timeout = timeout
+
+    def open(self):
+        """Open all sinks and start feeding them."""
+        for worker in self.workers:
+            worker.sink.open()
+        for worker in self.workers:
+            worker.start()
+
+    def get_pool(self, block_size):
+        """
+        Get a BufferPool of `block_size` byte buffers to read the stream into, with enough
+        buffers that the reader only ever waits on the sinks, never on the pool itself.
+        """
+        return BufferPool(len(self.workers) * (self.queue_size + 1) + 1, block_size)
+
+    def write(self, data, block=None):
+        """
+        Queue a block of data for every sink still attached.
+
+        The data must not be modified afterwards, as sinks consume it asynchronously.
+        If it's (part of) a pooled Block, pass the Block as `block`, and it's only put
+        back in its pool after every sink wrote it.
+
+        Raises SlipstreamSinkError when a sink failed under the `block` policy, or when
+        every sink has been dropped under the `drop` policy.
+        """
+        for worker in self.workers:
+            if worker.error:
+                if self.policy == self.BLOCK:
+                    raise SlipstreamSinkError(f"Output {worker.sink.name} failed: {worker.error}") from worker.error
+                continue
+            if worker.queue.full():
+                # the sink fell behind, time how long the read loop stalls on it
+                g.PROFILER.count("output_stalls")
+                stall = g.PROFILER.phase("output.stall", sink=worker.sink.name)
+            else:
+                stall = NULL_PHASE
+            if block:
+                block.retain()
+            if self.policy == self.BLOCK:
+                with stall:
+                    worker.queue.put((data, block))
+                continue
+            try:
+                with stall:
+                    worker.queue.put((data, block), timeout=self.timeout)
+            except queue.Full:
+                if block:
+                    block.release()
+                worker.error = SlipstreamSinkError(f"Output {worker.sink.name} fell behind and was dropped.")
+                g.LOG.write(f"{worker.error} It will be incomplete.")
+        if all(worker.error for worker in self.workers):
+            raise SlipstreamSinkError("Every output failed or was dropped, nothing left to write to.")
+
+    def close(self):
+        """
+        Wait for all sinks to finish writing and finalise them.
+        Returns a list of (sink, error) tuples for every sink that failed, was dropped, or hung.
+        """
+        timeouts = {
+            worker: self.timeout if worker.error or self.policy == self.DROP else self.HANG_TIMEOUT
+            for worker in self.workers
+        }
+        ended = [worker for worker in self.workers if worker.end(timeouts[worker])]
+        for worker in self.workers:
+            if worker not in ended or not worker.finish(timeouts[worker]):
+                worker.error = worker.error or SlipstreamSinkError(
+                    f"Output {worker.sink.name} stopped responding and was abandoned."
+                )
+        return [(worker.sink, worker.error) for worker in self.workers if worker.error]
+
+    def abort(self):
+        """Stop all sinks without finalising them, e.g. after a read error."""
+        for worker in self.workers:
+            worker.error = worker.error or SlipstreamSinkError("The stream was aborted.")
+        self.close()
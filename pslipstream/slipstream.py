@@ -22,7 +22,10 @@ import argparse
 import builtins as g
 import hashlib
 import os
+import sys
+import time
 import webbrowser
+from datetime import datetime
 
 import requests
 from appdirs import user_data_dir
@@ -30,12 +33,29 @@ from appdirs import user_data_dir
 from cefpython3 import cefpython as cef
 
 import pslipstream.cfg as cfg
+from pslipstream.bluray import Bluray
+from pslipstream.catalogue import Catalogue
 from pslipstream.config import Config
+from pslipstream.dat import Dat, DatSink, find_images, format_report, verify
+from pslipstream.demux import parse_track
 from pslipstream.dvd import Dvd
+from pslipstream.events import EventChannel
+from pslipstream.exceptions import SlipstreamDiscInUse, SlipstreamNoKeysObtained, SlipstreamReadError, \
+    SlipstreamSeekError, SlipstreamSinkError
 from pslipstream.gui import Gui
-from pslipstream.helpers import get_device_list
+from pslipstream.ifo import Selection
+from pslipstream.locks import describe_owner, get_owners
+from pslipstream.devices import DeviceWatcher
 from pslipstream.log import Log
+from pslipstream.manifest import MAGIC as MANIFEST_MAGIC, Manifest, ManifestSink, compare, format_comparison
+from pslipstream.metrics import Metrics
+from pslipstream.profiler import Profiler
 from pslipstream.progress import Progress
+from pslipstream.server import DiscServer
+from pslipstream.sinks import CompressSink, FileSink, HashSink, PipeSink, Tee
+from pslipstream.split import SplitFileSink
+from pslipstream.throttle import IoLimits
+from pslipstream.ui import get_ui_url
 
 
 def main():
@@ -46,12 +66,51 @@ def main():
 
     # Initialize custom global variables
     g.ARGS = get_arguments()
-    g.LOG = Log()  # Logger, everything written here gets print()'d and sent to GUI
+    # Profiler, records where the time of each job goes when enabled
+    g.PROFILER = Profiler(enabled=g.ARGS.profile is not None, path=g.ARGS.profile or "{job}.trace.json")
+    # Logger, everything written here gets print()'d and sent to GUI, stdout is kept clean when streaming to it
+    g.LOG = Log(stream=sys.stderr if is_streaming_to_stdout() else None)
     g.PROGRESS = Progress()  # Progress Bar, controls only the GUI's progress bar.
+    g.METRICS = Metrics()  # Per-device counters, exported for monitoring when asked to
+    g.LIMITS = IoLimits()  # Bandwidth ceilings and priorities of every job, adjustable while they run
+    g.EVENTS = EventChannel()  # Batched log, progress, device, and job events for the GUI
+    g.DEVICES = DeviceWatcher()  # Table of drives and disc labels, kept up to date once started
+    g.CATALOGUE = Catalogue(os.path.join(cfg.user_dir, "catalogue.db"))  # Every disc seen and job run
     g.DBG = g.ARGS.dbg  # Debug switch, enables debugging specific code and logging
     g.CFG = Config(cfg.config_file)
     g.CFG.load()
 
+    # Apply settings, arguments take priority over the config file
+    cache_size = g.ARGS.cache_size
+    if cache_size is None:
+        cache_size = g.CFG.settings.get("sector_cache_size", Dvd.CACHE_SIZE // 1024 // 1024)
+    Dvd.CACHE_SIZE = int(cache_size) * 1024 * 1024
+    Dvd.WORKER = g.ARGS.worker or bool(g.CFG.settings.get("disc_worker", False))
+    wait = g.ARGS.wait
+    if wait is None:
+        wait = g.CFG.settings.get("device_lock_timeout", 0)
+    Dvd.LOCK_TIMEOUT = None if float(wait) < 0 else float(wait)
+    limits = {
+        "read_rate": g.ARGS.read_limit, "write_rate": g.ARGS.write_limit, "io_priority": g.ARGS.ionice,
+        "nice": g.ARGS.nice
+    }
+    for key, setting in (("read_rate", "read_rate_limit"), ("write_rate", "write_rate_limit"),
+                         ("io_priority", "io_priority"), ("nice", "worker_nice")):
+        if limits[key] is None:
+            limits[key] = g.CFG.settings.get(setting)
+    for key in ("read_rate", "write_rate"):
+        if limits[key] is not None:
+            limits[key] = int(float(limits[key]) * 1024 * 1024)
+    if any(value is not None for value in limits.values()):
+        try:
+            g.LIMITS.set(**limits)
+        except ValueError as e:
+            g.LOG.write(f"Invalid I/O limits: {e}")
+            exit(1)
+    io_control = g.ARGS.io_control or g.CFG.settings.get("io_control_file")
+    if io_control:
+        g.LIMITS.watch(io_control)
+
     # Print License if asked
     if g.ARGS.license:
         if not os.path.exists("LICENSE"):
@@ -73,12 +132,31 @@ def main():
                 print(f.read())
         exit(0)
 
+    # Export metrics if asked
+    if g.ARGS.metrics_port:
+        g.METRICS.serve(g.ARGS.host, g.ARGS.metrics_port)
+    if g.ARGS.metrics_file:
+        g.METRICS.write_textfile(g.ARGS.metrics_file)
+
     # Get and Print Runtime Details
     g.LOG.write(get_runtime_details() + "\n")
 
     # Let's get to it
-    if g.ARGS.cli:
-        cli()
+    if g.ARGS.history:
+        history()
+    elif g.ARGS.verify:
+        verify_images()
+    elif g.ARGS.compare:
+        compare_images()
+    elif g.ARGS.watch:
+        watch()
+    elif g.ARGS.cli:
+        try:
+            cli()
+        except (SlipstreamDiscInUse, SlipstreamNoKeysObtained, SlipstreamReadError, SlipstreamSeekError,
+                SlipstreamSinkError, OSError) as e:
+            g.LOG.write(f"Failed: {e}")
+            exit(1)
     else:
         gui()
 
@@ -112,6 +190,13 @@ def get_arguments():
         required=False,
         help="Setting this stops the GUI from running",
     )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        required=False,
+        help="List the drives, then print drive and disc changes as they happen until stopped",
+    )
     ap.add_argument(
         "-d",
         "--device",
@@ -120,9 +205,264 @@ def get_arguments():
         required=False,
         help="Choose device for backup (e.g. '/dev/sr0', '/mnt/dvd-rw', 'E:')",
     )
+    ap.add_argument(
+        "-o",
+        "--output",
+        action="append",
+        required=False,
+        help="Save the backup to this path, can be used multiple times to save copies while reading the "
+             "disc once. '{volume_id}' is replaced with the disc label, '-' streams it to stdout with logs "
+             "moved to stderr (default: '{volume_id}.ISO')",
+    )
+    ap.add_argument(
+        "--split-size",
+        type=int,
+        nargs="?",
+        const=4095,
+        required=False,
+        help="Split each --output file into numbered parts of this many MiB as it's written, with a "
+             "'.parts.json' descriptor that can be used as the --device to read the set as one image "
+             "(default: 4095, the most FAT32 can hold)",
+    )
+    ap.add_argument(
+        "--output-fd",
+        type=int,
+        action="append",
+        required=False,
+        help="Stream the backup to this already opened file descriptor, can be used multiple times",
+    )
+    ap.add_argument(
+        "--hash",
+        nargs="?",
+        const="{volume_id}.ISO.hashes",
+        required=False,
+        help="Compute CRC32, MD5, and SHA-1 digests of the backup while reading and save them to this path "
+             "(default: '{volume_id}.ISO.hashes')",
+    )
+    ap.add_argument(
+        "--compress",
+        choices=list(CompressSink.METHODS),
+        required=False,
+        help="Also save a compressed copy of the backup with this method",
+    )
+    ap.add_argument(
+        "--sink-policy",
+        choices=[Tee.BLOCK, Tee.DROP],
+        default=Tee.BLOCK,
+        required=False,
+        help="What to do when an output can't keep up with the disc read, wait for it, or drop it with an error",
+    )
+    ap.add_argument(
+        "--queue-size",
+        type=int,
+        default=16,
+        required=False,
+        help="Amount of read blocks each output may fall behind before the sink policy kicks in",
+    )
+    ap.add_argument(
+        "--extract",
+        type=Selection.parse,
+        action="append",
+        required=False,
+        help="Instead of a backup, extract a PGC, cell, or chapter as 'VTS:PGC', 'VTS:PGC:CELL', or "
+             "'VTS:PGC:chCHAPTER', can be used multiple times. Each is saved to its own file, or to the "
+             "--output paths in the same order",
+    )
+    ap.add_argument(
+        "--concat",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Save every --extract selection to a single file instead, each sector once in disc order",
+    )
+    ap.add_argument(
+        "--tracks",
+        type=lambda tracks: [parse_track(track) for track in tracks.split(",")],
+        nargs="?",
+        const=None,
+        default=False,
+        required=False,
+        help="Demux each --extract selection into elementary streams instead, keeping only these comma "
+             "separated hex track ids (e.g. 'e0,80,20'), or every track if none are given",
+    )
+    ap.add_argument(
+        "--manifest",
+        nargs="?",
+        const="{volume_id}.ISO.slmf",
+        required=False,
+        help="Save a manifest of the backup with a digest per 1 MiB block and per VOB to this path, to compare "
+             "or partially verify it later (default: '{volume_id}.ISO.slmf')",
+    )
+    ap.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("A", "B"),
+        required=False,
+        help="Instead of a backup, compare two images of a disc by their manifests (or the images themselves, "
+             "read in full) and print the differing ranges and VOBs",
+    )
+    ap.add_argument(
+        "--dat",
+        type=str,
+        required=False,
+        help="Add the backup to this Logiqx XML DAT file with its size, CRC32, MD5, and SHA-1, created if "
+             "missing. With --verify, the DAT to verify against",
+    )
+    ap.add_argument(
+        "--verify",
+        type=str,
+        required=False,
+        help="Instead of a backup, verify every ISO in this directory (recursively) against the --dat file",
+    )
+    ap.add_argument(
+        "--report",
+        type=str,
+        required=False,
+        help="Save the --verify or --compare report to this path instead of printing it",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        required=False,
+        help="Amount of files to hash at once with --verify",
+    )
+    ap.add_argument(
+        "--schedule",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Read the backup region by region into a single --output file, the file system, IFOs, and menus "
+             "first, then the main feature, then the rest, resuming an interrupted one from its checkpoint. "
+             "Not for use with --hash, --dat, --manifest, --compress, or --skip-known",
+    )
+    ap.add_argument(
+        "--skip-known",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Skip the backup if the disc was already backed up successfully before, according to the catalogue",
+    )
+    ap.add_argument(
+        "--history",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Print the read speed of the latest backups of the device (or every device) and exit",
+    )
+    ap.add_argument(
+        "--playlist",
+        type=int,
+        nargs="?",
+        const=-1,
+        required=False,
+        help="Treat the device as a Blu-ray image file and extract this playlist (e.g. 800 for 00800.mpls) as a "
+             "single m2ts stream, or list its playlists if no number is given",
+    )
+    ap.add_argument(
+        "--cache-size",
+        type=int,
+        required=False,
+        help="Memory budget of the sector cache in MiB, 0 disables it (default: 'sector_cache_size' config, or 32)",
+    )
+    ap.add_argument(
+        "--worker",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Run the drive I/O of each disc in a worker process of its own, restarted if it crashes "
+             "(default: 'disc_worker' config, or off)",
+    )
+    ap.add_argument(
+        "--read-limit",
+        type=float,
+        required=False,
+        help="Limit disc reads to this many MiB/s, at least 1 to keep the drive spinning, 0 for no limit "
+             "(default: 'read_rate_limit' config, or none)",
+    )
+    ap.add_argument(
+        "--write-limit",
+        type=float,
+        required=False,
+        help="Limit writes of the outputs to this many MiB/s in total, 0 for no limit "
+             "(default: 'write_rate_limit' config, or none)",
+    )
+    ap.add_argument(
+        "--ionice",
+        type=str,
+        required=False,
+        help="I/O priority class of the jobs on Linux, 'idle', 'best-effort', or 'realtime', optionally with a "
+             "level of 0-7 like 'best-effort:7' (default: 'io_priority' config, or unchanged)",
+    )
+    ap.add_argument(
+        "--nice",
+        type=int,
+        required=False,
+        help="Nice level of the hashing and compressing output workers on Linux, elsewhere it's ignored as it "
+             "would apply to the whole app (default: 'worker_nice' config, or unchanged)",
+    )
+    ap.add_argument(
+        "--io-control",
+        type=str,
+        required=False,
+        help="YAML file with any of 'read_rate' and 'write_rate' (MiB/s, 0 for none), 'io_priority', and 'nice' "
+             "('default' to take them off) to change the limits while jobs run, applied whenever it changes "
+             "(default: 'io_control_file' config)",
+    )
+    ap.add_argument(
+        "--wait",
+        type=float,
+        nargs="?",
+        const=-1,
+        required=False,
+        help="Wait up to this many seconds for a device in use by another job or process, or until it's free "
+             "if no amount is given (default: 'device_lock_timeout' config, or 0, -1 waits forever)",
+    )
+    ap.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="{job}.trace.json",
+        required=False,
+        help="Profile each job and save it as a Chrome trace-event JSON file at this path, '{job}' and "
+             "'{time}' are replaced with the job name and time (default: '{job}.trace.json')",
+    )
+    ap.add_argument(
+        "--serve",
+        type=int,
+        nargs="?",
+        const=8800,
+        required=False,
+        help="Instead of a backup, serve the device over HTTP on this port (default: 8800) as a virtual ISO "
+             "and individual files/titles, with Range support",
+    )
+    ap.add_argument(
+        "--metrics-port",
+        type=int,
+        required=False,
+        help="Serve Prometheus metrics of every device at http://<host>:<port>/metrics",
+    )
+    ap.add_argument(
+        "--metrics-file",
+        type=str,
+        required=False,
+        help="Write Prometheus metrics of every device to this file every 5 seconds, for node_exporter's "
+             "textfile collector",
+    )
+    ap.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        required=False,
+        help="Address to bind to when serving the device or metrics",
+    )
     return ap.parse_args()
 
 
+def is_streaming_to_stdout():
+    return "-" in (g.ARGS.output or []) or 1 in (g.ARGS.output_fd or [])
+
+
 def get_runtime_details():
     return "\n".join(
         [
@@ -153,7 +493,14 @@ def gui():
             port = 8000
         cfg.ui_index = "http://localhost:" + str(port)
     else:
-        cfg.ui_index = "https://slipstream-ui.vercel.app"
+        # serve the bundled (or a newer downloaded) ui locally, so no network is needed to start
+        cfg.ui_index = get_ui_url(
+            cache_path=os.path.join(cfg.user_dir, "ui"),
+            bundled=os.path.join(cfg.static_dir, "ui"),
+            check_update=bool(g.CFG.settings.get("ui_update_check", True))
+        )
+    # keep the device list up to date in the background, rather than re-probing each time it's shown
+    g.DEVICES.start()
     # create gui, and fire it up
     g.GUI = Gui(
         url=cfg.ui_index,
@@ -166,22 +513,170 @@ def gui():
                 {"name": "dvd", "item": Dvd()},
                 {"name": "log", "item": g.LOG},
                 {"name": "progress", "item": g.PROGRESS},
+                {"name": "events", "item": g.EVENTS},
+                {"name": "io", "item": g.LIMITS},
             ],
             "functions": [
                 {"name": "pyDelete", "item": os.remove},
                 {"name": "pyHref", "item": lambda url: webbrowser.open(url)},
                 {"name": "configSave", "item": g.CFG.save},
-                {"name": "getDeviceList", "item": get_device_list},
+                {"name": "getDeviceList", "item": g.DEVICES.get_device_list},
+                {"name": "watchDevices", "item": g.DEVICES.subscribe_js},
             ],
         },
     )
     g.GUI.mainloop()
 
 
+def watch():
+    g.DEVICES.start()
+    owners = get_owners()
+    for device in g.DEVICES.get_devices():
+        owner = f", in use by {describe_owner(owners[device['loc']])}" if device["loc"] in owners else ""
+        g.LOG.write(f"{device['loc']}: {device['volid'] or 'no disc'}{owner}")
+    g.DEVICES.subscribe(lambda e: g.LOG.write(
+        f"{e['device']['loc']}: {e['event']} ({e['device']['volid'] or 'no disc'})"
+    ))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        g.DEVICES.stop()
+
+
+def history():
+    for job in g.CATALOGUE.drive_throughput(g.ARGS.device or None):
+        g.LOG.write(
+            f"{datetime.fromtimestamp(job['finished']):%Y-%m-%d %H:%M} {job['device']}: "
+            f"{job['bytes'] / 1024 / 1024:,.0f} MiB at {job['rate'] / 1024 / 1024:.2f} MiB/s"
+        )
+
+
+def verify_images():
+    if not g.ARGS.dat:
+        g.LOG.write("A DAT file to verify against is required, see --dat.")
+        exit(1)
+    dat = Dat.load(g.ARGS.dat)
+    images = find_images(g.ARGS.verify)
+    g.LOG.write(f"Verifying {len(images)} images against {len(dat.roms)} entries of \"{dat.name}\"...")
+    report = format_report(verify(images, dat, g.ARGS.jobs))
+    if g.ARGS.report:
+        with open(g.ARGS.report, "wt", encoding="utf-8") as f:
+            f.write(report + "\n")
+        g.LOG.write(report.splitlines()[-1])
+        g.LOG.write(f"Saved report to {g.ARGS.report}")
+    else:
+        g.LOG.write(report)
+
+
+def compare_images():
+    manifests = {}
+    for path in g.ARGS.compare:
+        with open(path, "rb") as f:
+            if f.read(len(MANIFEST_MAGIC)) == MANIFEST_MAGIC:
+                manifests[path] = Manifest.load(path)
+    # images are hashed by the files and blocks of the manifest they're compared to, if any
+    known = next(iter(manifests.values()), None)
+    for path in g.ARGS.compare:
+        if path not in manifests:
+            g.LOG.write(f"{path} is not a manifest, reading the image in full...")
+            manifests[path] = Manifest.from_image(
+                path, files=[(file.name, file.first_lba, file.sectors) for file in known.files] if known else (),
+                block_size=known.block_size if known else Manifest.BLOCK_SIZE,
+                digest_size=known.digest_size if known else Manifest.DIGEST_SIZE
+            )
+    manifests = [manifests[path] for path in g.ARGS.compare]
+    report = format_comparison(compare(*manifests), manifests[0])
+    if g.ARGS.report:
+        with open(g.ARGS.report, "wt", encoding="utf-8") as f:
+            f.write(report + "\n")
+        g.LOG.write(f"Saved report to {g.ARGS.report}")
+    else:
+        g.LOG.write(report)
+
+
+def bluray():
+    b = Bluray()
+    try:
+        b.open(g.ARGS.device)
+        if g.ARGS.playlist < 0:
+            for line in b.describe():
+                g.LOG.write(line)
+            return
+        volume_id = b.get_volume_label()
+        outputs = [
+            PipeSink() if path == "-" else FileSink(path.format(volume_id=volume_id))
+            for path in g.ARGS.output or []
+        ]
+        outputs.extend(PipeSink(fd) for fd in g.ARGS.output_fd or [])
+        Bluray.extract_playlist.__wrapped__(
+            b, playlist=g.ARGS.playlist, outputs=outputs, policy=g.ARGS.sink_policy, queue_size=g.ARGS.queue_size
+        )
+    finally:
+        b.dispose()
+
+
 def cli():
+    if g.ARGS.playlist is not None:
+        bluray()
+        return
     d = Dvd()
-    d.open(g.ARGS.device)
-    d.create_backup()
+    Dvd.open.__wrapped__(d, g.ARGS.device)
+    if g.ARGS.serve is not None:
+        d.set_job(f"serve :{g.ARGS.serve}")
+        d.crack_keys()
+        DiscServer(d, g.ARGS.host, g.ARGS.serve).serve_forever()
+        return
+    volume_id = d.get_volume_label()
+    if g.ARGS.extract and g.ARGS.tracks is not False:
+        for selection in g.ARGS.extract:
+            Dvd.demux.__wrapped__(d, selection=selection, tracks=g.ARGS.tracks)
+        return
+    if g.ARGS.extract:
+        outputs = [FileSink(path.format(volume_id=volume_id)) for path in g.ARGS.output or []]
+        Dvd.extract.__wrapped__(
+            d, selections=g.ARGS.extract, outputs=outputs, concat=g.ARGS.concat, policy=g.ARGS.sink_policy,
+            queue_size=g.ARGS.queue_size
+        )
+        return
+    if g.ARGS.schedule:
+        if len(g.ARGS.output or []) > 1 or "-" in (g.ARGS.output or []) or g.ARGS.output_fd or g.ARGS.split_size:
+            g.LOG.write("A scheduled backup is written in place, it needs a single --output file.")
+            exit(1)
+        # these only work on the stream of a backup read start to end
+        unsupported = [
+            flag for flag, value in (
+                ("--hash", g.ARGS.hash), ("--dat", g.ARGS.dat), ("--manifest", g.ARGS.manifest),
+                ("--compress", g.ARGS.compress), ("--skip-known", g.ARGS.skip_known)
+            ) if value
+        ]
+        if unsupported:
+            g.LOG.write(f"A scheduled backup can't be used with {', '.join(unsupported)}, as it's read out of order.")
+            exit(1)
+        path = (g.ARGS.output or ["{volume_id}.ISO"])[0]
+        Dvd.create_scheduled_backup.__wrapped__(d, path=path.format(volume_id=volume_id))
+        return
+    outputs = [
+        PipeSink() if path == "-" else
+        SplitFileSink(path.format(volume_id=volume_id), g.ARGS.split_size * 1024 * 1024) if g.ARGS.split_size else
+        FileSink(path.format(volume_id=volume_id))
+        for path in g.ARGS.output or ([] if g.ARGS.output_fd else ["{volume_id}.ISO"])
+    ]
+    outputs.extend(PipeSink(fd) for fd in g.ARGS.output_fd or [])
+    if g.ARGS.hash:
+        outputs.append(HashSink(g.ARGS.hash.format(volume_id=volume_id)))
+    if g.ARGS.dat:
+        files = [sink.path for sink in outputs if isinstance(sink, (FileSink, SplitFileSink))]
+        rom_name = os.path.basename(files[0]) if files else f"{volume_id}.ISO"
+        outputs.append(DatSink(g.ARGS.dat.format(volume_id=volume_id), volume_id, rom_name))
+    if g.ARGS.manifest:
+        vobs = [(os.path.basename(vob), lba, size) for _, vob_set in d.get_vob_sets() for vob, lba, size in vob_set]
+        outputs.append(ManifestSink(g.ARGS.manifest.format(volume_id=volume_id), vobs, volume_id))
+    if g.ARGS.compress:
+        outputs.append(CompressSink(f"{volume_id}.ISO.{g.ARGS.compress}", g.ARGS.compress))
+    Dvd.create_backup.__wrapped__(
+        d, outputs=outputs, policy=g.ARGS.sink_policy, queue_size=g.ARGS.queue_size, skip_known=g.ARGS.skip_known
+    )
 
 
 if __name__ == "__main__":
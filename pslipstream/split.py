@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Images split into numbered parts of a fixed size, for targets with a file
+size limit like FAT32. The parts are written as the backup streams by, with
+a descriptor listing each part's size and digest, and a split image is read
+back through its descriptor as if it were a single file, without joining it.
+
+Descriptor, `<path>.parts.json`:
+
+    {"version": 1, "name": "VOLUME.ISO", "size": 8547991552, "part_size": 4293918720,
+     "algorithm": "sha1", "parts": [{"file": "VOLUME.ISO.001", "size": 4293918720, "sha1": "..."}, ...]}
+"""
+
+import bisect
+import builtins as g
+import hashlib
+import io
+import json
+import os
+
+from pydvdcss.dvdcss import DvdCss
+
+from pslipstream.exceptions import SlipstreamReadError
+from pslipstream.sinks import Sink
+
+DESCRIPTOR_SUFFIX = ".parts.json"
+# the largest file FAT32 can hold is 4 GiB - 1 B, this is the largest whole amount of MiB below it
+FAT32_PART_SIZE = 4095 * 1024 * 1024
+
+
+def is_split_image(path):
+    return path.lower().endswith(DESCRIPTOR_SUFFIX)
+
+
+class SplitFileSink(Sink):
+    """
+    Write the stream to numbered parts of part_size bytes, `<path>.001`, `<path>.002`, and so on,
+    with a descriptor at `<path>.parts.json` written once the stream ended.
+
+    Like FileSink, each part is written to a `.tmp` file first and renamed once it's full, and
+    the descriptor only exists for a complete set. Keep part_size a multiple of the sector size
+    so no sector straddles two parts.
+    """
+
+    DISK = True
+
+    def __init__(self, path, part_size=FAT32_PART_SIZE, algorithm="sha1"):
+        super().__init__(path)
+        self.path = path
+        self.part_size = part_size
+        self.algorithm = algorithm
+        self.parts = []
+        self.f = None
+        self.hash = None
+        self.part_written = 0
+
+    def get_part_path(self, index):
+        return f"{self.path}.{index:03}"
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            if not self.f:
+                self.f = open(f"{self.get_part_path(len(self.parts) + 1)}.tmp", "wb")
+                self.hash = hashlib.new(self.algorithm)
+                self.part_written = 0
+            part = view[:self.part_size - self.part_written]
+            self.f.write(part)
+            self.hash.update(part)
+            self.part_written += len(part)
+            self.written += len(part)
+            view = view[len(part):]
+            if self.part_written == self.part_size:
+                self._finish_part()
+
+    def _finish_part(self):
+        path = self.get_part_path(len(self.parts) + 1)
+        self.f.close()
+        self.f = None
+        os.replace(f"{path}.tmp", path)
+        self.parts.append({
+            "file": os.path.basename(path),
+            "size": self.part_written,
+            self.algorithm: self.hash.hexdigest(),
+        })
+
+    def close(self):
+        if self.f:
+            self._finish_part()
+        descriptor = {
+            "version": 1,
+            "name": os.path.basename(self.path),
+            "size": self.written,
+            "part_size": self.part_size,
+            "algorithm": self.algorithm,
+            "parts": self.parts,
+        }
+        with open(f"{self.path}{DESCRIPTOR_SUFFIX}.tmp", "wt", encoding="utf-8") as f:
+            json.dump(descriptor, f, indent=2)
+        os.replace(f"{self.path}{DESCRIPTOR_SUFFIX}.tmp", f"{self.path}{DESCRIPTOR_SUFFIX}")
+        g.LOG.write(f"Saved {len(self.parts)} parts of \"{self.path}\", see \"{self.path}{DESCRIPTOR_SUFFIX}\"")
+
+    def abort(self):
+        if self.f:
+            self.f.close()
+
+
+class SplitImage(io.RawIOBase):
+    """
+    Read-only, seekable file object over a split image, from its descriptor.
+
+    Parts are looked up next to the descriptor and opened as they're first read.
+    Their sizes are checked on open, their digests only by verify().
+
+    Raises FileNotFoundError if a part is missing, and ValueError if one has the wrong size.
+    """
+
+    def __init__(self, descriptor_path):
+        super().__init__()
+        with open(descriptor_path, "rt", encoding="utf-8") as f:
+            self.descriptor = json.load(f)
+        directory = os.path.dirname(os.path.abspath(descriptor_path))
+        self.paths = [os.path.join(directory, part["file"]) for part in self.descriptor["parts"]]
+        self.offsets = []  # first byte of each part
+        self.size = 0
+        for path, part in zip(self.paths, self.descriptor["parts"]):
+            actual = os.path.getsize(path)
+            if actual != part["size"]:
+                raise ValueError(f"Part {path} is {actual:,} bytes, {part['size']:,} were expected")
+            self.offsets.append(self.size)
+            self.size += part["size"]
+        if self.size != self.descriptor["size"]:
+            raise ValueError(f"The parts add up to {self.size:,} bytes, {self.descriptor['size']:,} were expected")
+        self.files = {}
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        done = 0
+        while done < len(view) and self.position < self.size:
+            index = bisect.bisect_right(self.offsets, self.position) - 1
+            f = self.files.get(index)
+            if not f:
+                f = self.files[index] = open(self.paths[index], "rb", buffering=0)
+            f.seek(self.position - self.offsets[index])
+            part_left = self.offsets[index] + self.descriptor["parts"][index]["size"] - self.position
+            read = f.readinto(view[done:done + min(len(view) - done, part_left)])
+            if not read:
+                raise SlipstreamReadError(f"Part {self.paths[index]} was cut short")
+            done += read
+            self.position += read
+        return done
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        super().close()
+
+    def verify(self):
+        """Hash every part and check it against the descriptor. Returns the paths of the parts that don't match."""
+        algorithm = self.descriptor["algorithm"]
+        bad = []
+        for path, part in zip(self.paths, self.descriptor["parts"]):
+            h = hashlib.new(algorithm)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                    h.update(chunk)
+            if h.hexdigest() != part[algorithm]:
+                bad.append(path)
+        return bad
+
+
+class SplitImageCss:
+    """
+    Stand-in for pydvdcss's DvdCss over a split image, read as is. Backups are already
+    decrypted, so there's nothing for libdvdcss to do, and it can't open a split image.
+    """
+
+    SECTOR_SIZE = DvdCss.SECTOR_SIZE
+    BLOCK_BUFFER = DvdCss.BLOCK_BUFFER
+    NOFLAGS = DvdCss.NOFLAGS
+    READ_DECRYPT = DvdCss.READ_DECRYPT
+    SEEK_MPEG = DvdCss.SEEK_MPEG
+    SEEK_KEY = DvdCss.SEEK_KEY
+
+    def __init__(self):
+        self.image = None
+        self.buffer = None
+
+    def open(self, dev):
+        self.image = SplitImage(dev)
+
+    def dispose(self):
+        if self.image:
+            self.image.close()
+            self.image = None
+
+    def is_scrambled(self):
+        return False
+
+    def seek(self, lba, flags=NOFLAGS):
+        return self.image.seek(min(lba, self.image.size // self.SECTOR_SIZE) * self.SECTOR_SIZE) // self.SECTOR_SIZE
+
+    def readinto(self, buffer, sectors, flags=NOFLAGS):
+        read = self.image.readinto(memoryview(buffer)[:sectors * self.SECTOR_SIZE])
+        return read // self.SECTOR_SIZE
+
+    def read(self, sectors, flags=NOFLAGS):
+        buffer = bytearray(sectors * self.SECTOR_SIZE)
+        ret = self.readinto(buffer, sectors, flags)
+        self.buffer = bytes(buffer[:ret * self.SECTOR_SIZE])
+        return ret
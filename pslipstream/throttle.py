@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+I/O limits for sharing a host with other workloads. Disc reads and output
+writes each have a bandwidth ceiling, and job threads an I/O priority class
+and the hashing and compressing sink workers a nice level, both Linux only.
+The limits can be changed while a job runs, from the UI, or a control file.
+"""
+
+import builtins as g
+import ctypes
+import os
+import platform
+import threading
+import time
+
+import yaml
+
+import pslipstream.cfg as cfg
+
+# linux/ioprio.h
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# `none` is the default of every thread, following its nice level
+IOPRIO_CLASSES = {"none": 0, "realtime": 1, "best-effort": 2, "idle": 3}
+# value of IoLimits.set() taking a priority limit off again
+DEFAULT = "default"
+IOPRIO_SET = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314, "ppc64le": 273}
+
+
+def parse_io_priority(priority):
+    """
+    Parse an I/O priority like `best-effort:7` into its class number and level.
+    Raises ValueError on an unknown class or a level other than 0 to 7.
+    """
+    name, _, level = priority.partition(":")
+    if name not in IOPRIO_CLASSES:
+        raise ValueError(f"Unknown I/O priority class {name}, expected one of {list(IOPRIO_CLASSES)}")
+    if name == "none":
+        if level:
+            raise ValueError("The I/O priority class none has no levels")
+        return IOPRIO_CLASSES[name], 0
+    if level and not (level.isdigit() and int(level) <= 7):
+        raise ValueError(f"Invalid I/O priority level {level}, expected 0 (highest) to 7")
+    return IOPRIO_CLASSES[name], int(level or 4)
+
+
+def set_io_priority(priority):
+    """
+    Set the I/O priority of the calling thread to a class, `realtime`, `best-effort`, or `idle`,
+    optionally with a level of 0 (highest) to 7 like `best-effort:7`, or back to `none`, the
+    default. None leaves it alone.
+
+    Returns False if it's not supported here, e.g. anything but Linux.
+    Raises ValueError on an invalid priority and OSError if it was refused, e.g. realtime unprivileged.
+    """
+    if not priority:
+        return True
+    ioprio_class, level = parse_io_priority(priority)
+    number = IOPRIO_SET.get(platform.machine())
+    if not cfg.linux or not number:
+        return False
+    value = (ioprio_class << IOPRIO_CLASS_SHIFT) | level
+    libc = ctypes.CDLL(None, use_errno=True)
+    # who 0 is the calling thread
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, value) < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return True
+
+
+def set_nice(nice):
+    """
+    Set the nice level of the calling thread. None leaves it alone.
+
+    Returns False if it's not supported here. Only Linux has nice levels per thread,
+    elsewhere it would renice the whole process, the GUI and disc reads included.
+    Raises OSError if it was refused, e.g. a lower nice level than now unprivileged.
+    """
+    if nice is None:
+        return True
+    if not cfg.linux:
+        return False
+    os.setpriority(os.PRIO_PROCESS, 0, nice)
+    return True
+
+
+class Throttle:
+    """
+    Token bucket limiting throughput to `rate` bytes per second, 0 for no limit.
+
+    Callers are held back in steps of at most MAX_SLEEP seconds with a bucket of
+    BURST seconds' worth of bytes, so I/O keeps flowing evenly at the limit rather
+    than in long bursts and pauses, in which a drive would spin down and up again.
+    The rate can be changed from any thread at any time, taking effect at once.
+    """
+
+    BURST = 0.25
+    MAX_SLEEP = 0.5
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0  # seconds spent held back
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = max(int(rate or 0), 0)
+            self.tokens = min(self.tokens, self.rate * self.BURST)
+
+    def consume(self, size):
+        """Account for size bytes, waiting until they fit in the limit."""
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.tokens + (now - self.last) * self.rate, self.rate * self.BURST)
+                self.last = now
+                if self.tokens >= 0:
+                    # take it, going into debt for blocks larger than the burst
+                    self.tokens -= size
+                    return
+                wait = min(-self.tokens / self.rate, self.MAX_SLEEP)
+            self.waited += wait
+            time.sleep(wait)
+
+
+class IoLimits:
+    """
+    The I/O limits of every job, changed at runtime with set().
+
+    `read_rate` and `write_rate` are in bytes per second, 0 for no limit. Disc reads never go
+    below MIN_READ_RATE, as drives spin down when fed too slowly. `io_priority` applies to job
+    threads and output writers, see set_io_priority(), and `nice` to hashing and compressing
+    sink workers, see set_nice(). Threads pick up priority changes the next time they call
+    apply(), and a RemoteDvdCss worker process before its next read, as it does the drive I/O.
+    Once a priority is set back to DEFAULT, they go back to how they were before.
+    """
+
+    MIN_READ_RATE = 1024 * 1024
+
+    def __init__(self):
+        self.read = Throttle()
+        self.write = Throttle()
+        self.io_priority = None
+        self.nice = None
+        self.generation = 0  # bumped on every priority change
+        self.local = threading.local()
+        self.control_file = None
+        self.control_mtime = None
+
+    def get(self):
+        return {
+            "read_rate": self.read.rate,
+            "write_rate": self.write.rate,
+            "io_priority": self.io_priority,
+            "nice": self.nice,
+        }
+
+    def set(self, read_rate=None, write_rate=None, io_priority=None, nice=None):
+        """
+        Change any of the limits, None leaves them as they are, and DEFAULT takes a priority off.
+        Raises ValueError on an invalid priority or nice level, before changing anything.
+        """
+        priorities = {}
+        if io_priority is not None:
+            if io_priority != DEFAULT:
+                parse_io_priority(io_priority)
+            priorities["io_priority"] = None if io_priority == DEFAULT else io_priority
+        if nice is not None:
+            if nice != DEFAULT:
+                nice = int(nice)
+                if not -20 <= nice <= 19:
+                    raise ValueError(f"Invalid nice level {nice}, expected -20 to 19")
+            priorities["nice"] = None if nice == DEFAULT else nice
+        if read_rate is not None:
+            self.read.set_rate(max(read_rate, self.MIN_READ_RATE) if read_rate else 0)
+        if write_rate is not None:
+            self.write.set_rate(write_rate)
+        for name, value in priorities.items():
+            if value != getattr(self, name):
+                setattr(self, name, value)
+                self.generation += 1
+        limits = ", ".join(f"{name} {value}" for name, value in self.get().items() if value not in (None, 0))
+        g.LOG.write(f"I/O limits: {limits or 'none'}")
+
+    def set_limits(self, js=None, limits=None):
+        """Change the limits from a dictionary like get()'s, e.g. from the UI. Returns the limits now."""
+        if limits:
+            self.set(**{key: value for key, value in limits.items() if key in self.get()})
+        if js:
+            js.Call(self.get())
+        return self.get()
+
+    def apply(self, cpu=False):
+        """
+        Apply the I/O priority, and with `cpu` the nice level, to the calling thread if they changed
+        since it last did. Cheap enough to call before every block.
+        """
+        local = self.local
+        if getattr(local, "generation", 0) == self.generation:
+            return
+        local.generation = self.generation
+        try:
+            # a thread only goes back to the default if it was changed before
+            if self.io_priority or getattr(local, "io_priority", None):
+                set_io_priority(self.io_priority or "none")
+                local.io_priority = self.io_priority
+            if cpu and self.nice is not None:
+                if getattr(local, "nice", None) is None and cfg.linux:
+                    local.nice = os.getpriority(os.PRIO_PROCESS, 0)
+                set_nice(self.nice)
+            elif cpu and getattr(local, "nice", None) is not None:
+                set_nice(local.nice)
+                local.nice = None
+        except (OSError, ValueError) as e:
+            g.LOG.write(f"Unable to change the priority of {threading.current_thread().name}: {e}")
+
+    def watch(self, path, interval=1.0):
+        """
+        Apply limits from a YAML control file with any of get()'s keys now, and whenever it's changed,
+        from a background thread. Rates are in MiB/s there, e.g. `read_rate: 4`.
+        """
+        self.control_file = path
+        self.poll_control_file()
+        threading.Thread(target=self._watch, args=(interval,), name="IoLimits", daemon=True).start()
+
+    def poll_control_file(self):
+        try:
+            mtime = os.path.getmtime(self.control_file)
+        except OSError:
+            return
+        if mtime == self.control_mtime:
+            return
+        self.control_mtime = mtime
+        try:
+            with open(self.control_file, "rt", encoding="utf-8") as f:
+                limits = yaml.safe_load(f) or {}
+            for key in ("read_rate", "write_rate"):
+                if limits.get(key) is not None:
+                    limits[key] = int(float(limits[key]) * 1024 * 1024)
+            self.set_limits(limits=limits)
+        except (OSError, ValueError, TypeError, AttributeError, yaml.YAMLError) as e:
+            g.LOG.write(f"Unable to apply the I/O limits of \"{self.control_file}\": {e}")
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            self.poll_control_file()
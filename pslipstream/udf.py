@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Minimal read-only UDF (ECMA-167) file system reader, covering UDF 1.02 as
+used by DVDs up to UDF 2.60 as used by Blu-rays, including the metadata
+partition. Only the few sectors needed are read: the anchor, the volume
+descriptors, the file set descriptor, and then the file entries and
+directories on demand. Files are described by their allocation extents, so
+files spanning multiple extents (e.g. over 1 GiB) get an exact LBA map.
+"""
+
+import struct
+
+SECTOR_SIZE = 2048
+ANCHOR_LBA = 256
+
+# descriptor tag identifiers
+TAG_PVD = 1
+TAG_ANCHOR = 2
+TAG_PARTITION = 5
+TAG_LVD = 6
+TAG_TERMINATOR = 8
+TAG_FSD = 256
+TAG_FID = 257
+TAG_AED = 258
+TAG_FE = 261
+TAG_EFE = 266
+
+# file characteristics of a file identifier descriptor
+FID_DIRECTORY = 0x02
+FID_DELETED = 0x04
+FID_PARENT = 0x08
+
+# allocation descriptor types, from the ICB tag flags
+AD_SHORT = 0
+AD_LONG = 1
+AD_EMBEDDED = 3
+
+# extent types, from the top two bits of an allocation descriptor's length
+EXTENT_RECORDED = 0
+EXTENT_CONTINUATION = 3
+
+
+class UdfError(Exception):
+    """The disc has no valid UDF file system, or a structure of it is corrupt."""
+
+
+def decode_dstring(data):
+    """Decode an OSTA compressed unicode string (d-characters)."""
+    if not data:
+        return ""
+    if data[0] == 8:
+        return data[1:].decode("latin-1")
+    if data[0] == 16:
+        return data[1:].decode("utf-16-be")
+    raise UdfError(f"Unsupported compression id {data[0]} of an OSTA compressed unicode string.")
+
+
+def decode_fixed_dstring(data):
+    """Decode a fixed length dstring, where the last byte is the length of the string."""
+    return decode_dstring(data[:data[-1]]).rstrip("\0 ")
+
+
+class UdfFile:
+    """A file or directory, with the (lba, size in bytes) of each extent of its data in order."""
+
+    def __init__(self, path, is_dir, size, extents, data=None, partition=None):
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.extents = extents
+        self.data = data  # the data itself, if it's embedded in the file entry
+        self.partition = partition
+        self.children = None  # name -> UdfFile, once read
+
+    @property
+    def lba(self):
+        return self.extents[0][0] if self.extents else None
+
+    @property
+    def sectors(self):
+        """Size in sectors, rounded up, as the last sector of a file is usually only partly used."""
+        return -(-self.size // SECTOR_SIZE)
+
+    def is_contiguous(self):
+        """Check if the extents directly follow each other on the disc."""
+        return all(
+            lba == prev_lba + -(-prev_size // SECTOR_SIZE)
+            for (prev_lba, prev_size), (lba, _) in zip(self.extents, self.extents[1:])
+        )
+
+    def __repr__(self):
+        return f"UdfFile({self.path!r}, size={self.size}, extents={self.extents})"
+
+
+class Udf:
+    """
+    A UDF file system on a disc, read through `read(lba, sectors)` which returns bytes.
+
+    The directory tree is read lazily and cached, so every directory is only
+    ever read once per instance.
+    """
+
+    def __init__(self, read):
+        self.read = read
+        self.partitions = {}  # partition number -> (start lba, length in sectors)
+        self.maps = []  # partition reference -> partition map
+        self.metadata = None  # extents of the metadata file, if there's a metadata partition
+        self.volume_id = None
+        self.total_sectors = 0
+        self.root = None
+        self._read_volume()
+
+    def _read_volume(self):
+        anchor = self.read(ANCHOR_LBA, 1)
+        if len(anchor) < SECTOR_SIZE or tag_id(anchor) != TAG_ANCHOR:
+            raise UdfError("No UDF Anchor Volume Descriptor Pointer found, the disc has no UDF file system.")
+        length, location = struct.unpack_from("<II", anchor, 16)
+        lvd = None
+        sectors = self.read(location, length // SECTOR_SIZE)
+        for i in range(0, len(sectors), SECTOR_SIZE):
+            descriptor = sectors[i:i + SECTOR_SIZE]
+            tag = tag_id(descriptor)
+            if tag == TAG_PVD and self.volume_id is None:
+                self.volume_id = decode_fixed_dstring(descriptor[24:56])
+            elif tag == TAG_PARTITION:
+                number = struct.unpack_from("<H", descriptor, 22)[0]
+                self.partitions[number] = struct.unpack_from("<II", descriptor, 188)
+            elif tag == TAG_LVD:
+                lvd = descriptor
+            elif tag == TAG_TERMINATOR:
+                break
+        if lvd is None or not self.partitions:
+            raise UdfError("The UDF Volume Descriptor Sequence has no Logical Volume or Partition Descriptor.")
+        self.total_sectors = max(start + length for start, length in self.partitions.values())
+        self._read_partition_maps(lvd)
+        fsd_lbn, fsd_partition = struct.unpack_from("<IH", lvd, 252)
+        fsd = self.read(self.to_lba(fsd_partition, fsd_lbn), 1)
+        if tag_id(fsd) != TAG_FSD:
+            raise UdfError("The UDF File Set Descriptor was not found where the Logical Volume said it is.")
+        root_lbn, root_partition = struct.unpack_from("<IH", fsd, 404)
+        self.root = self.read_file_entry("/", root_partition, root_lbn, is_dir=True)
+
+    def _read_partition_maps(self, lvd):
+        count = struct.unpack_from("<I", lvd, 268)[0]
+        offset = 440
+        for _ in range(count):
+            map_type, map_length = lvd[offset], lvd[offset + 1]
+            if map_type == 1:
+                self.maps.append(("physical", struct.unpack_from("<H", lvd, offset + 4)[0]))
+            elif map_type == 2:
+                ident = bytes(lvd[offset + 5:offset + 28]).rstrip(b"\0").decode("ascii", "replace")
+                partition = struct.unpack_from("<H", lvd, offset + 38)[0]
+                if ident == "*UDF Metadata Partition":
+                    self.maps.append(("metadata", partition))
+                    self.metadata = (len(self.maps) - 1, struct.unpack_from("<I", lvd, offset + 40)[0])
+                else:
+                    # virtual and sparable partitions are only found on (re)writable discs
+                    self.maps.append(("unsupported:" + ident, partition))
+            offset += map_length
+        if self.metadata:
+            reference, file_lbn = self.metadata
+            self.metadata = None
+            metadata_file = self.read_file_entry("<metadata>", reference, file_lbn, physical=True)
+            self.metadata = metadata_file.extents
+
+    def to_lba(self, reference, lbn, physical=False):
+        """Translate a logical block number within a partition reference to an LBA on the disc."""
+        if reference >= len(self.maps):
+            raise UdfError(f"Partition reference {reference} is not in the partition map.")
+        kind, partition = self.maps[reference]
+        if kind == "metadata" and not physical:
+            # the block is within the metadata file, find the extent it's in
+            offset = lbn * SECTOR_SIZE
+            for lba, size in self.metadata or []:
+                if offset < size:
+                    return lba + offset // SECTOR_SIZE
+                offset -= size
+            raise UdfError(f"Block {lbn} is beyond the end of the metadata partition.")
+        if kind.startswith("unsupported:"):
+            raise UdfError(f"Unsupported UDF partition type {kind.split(':', 1)[1]}.")
+        return self.partitions[partition][0] + lbn
+
+    def read_file_entry(self, path, reference, lbn, is_dir=False, physical=False):
+        """Read the (Extended) File Entry of a file and get its UdfFile."""
+        entry = self.read(self.to_lba(reference, lbn, physical), 1)
+        tag = tag_id(entry)
+        if tag == TAG_FE:
+            ea_length, ad_length = struct.unpack_from("<II", entry, 168)
+            ad_offset = 176 + ea_length
+        elif tag == TAG_EFE:
+            ea_length, ad_length = struct.unpack_from("<II", entry, 208)
+            ad_offset = 216 + ea_length
+        else:
+            raise UdfError(f"Expected a File Entry for {path}, got a descriptor with tag {tag}.")
+        size = struct.unpack_from("<Q", entry, 56)[0]
+        ad_type = struct.unpack_from("<H", entry, 34)[0] & 0x07
+        descriptors = entry[ad_offset:ad_offset + ad_length]
+        if ad_type == AD_EMBEDDED:
+            return UdfFile(path, is_dir, size, [], data=bytes(descriptors[:size]), partition=reference)
+        if ad_type not in (AD_SHORT, AD_LONG):
+            raise UdfError(f"Unsupported allocation descriptor type {ad_type} for {path}.")
+        if not is_dir and self.maps[reference][0] == "metadata":
+            # file data is never in the metadata partition, but in the physical partition it's on
+            physical = True
+        extents = self._read_allocation(descriptors, ad_type, reference, physical)
+        return UdfFile(path, is_dir, size, extents, partition=reference)
+
+    def _read_allocation(self, descriptors, ad_type, reference, physical):
+        extents = []
+        size = 8 if ad_type == AD_SHORT else 16
+        offset = 0
+        while offset + size <= len(descriptors):
+            length, lbn = struct.unpack_from("<II", descriptors, offset)
+            extent_reference = reference
+            if ad_type == AD_LONG:
+                extent_reference = struct.unpack_from("<H", descriptors, offset + 8)[0]
+            offset += size
+            extent_type, length = length >> 30, length & 0x3FFFFFFF
+            if length == 0:
+                break
+            # physical only applies to short ones, long ones say which partition they're in
+            lba = self.to_lba(extent_reference, lbn, physical and ad_type == AD_SHORT)
+            if extent_type == EXTENT_CONTINUATION:
+                # the rest of the descriptors are in an Allocation Extent Descriptor
+                aed = self.read(lba, 1)
+                if tag_id(aed) != TAG_AED:
+                    raise UdfError("Expected an Allocation Extent Descriptor to continue the allocation.")
+                continued = struct.unpack_from("<I", aed, 20)[0]
+                extents.extend(self._read_allocation(aed[24:24 + continued], ad_type, reference, physical))
+                break
+            if extent_type == EXTENT_RECORDED:
+                extents.append((lba, length))
+        return extents
+
+    def read_data(self, file):
+        """Read the whole data of a (small) file, e.g. a directory."""
+        if file.data is not None:
+            return file.data
+        data = b"".join(self.read(lba, -(-size // SECTOR_SIZE))[:size] for lba, size in file.extents)
+        return data[:file.size]
+
+    def list_dir(self, directory):
+        """Get the children of a directory UdfFile by name, reading them only the first time."""
+        if directory.children is not None:
+            return directory.children
+        children = {}
+        data = self.read_data(directory)
+        offset = 0
+        while offset + 38 <= len(data):
+            if tag_id(data[offset:]) != TAG_FID:
+                break
+            characteristics, name_length = data[offset + 18], data[offset + 19]
+            lbn, reference = struct.unpack_from("<IH", data, offset + 24)
+            impl_length = struct.unpack_from("<H", data, offset + 36)[0]
+            name_offset = offset + 38 + impl_length
+            offset += (38 + impl_length + name_length + 3) & ~3
+            if characteristics & (FID_DELETED | FID_PARENT):
+                continue
+            name = decode_dstring(data[name_offset:name_offset + name_length])
+            path = directory.path.rstrip("/") + "/" + name
+            children[name] = self.read_file_entry(path, reference, lbn, bool(characteristics & FID_DIRECTORY))
+        directory.children = children
+        return children
+
+    def get(self, path):
+        """
+        Get the UdfFile at an absolute path, matching names case-insensitively.
+        Returns None if it doesn't exist.
+        """
+        file = self.root
+        for name in [part for part in path.split("/") if part]:
+            if not file.is_dir:
+                return None
+            children = self.list_dir(file)
+            file = children.get(name) or next(
+                (child for child_name, child in children.items() if child_name.upper() == name.upper()), None
+            )
+            if file is None:
+                return None
+        return file
+
+    def list(self, path="/"):
+        """Get the UdfFiles in a directory, sorted by LBA. Returns an empty list if it doesn't exist."""
+        directory = self.get(path)
+        if not directory or not directory.is_dir:
+            return []
+        return sorted(self.list_dir(directory).values(), key=lambda f: (f.lba is None, f.lba or 0, f.path))
+
+
+def tag_id(descriptor):
+    """Get the tag identifier of a descriptor, or None if its tag checksum is wrong."""
+    if len(descriptor) < 16:
+        return None
+    if sum(descriptor[:4]) + sum(descriptor[5:16]) & 0xFF != descriptor[4]:
+        return None
+    return struct.unpack_from("<H", descriptor, 0)[0]
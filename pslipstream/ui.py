@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Offline UI. A build of the UI is bundled in `static/ui` and installed into a
+versioned cache in the user directory, from where it's served over local
+HTTP, so the app starts without any network. Newer builds published by the
+remote UI are optionally downloaded in the background, for the next start.
+
+A UI build is a directory with a `manifest.json` of its version and files:
+`{"version": "1.2.0", "files": {"index.html": "<sha256>", ...}}`.
+"""
+
+import builtins as g
+import hashlib
+import json
+import os
+import shutil
+import threading
+from http.server import SimpleHTTPRequestHandler
+from pkg_resources import parse_version
+
+import requests
+
+from pslipstream.server import ThreadingHTTPServer
+
+REMOTE_URL = "https://slipstream-ui.vercel.app"
+MANIFEST = "manifest.json"
+
+
+def read_manifest(directory):
+    """Read the manifest of a UI build directory, or None if it has none."""
+    try:
+        with open(os.path.join(directory, MANIFEST), "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(directory, version):
+    """Write the manifest of a UI build directory, with the hash of every file in it. Returns the manifest."""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+            if path != MANIFEST:
+                files[path] = hash_file(os.path.join(root, name))
+    manifest = {"version": version, "files": dict(sorted(files.items()))}
+    with open(os.path.join(directory, MANIFEST), "wt", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class UiCache:
+    """
+    Versioned cache of UI builds at `path`, one directory per version.
+
+    Builds are only ever added complete, under a temporary name that's renamed
+    once every file is in place, so a half-written build is never served. The
+    newest KEEP versions are kept.
+    """
+
+    KEEP = 2
+
+    def __init__(self, path, bundled=None, remote=REMOTE_URL):
+        self.path = path
+        self.bundled = bundled
+        self.remote = remote
+
+    def get_versions(self):
+        """Get the complete cached versions, newest first."""
+        if not os.path.isdir(self.path):
+            return []
+        versions = [
+            name for name in os.listdir(self.path)
+            if not name.endswith(".partial") and read_manifest(os.path.join(self.path, name))
+        ]
+        return sorted(versions, key=parse_version, reverse=True)
+
+    def get_latest(self):
+        """Get the directory of the newest cached build, or None if there's none."""
+        versions = self.get_versions()
+        return os.path.join(self.path, versions[0]) if versions else None
+
+    def install_bundled(self):
+        """Install the bundled build into the cache, if it isn't cached yet. Returns its version."""
+        manifest = read_manifest(self.bundled) if self.bundled else None
+        if not manifest:
+            return None
+        version = manifest["version"]
+        if version not in self.get_versions():
+            def copy(partial):
+                shutil.copytree(self.bundled, partial)
+            self._add(version, copy)
+            g.LOG.write(f"Installed the bundled UI v{version}")
+        return version
+
+    def check_update(self, timeout=5):
+        """
+        Download the remote build if it's newer than every cached one.
+        Returns the new version, or None if there was nothing newer (or no network).
+        """
+        try:
+            manifest = requests.get(f"{self.remote}/{MANIFEST}", timeout=timeout).json()
+            version = manifest["version"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            g.LOG.write(f"Unable to check for a UI update, using the cached UI: {e}", echo=g.DBG)
+            return None
+        versions = self.get_versions()
+        if versions and parse_version(version) <= parse_version(versions[0]):
+            return None
+
+        def download(partial):
+            session = requests.Session()
+            for name, digest in manifest["files"].items():
+                target = os.path.join(partial, *name.split("/"))
+                if not os.path.abspath(target).startswith(os.path.abspath(partial) + os.sep):
+                    raise ValueError(f"Unsafe file path in the UI manifest: {name}")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with session.get(f"{self.remote}/{name}", timeout=timeout, stream=True) as r:
+                    r.raise_for_status()
+                    with open(target, "wb") as f:
+                        for chunk in r.iter_content(1024 * 1024):
+                            f.write(chunk)
+                if hash_file(target) != digest:
+                    raise ValueError(f"The downloaded {name} doesn't match the UI manifest")
+            with open(os.path.join(partial, MANIFEST), "wt", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+        try:
+            self._add(version, download)
+        except (requests.RequestException, OSError, ValueError) as e:
+            g.LOG.write(f"Unable to download the UI update v{version}: {e}")
+            return None
+        g.LOG.write(f"Downloaded the UI update v{version}, it will be used from the next start")
+        return version
+
+    def _add(self, version, fill):
+        """Add a version to the cache, with `fill(directory)` writing its files, then prune old versions."""
+        os.makedirs(self.path, exist_ok=True)
+        partial = os.path.join(self.path, f"{version}.partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        try:
+            fill(partial)
+            os.replace(partial, os.path.join(self.path, version))
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        for old in self.get_versions()[self.KEEP:]:
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+
+
+class UiServer:
+    """
+    Serve a UI build directory on the local machine.
+
+    Every build lives in its own directory, so everything but the HTML is cached by
+    the browser for good, while HTML and page data are always revalidated.
+    """
+
+    def __init__(self, directory, host="127.0.0.1", port=0):
+        self.directory = directory
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="UiServer", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        root = self.directory
+
+        class Handler(SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                # relative to the build instead of the working directory
+                path = super().translate_path(path)
+                return os.path.join(root, os.path.relpath(path, os.getcwd()))
+
+            def end_headers(self):
+                if self.path.endswith((".html", ".json", "/")):
+                    self.send_header("Cache-Control", "no-cache")
+                else:
+                    self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+                super().end_headers()
+
+            def log_message(self, *_):
+                pass  # keep the log for the user
+
+        return Handler
+
+
+def get_ui_url(cache_path, bundled, check_update=True):
+    """
+    Get the URL to load the UI from, serving the newest cached build (installing the
+    bundled one first if needed) locally. Falls back to the remote UI if no build is
+    available at all. With `check_update`, a newer remote build is downloaded in the
+    background for the next start.
+    """
+    cache = UiCache(cache_path, bundled)
+    try:
+        cache.install_bundled()
+    except OSError as e:
+        g.LOG.write(f"Unable to install the bundled UI: {e}")
+    if check_update:
+        threading.Thread(target=cache.check_update, name="UiUpdate", daemon=True).start()
+    directory = cache.get_latest()
+    if not directory:
+        g.LOG.write(f"No local UI available, loading the remote UI from {REMOTE_URL}")
+        return REMOTE_URL
+    url = UiServer(directory).start()
+    g.LOG.write(f"Serving the UI v{read_manifest(directory)['version']} at {url}")
+    return url
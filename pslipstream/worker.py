@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Slipstream - The most informative Home-media backup solution.
+Copyright (C) 2020 PHOENiX
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+~~~
+
+Out-of-process libdvdcss. Every disc gets a worker process of its own doing
+all of its native drive I/O, so a crash in a drive read only takes down the
+worker, and several drives read and decrypt on separate cores. Sector data
+comes back through shared memory, the pipe only carries the calls. On
+sequential reads, the worker reads the next block ahead while the last one
+is being processed, so the drive and the caller keep busy side by side.
+"""
+
+import builtins as g
+import ctypes
+import multiprocessing
+
+from pydvdcss.dvdcss import DvdCss
+
+from pslipstream.exceptions import SlipstreamReadError
+from pslipstream.helpers import get_dvdcss_read
+from pslipstream.throttle import set_io_priority
+
+# workers are spawned rather than forked, forking the threads of the GUI process isn't safe
+CONTEXT = multiprocessing.get_context("spawn")
+
+
+def serve(conn, ring):
+    """
+    Main loop of a worker process, calling a DvdCss instance on behalf of a RemoteDvdCss.
+
+    Messages are `(name, *args)` tuples, answered with `("ok", result)` or `("error", exception)`.
+    `("read", offset, sectors, flags)` reads into the ring at `offset` and answers the amount of
+    sectors read, straight from libdvdcss where possible. `("ioprio", priority)` sets the I/O
+    priority of the worker, see set_io_priority(), answering why if it was refused, or None.
+    """
+    dvdcss = DvdCss()
+    native_read = None
+    view = memoryview(ring).cast("B")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break  # the parent is gone
+        name, args = message[0], message[1:]
+        try:
+            if name == "open":
+                dvdcss.open(*args)
+                native_read = get_dvdcss_read(dvdcss)
+                result = None
+            elif name == "read":
+                offset, sectors, flags = args
+                size = sectors * dvdcss.SECTOR_SIZE
+                if native_read:
+                    target = (ctypes.c_char * size).from_buffer(ring, offset)
+                    result = native_read(dvdcss.handle, target, sectors, flags)
+                else:
+                    result = dvdcss.read(sectors, flags)
+                    if result > 0:
+                        view[offset:offset + result * dvdcss.SECTOR_SIZE] = \
+                            memoryview(dvdcss.buffer)[:result * dvdcss.SECTOR_SIZE]
+            elif name == "ioprio":
+                try:
+                    set_io_priority(*args)
+                    result = None
+                except (OSError, ValueError) as e:
+                    result = str(e)  # not an error of the call, those are taken for a dead worker
+            elif name in ("seek", "is_scrambled", "dispose"):
+                result = getattr(dvdcss, name)(*args)
+            else:
+                raise ValueError(f"Unsupported call {name}")
+        except Exception as e:
+            conn.send(("error", e))
+            continue
+        conn.send(("ok", result))
+        if name == "dispose":
+            break
+
+
+class RemoteDvdCss:
+    """
+    Stand-in for pydvdcss's DvdCss, calling it in a worker process.
+
+    Reads land in one of the two halves of a shared-memory ring of RING_SIZE bytes,
+    from where they are copied into the caller's buffer. Once reads are sequential,
+    every read that came back in full has the worker read the same amount of sectors
+    after it into the other half right away, which the next read takes if it asks for
+    exactly that, or drops. Reads ahead never go past `end`, and only start once it's
+    set to the size of the disc.
+
+    If the worker dies, e.g. from a native crash in a drive read, it's restarted, the
+    disc reopened, the title keys cracked so far cracked again, the one in use last,
+    and the position restored, and the failed call is retried once. Only a second
+    failure in a row is raised, as SlipstreamReadError.
+    """
+
+    SECTOR_SIZE = DvdCss.SECTOR_SIZE
+    BLOCK_BUFFER = DvdCss.BLOCK_BUFFER
+    NOFLAGS = DvdCss.NOFLAGS
+    READ_DECRYPT = DvdCss.READ_DECRYPT
+    SEEK_MPEG = DvdCss.SEEK_MPEG
+    SEEK_KEY = DvdCss.SEEK_KEY
+
+    RING_SIZE = 8 * 1024 * 1024
+
+    def __init__(self):
+        self.dev = None
+        self.process = None
+        self.conn = None
+        self.ring = None
+        self.view = None
+        self.slot = 0  # half of the ring the next read goes to
+        self.buffer = None
+        self.position = 0
+        self.worker_position = 0  # where the worker's libdvdcss is, None if unknown
+        self.seek_flags = self.NOFLAGS
+        self.streak = 0  # reads since the last seek
+        self.pending = None  # (position, sectors, flags, offset) of the read ahead in flight
+        self.end = None  # sectors of the disc
+        self.keys = []  # LBAs of the title keys cracked, to crack again after a restart
+        self.key = None  # LBA of the title key loaded last, which libdvdcss decrypts with
+        self.restarts = 0
+        self.limits_generation = None  # of the I/O limits the worker last took its priority from
+        self.io_priority = None  # the worker took on, None if it's the default
+
+    def start(self):
+        self.ring = CONTEXT.RawArray(ctypes.c_char, self.RING_SIZE)
+        self.view = memoryview(self.ring).cast("B")
+        self.conn, child = CONTEXT.Pipe()
+        self.process = CONTEXT.Process(
+            target=serve, args=(child, self.ring), name=f"DvdCss({self.dev})", daemon=True
+        )
+        self.process.start()
+        child.close()  # so a dead worker is noticed as EOF
+
+    def stop(self):
+        if self.conn:
+            self.conn.close()
+        if self.process:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = self.conn = self.pending = None
+
+    def restart(self):
+        self.restarts += 1
+        g.LOG.write(
+            f"The libdvdcss worker of {self.dev} died (exit code {self.process.exitcode}), restarting it "
+            f"(restart #{self.restarts})..."
+        )
+        self.stop()
+        self.start()
+        self.send("open", self.dev)
+        # the key loaded last goes last again, as reads decrypt with it
+        for lba in sorted(self.keys, key=lambda lba: lba == self.key):
+            self.send("seek", lba, self.SEEK_KEY)
+        self.send("seek", self.position, self.get_resume_flags())
+        self.worker_position = self.position
+        self.limits_generation = self.io_priority = None
+
+    def get_resume_flags(self):
+        """Get the flags to seek back to the position with, keeping the key state of the last seek."""
+        return self.SEEK_MPEG if self.seek_flags != self.NOFLAGS else self.NOFLAGS
+
+    def send(self, *message):
+        """Make a call in the worker and wait for its result."""
+        self.conn.send(message)
+        return self.receive()
+
+    def receive(self):
+        status, result = self.conn.recv()
+        if status == "error":
+            raise result
+        return result
+
+    def call(self, *message, sent=False):
+        """
+        Make a call in the worker, or with `sent` wait for the result of one already made,
+        restarting it and retrying once if it died. Any read ahead in flight is dropped first.
+        """
+        try:
+            if sent:
+                return self.receive()
+            self.drop_read_ahead()
+            return self.send(*message)
+        except (EOFError, OSError):
+            try:
+                self.restart()
+                return self.send(*message)
+            except (EOFError, OSError) as e:
+                raise SlipstreamReadError(f"The libdvdcss worker of {self.dev} keeps dying, giving up: {e!r}")
+
+    def open(self, dev):
+        self.dev = dev
+        self.start()
+        self.call("open", dev)
+
+    def dispose(self):
+        if self.process and self.process.is_alive():
+            try:
+                self.drop_read_ahead()
+                self.send("dispose")
+            except (EOFError, OSError):
+                pass  # died on the way out, nothing left to clean up
+        self.stop()
+
+    def is_scrambled(self):
+        return self.call("is_scrambled")
+
+    def seek(self, lba, flags=NOFLAGS):
+        position = self.call("seek", lba, flags)
+        if flags == self.SEEK_KEY and position == lba:
+            self.key = lba
+            if lba not in self.keys:
+                self.keys.append(lba)
+        self.position = self.worker_position = position
+        self.seek_flags = flags
+        self.streak = 0
+        return position
+
+    def apply_limits(self):
+        """Have the worker take on the I/O priority of the I/O limits if it changed, see IoLimits."""
+        if self.limits_generation == g.LIMITS.generation:
+            return
+        self.limits_generation = g.LIMITS.generation
+        # a fresh worker has the default, it's only set back to it if it was changed
+        if g.LIMITS.io_priority != self.io_priority:
+            error = self.call("ioprio", g.LIMITS.io_priority or "none")
+            if error:
+                g.LOG.write(f"Unable to change the priority of the libdvdcss worker of {self.dev}: {error}")
+            self.io_priority = g.LIMITS.io_priority
+
+    def next_slot(self):
+        offset = self.slot * (self.RING_SIZE // 2)
+        self.slot ^= 1
+        return offset
+
+    def read_ahead(self, sectors, flags):
+        """Have the worker read the sectors after the last read into the other half of the ring, if sequential."""
+        if self.streak < 2 or self.end is None or self.position + sectors > self.end:
+            return
+        offset = self.next_slot()
+        try:
+            self.conn.send(("read", offset, sectors, flags))
+        except OSError:
+            return  # it died, restarted on the next call
+        self.pending = (self.position, sectors, flags, offset)
+
+    def drop_read_ahead(self):
+        """Wait for the read ahead in flight, if any, and drop it."""
+        if not self.pending:
+            return
+        position = self.pending[0]
+        self.pending = None
+        try:
+            ret = self.receive()
+        except (EOFError, OSError):
+            return  # it died, restarted on the next call
+        except Exception:
+            ret = -1
+        self.worker_position = position + ret if ret >= 0 else None
+
+    def readinto(self, buffer, sectors, flags=NOFLAGS):
+        """
+        Read sectors into a writable buffer, in parts of at most half of RING_SIZE bytes.
+        Returns the amount of sectors read, which is short or negative on errors like DvdCss.read().
+        """
+        self.apply_limits()
+        view = memoryview(buffer)
+        done = 0
+        while done < sectors:
+            count = min(sectors - done, self.RING_SIZE // 2 // self.SECTOR_SIZE)
+            if self.pending and self.pending[:3] == (self.position, count, flags):
+                offset = self.pending[3]
+                self.pending = None
+                ret = self.call("read", offset, count, flags, sent=True)
+            else:
+                self.drop_read_ahead()
+                if self.worker_position != self.position:
+                    # a dropped read ahead moved it on
+                    self.call("seek", self.position, self.get_resume_flags())
+                    self.worker_position = self.position
+                offset = self.next_slot()
+                ret = self.call("read", offset, count, flags)
+            if ret < 0:
+                self.worker_position = None
+                return ret if not done else done
+            self.position += ret
+            self.worker_position = self.position
+            self.streak += 1
+            if ret == count:
+                self.read_ahead(count, flags)
+            view[done * self.SECTOR_SIZE:(done + ret) * self.SECTOR_SIZE] = \
+                self.view[offset:offset + ret * self.SECTOR_SIZE]
+            done += ret
+            if ret < count:
+                break
+        return done
+
+    def read(self, sectors, flags=NOFLAGS):
+        buffer = bytearray(sectors * self.SECTOR_SIZE)
+        ret = self.readinto(buffer, sectors, flags)
+        self.buffer = bytes(buffer[:max(ret, 0) * self.SECTOR_SIZE])
+        return ret
@@ -16,6 +16,7 @@ from setuptools import find_packages, setup
 import pslipstream.cfg as cfg
 from setup_commands.dist import DistCommand
 from setup_commands.pack import PackCommand
+from setup_commands.ui import UiCommand
 
 # Import the README and use it as the long-description.
 try:
@@ -47,7 +48,12 @@ setup(
     extras_require=cfg.opt_packages,
     include_package_data=True,
     package_data={
-        "": ["LICENSE", "README.md", "HISTORY.md", "static/*"]
+        "": ["LICENSE", "README.md", "HISTORY.md", "static/*"] + [
+            # the bundled ui build, every file of it at any depth, see `setup.py ui`
+            os.path.relpath(os.path.join(root, file), cfg.title_pkg)
+            for root, _, files in os.walk(os.path.join(cfg.title_pkg, "static", "ui"))
+            for file in files
+        ]
     },
     license=cfg.licence,
     classifiers=[
@@ -70,5 +76,5 @@ setup(
         "Topic :: Multimedia :: Video :: Conversion",
     ],
     # $ setup.py publish support.
-    cmdclass={"dist": DistCommand, "pack": PackCommand},
+    cmdclass={"dist": DistCommand, "pack": PackCommand, "ui": UiCommand},
 )
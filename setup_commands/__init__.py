@@ -22,9 +22,17 @@ def build_clean():
         pass
 
 
+def bundle_ui():
+    print_bold("Bundling the UI…")
+    if os.system("{0} setup.py ui".format(sys.executable)) != 0:
+        print("Oh no! The UI couldn't be bundled, the build would need the network to show it.")
+        sys.exit(1)
+
+
 def build():
     build_clean()
     print_bold("Ensuring an up-to-date environment…")
     os.system("{0} -m pip install --user --upgrade setuptools wheel".format(sys.executable))
+    bundle_ui()
     print_bold("Building Source and Wheel (universal) distribution…")
     os.system("{0} setup.py sdist bdist_wheel --universal".format(sys.executable))
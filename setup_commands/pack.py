@@ -5,7 +5,7 @@ import sys
 from setuptools import Command
 
 import pslipstream.cfg as cfg
-from setup_commands import build_clean, print_bold
+from setup_commands import build_clean, bundle_ui, print_bold
 
 
 class PackCommand(Command):
@@ -32,6 +32,7 @@ class PackCommand(Command):
         os.system(
             "{0} -m pip install --user --upgrade pyinstaller".format(sys.executable)
         )
+        bundle_ui()
         print_bold("Packing with PyInstaller…")
         sep = ";" if cfg.windows else ":"
         sub = subprocess.Popen(
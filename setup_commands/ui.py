@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import shutil
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+
+from setuptools import Command
+
+import pslipstream.cfg as cfg
+from setup_commands import print_bold
+
+UI_DIR = os.path.join(cfg.root_dir, "static", "ui")
+# references to other files of the site, in HTML attributes, CSS urls, and quoted paths in JS and JSON
+REFERENCE = re.compile(
+    r"""(?:src|href)=["']([^"'#?]+)|url\(["']?([^"')#?]+)|"""
+    r"""["'](/[\w@./-]+\.(?:js|css|json|woff2?|ttf|otf|png|jpe?g|gif|svg|ico|webp|webmanifest|txt))["']"""
+)
+TEXT = (".html", ".css", ".js", ".json", ".webmanifest")
+# gatsby loads these by paths it puts together at runtime, which never show up as references
+GATSBY_FILES = ["chunk-map.json", "page-data/app-data.json", "page-data/index/page-data.json"]
+
+
+class UiCommand(Command):
+    """Support setup.py ui."""
+
+    description = "Bundle a build of the UI into static/ui, from a local build or by mirroring the deployed UI."
+    user_options = [
+        ("source=", "s", "directory of a UI build to bundle, e.g. `public` after `gatsby build`"),
+        ("url=", "u", "URL of the deployed UI to mirror, used without a source"),
+        ("ui-version=", None, "version of the UI build, by default from the build's manifest.json or package.json, "
+                              "or the deployed UI's manifest.json"),
+    ]
+
+    def initialize_options(self):
+        self.source = None
+        self.url = None
+        self.ui_version = None
+
+    def finalize_options(self):
+        if not self.url:
+            self.url = "https://slipstream-ui.vercel.app"
+
+    def run(self):
+        from pslipstream.ui import write_manifest
+        partial = f"{UI_DIR}.partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        try:
+            version = self.get_ui_version()
+            if self.source:
+                print_bold(f"Bundling the UI v{version} build in {self.source}…")
+                shutil.copytree(self.source, partial)
+            else:
+                print_bold(f"Mirroring the UI v{version} from {self.url}…")
+                mirror(self.url, partial)
+            manifest = write_manifest(partial, version)
+            if "index.html" not in manifest["files"]:
+                raise ValueError("The UI build has no index.html")
+        except (OSError, ValueError) as e:
+            shutil.rmtree(partial, ignore_errors=True)
+            print(f"Oh no! Bundling the UI failed: {e}")
+            sys.exit(1)
+        shutil.rmtree(UI_DIR, ignore_errors=True)
+        os.replace(partial, UI_DIR)
+        print(f"Bundled the UI v{manifest['version']}, {len(manifest['files'])} files, in {UI_DIR}")
+
+
+    def get_ui_version(self):
+        """
+        Get the version of the UI build. It's compared to the versions of the remote UI's updates,
+        so it's never guessed, e.g. from the app's version. Raises ValueError if it's unknown.
+        """
+        if self.ui_version:
+            return self.ui_version
+        if self.source:
+            # a build with a manifest already, or a `gatsby build` in the `public` folder of its project
+            candidates = [os.path.join(self.source, "manifest.json"), os.path.join(self.source, "..", "package.json")]
+            for path in candidates:
+                try:
+                    with open(path, "rt", encoding="utf-8") as f:
+                        version = json.load(f).get("version")
+                except (OSError, ValueError, AttributeError):
+                    continue
+                if version:
+                    return version
+            raise ValueError(f"The UI version isn't in {' or '.join(candidates)}, pass it with --ui-version")
+        try:
+            with urllib.request.urlopen(f"{self.url.rstrip('/')}/manifest.json", timeout=30) as r:
+                version = json.loads(r.read().decode("utf-8")).get("version")
+        except (urllib.error.URLError, ValueError, AttributeError) as e:
+            raise ValueError(
+                f"Unable to get the UI version from {self.url}/manifest.json ({e}), pass it with --ui-version"
+            )
+        if not version:
+            raise ValueError(f"{self.url}/manifest.json has no version, pass it with --ui-version")
+        return version
+
+
+def mirror(url, target):
+    """
+    Download a static site into target, following every same-site reference from its index,
+    along with gatsby's page data and chunk map. Only the index has to exist.
+    """
+    root = url.rstrip("/") + "/"
+    queue = deque([("index.html", True)] + [(path, False) for path in GATSBY_FILES])
+    seen = {path for path, _ in queue}
+    while queue:
+        path, required = queue.popleft()
+        try:
+            with urllib.request.urlopen(urllib.parse.urljoin(root, path), timeout=30) as r:
+                data = r.read()
+        except urllib.error.HTTPError as e:
+            if required:
+                raise OSError(f"Unable to download {path}: {e}")
+            print(f"Skipping {path}: {e}")
+            continue
+        except urllib.error.URLError as e:
+            raise OSError(f"Unable to download {path}: {e.reason}")
+        file = os.path.join(target, *path.split("/"))
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, "wb") as f:
+            f.write(data)
+        if not path.endswith(TEXT):
+            continue
+        text = data.decode("utf-8", "replace")
+        references = [next(filter(None, m.groups())) for m in REFERENCE.finditer(text)]
+        if path.endswith("page-data.json"):
+            for query in json.loads(text).get("staticQueryHashes", []):
+                references.append(f"/page-data/sq/d/{query}.json")
+        for reference in references:
+            absolute = urllib.parse.urljoin(urllib.parse.urljoin(root, path), reference)
+            if not absolute.startswith(root):
+                continue  # another site
+            found = urllib.parse.unquote(absolute[len(root):])
+            if not found or found.endswith("/"):
+                found += "index.html"
+            if ".." in found.split("/") or found in seen:
+                continue
+            seen.add(found)
+            # pages link to more pages, each with its own page data
+            if found.endswith("/index.html"):
+                queue.append((f"page-data/{found[:-len('/index.html')]}/page-data.json", False))
+                seen.add(queue[-1][0])
+            queue.append((found, False))